@@ -1,84 +1,2718 @@
 # this is my first actually useful program. my gratitude to nick winn, pyslackers chat room (EdKeyes and dd82),
 # /r/learnpython, learnprogramming.academy, real python, and others for helping me get this far!
 
+import asyncio
 import requests
+from abc import ABC, abstractmethod
+from requests.adapters import HTTPAdapter
+import threading
 import time
 import hmac
 import hashlib
+import json
+import os
+import queue
+import re
+import struct
 import decimal
+import heapq
+import inspect
+import math
+import mmap
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from functools import lru_cache, partial, wraps
+from itertools import accumulate
 from typing import Tuple
 
 decimal.getcontext().prec = 100
 decimal_zero = Decimal()
 
 
+# lot sizes get passed around as strings, so this saves parsing the same few over and over
+@lru_cache(maxsize=256)
+def _get_decimal(number: str) -> Decimal:
+    return Decimal(number)
+
+
 # buy/bid and sell/ask always refers to the quote asset (the first asset) (ex: ARDRETH : buy ARDR or sell ARDR)
 # the second asset is the 'base' asset (ex: ETH is base asset in ARDRETH)
 
 
-class Exchange(object):
+class Metrics(object):
+
+    # Metrics collects where the time goes while it's enabled: timing spans for the methods marked with @_traced,
+    # nested by which call made which, plus every HTTP request by endpoint (count, latency histogram and the
+    # request weight charged) and cache hits and misses. while it's disabled, the only cost is the check of
+    # .enabled at the start of each traced method and request
+    # one Metrics can be shared by several exchanges (everything uses METRICS below unless given another),
+    # and spans are nested per thread, so calls from AsyncBinance's pool show up as separate roots
+    #   metrics.enable()
+    #   binance.execute_tax_trade('XMR', Decimal('50'))
+    #   print(metrics.report())
+
+    # upper bounds of the latency histogram buckets in milliseconds, anything slower goes in one last bucket
+    LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._spans = {}  # path of span names from the root: [calls, seconds]
+            self._requests = {}  # 'METHOD endpoint': [requests, errors, weight, seconds, max seconds, buckets]
+            self._caches = {}  # cache name: [hits, misses]
+
+    # span() returns a context manager timing everything inside it as a child of whatever span it's in
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    # record_request() is called by HTTPTransport for every attempt it sends, status_code is None for one
+    # that never got a response. requests also show up as spans inside the span that made them
+    def record_request(self, method: str, endpoint: str, seconds: float, weight: int, status_code: int or None):
+        name = method + ' ' + endpoint
+        path = self._get_stack() + ('HTTP ' + name,)
+        bucket = bisect_left(self.LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            self._add_span(path, seconds)
+            stats = self._requests.get(name)
+            if stats is None:
+                stats = self._requests[name] = [0, 0, 0, 0.0, 0.0, [0] * (len(self.LATENCY_BUCKETS_MS) + 1)]
+            stats[0] += 1
+            if status_code is None or status_code >= 400:
+                stats[1] += 1
+            stats[2] += weight
+            stats[3] += seconds
+            stats[4] = max(stats[4], seconds)
+            stats[5][bucket] += 1
+
+    # cache is the name of what was looked up, like 'exchange_info', hit is whether it was answered without a request
+    def record_cache(self, cache: str, hit: bool):
+        with self._lock:
+            counts = self._caches.get(cache)
+            if counts is None:
+                counts = self._caches[cache] = [0, 0]
+            counts[0 if hit else 1] += 1
+
+    # snapshot() returns everything recorded so far as plain dicts:
+    #   'spans': {name: {'calls', 'seconds', 'self_seconds', 'children': {name: {...}}}}
+    #   'http': {'METHOD endpoint': {'requests', 'errors', 'weight', 'seconds', 'max_seconds',
+    #            'histogram': [(bucket upper bound in ms or None for the last one, count), ...]}}
+    #   'cache': {name: {'hits', 'misses'}}
+    def snapshot(self) -> dict:
+        with self._lock:
+            spans, requests_, caches = dict(self._spans), dict(self._requests), dict(self._caches)
+        span_tree = {}
+        for path in sorted(spans):
+            level = span_tree
+            for name in path[:-1]:
+                level = level.setdefault(name, {'calls': 0, 'seconds': 0.0, 'children': {}})['children']
+            calls, seconds = spans[path]
+            node = level.setdefault(path[-1], {'children': {}})
+            node['calls'], node['seconds'] = calls, seconds
+        self._add_self_seconds(span_tree)
+        bounds = self.LATENCY_BUCKETS_MS + (None,)
+        http = {name: {'requests': stats[0], 'errors': stats[1], 'weight': stats[2], 'seconds': stats[3],
+                       'max_seconds': stats[4], 'histogram': list(zip(bounds, stats[5]))}
+                for name, stats in requests_.items()}
+        cache = {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in caches.items()}
+        return {'spans': span_tree, 'http': http, 'cache': cache}
+
+    # report() formats snapshot() as text: the span tree, then the requests per endpoint, then the caches
+    def report(self) -> str:
+        snapshot = self.snapshot()
+        lines = ['{:<56} {:>7} {:>11} {:>11}'.format('span', 'calls', 'total ms', 'self ms')]
+        self._add_span_lines(lines, snapshot['spans'], 0)
+        lines.append('')
+        lines.append('{:<40} {:>8} {:>7} {:>7} {:>10} {:>10} {:>10}'.format(
+            'request', 'requests', 'errors', 'weight', 'mean ms', 'p95 ms', 'max ms'))
+        for name, stats in sorted(snapshot['http'].items()):
+            lines.append('{:<40} {:>8} {:>7} {:>7} {:>10.3f} {:>10} {:>10.3f}'.format(
+                name, stats['requests'], stats['errors'], stats['weight'], stats['seconds'] * 1000 / stats['requests'],
+                self._get_percentile_bound(stats['histogram'], Decimal('0.95')), stats['max_seconds'] * 1000))
+        lines.append('')
+        lines.append('{:<40} {:>8} {:>7}'.format('cache', 'hits', 'misses'))
+        for name, counts in sorted(snapshot['cache'].items()):
+            lines.append('{:<40} {:>8} {:>7}'.format(name, counts['hits'], counts['misses']))
+        return '\n'.join(lines)
+
+    def _get_stack(self) -> tuple:
+        return getattr(self._local, 'stack', ())
+
+    def _set_stack(self, stack: tuple):
+        self._local.stack = stack
+
+    def _add_span(self, path: tuple, seconds: float):
+        totals = self._spans.get(path)
+        if totals is None:
+            totals = self._spans[path] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+
+    @classmethod
+    def _add_self_seconds(cls, span_tree: dict):
+        for node in span_tree.values():
+            cls._add_self_seconds(node['children'])
+            node['self_seconds'] = node['seconds'] - sum(child['seconds'] for child in node['children'].values())
+
+    @classmethod
+    def _add_span_lines(cls, lines: list, span_tree: dict, depth: int):
+        for name, node in sorted(span_tree.items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<56} {:>7} {:>11.3f} {:>11.3f}'.format(
+                '  ' * depth + name, node['calls'], node['seconds'] * 1000, node['self_seconds'] * 1000))
+            cls._add_span_lines(lines, node['children'], depth + 1)
+
+    # the upper bound of the histogram bucket the percentile falls in, as text since the last one has none
+    @staticmethod
+    def _get_percentile_bound(histogram: list, percentile: Decimal) -> str:
+        total = sum(count for _, count in histogram)
+        seen = 0
+        for bound, count in histogram:
+            seen += count
+            if seen >= total * percentile:
+                return '<=' + str(bound) if bound is not None else '>' + str(histogram[-2][0])
+        return '-'
+
+
+class _Span(object):
+
+    __slots__ = ('metrics', 'name', 'parent', 'start')
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.parent = self.metrics._get_stack()
+        self.metrics._set_stack(self.parent + (self.name,))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        path = self.metrics._get_stack()
+        self.metrics._set_stack(self.parent)
+        with self.metrics._lock:
+            self.metrics._add_span(path, seconds)
+        return False
+
+
+class _NullSpan(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# what every exchange and its parts record to unless they're given their own Metrics
+METRICS = Metrics()
+
+
+# @_traced times a method as a span named after it, using the Metrics in the instance's .metrics
+# generators are timed until they're used up, so get_balances() counts the time spent reading its balances
+def _traced(method):
+    name = method.__qualname__
+    if inspect.isgeneratorfunction(method):
+        @wraps(method)
+        def generator_wrapper(self, *args, **kwargs):
+            if not self.metrics.enabled:
+                return (yield from method(self, *args, **kwargs))
+            with self.metrics.span(name):
+                return (yield from method(self, *args, **kwargs))
+        return generator_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.metrics.enabled:
+            return method(self, *args, **kwargs)
+        with self.metrics.span(name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class HTTPTransport(object):
+
+    # HTTPTransport is what every exchange sends its requests through. it keeps connections alive in a pool,
+    # retries failed requests a few times with exponential backoff, and keeps a client side budget of the
+    # request weight the exchange lets us use each minute, waiting before a request would go over it
+    # base_url can point at a local mock server, and session can be swapped for anything that acts like
+    # a requests.Session, which is how tests and benchmarks avoid the live API
+    # every request sent is recorded in metrics while it's enabled
+
+    RETRY_STATUS_CODES = (418, 429, 500, 502, 503, 504)
+    # these mean the exchange refused the request without acting on it, so they're the only ones
+    # safe to retry for requests that aren't idempotent, like placing an order
+    REJECTED_STATUS_CODES = (418, 429)
+
+    def __init__(self, base_url: str, timeout: float or tuple = (3.05, 10), max_retries: int = 3,
+                 backoff: float = 0.5, weight_limit: int = 1200, weight_headroom: float = 0.9,
+                 weight_header: str = 'X-MBX-USED-WEIGHT-1M', endpoint_weights: dict = None,
+                 pool_size: int = 10, session: requests.Session = None, metrics: Metrics = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.weight_limit = weight_limit
+        self.weight_headroom = weight_headroom
+        self.weight_header = weight_header
+        self.endpoint_weights = endpoint_weights or {}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.used_weight = 0
+        self._weight_window = self._current_window()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.metrics = metrics if metrics is not None else METRICS
+
+    def get(self, path: str, params: dict = None, headers: dict = None, weight: int = None) -> requests.Response:
+        return self.request('GET', path, params=params, headers=headers, weight=weight)
+
+    def post(self, path: str, params: dict = None, headers: dict = None, weight: int = None) -> requests.Response:
+        return self.request('POST', path, params=params, headers=headers, weight=weight)
+
+    def delete(self, path: str, params: dict = None, headers: dict = None, weight: int = None) -> requests.Response:
+        return self.request('DELETE', path, params=params, headers=headers, weight=weight)
+
+    # request() returns the last response it got, so callers keep checking status_code like before
+    # connection errors are retried for GETs, and raised once the retries run out
+    def request(self, method: str, path: str, params: dict = None, headers: dict = None,
+                weight: int = None) -> requests.Response:
+        if weight is None:
+            weight = self.endpoint_weights.get(path.split('?')[0], 1)
+        idempotent = method == 'GET'
+        attempt = 0
+        while True:
+            self._wait_for_weight(weight)
+            start = time.perf_counter() if self.metrics.enabled else None
+            try:
+                response = self.session.request(method, self.base_url + path, params=params, headers=headers,
+                                                timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if start is not None:
+                    self.metrics.record_request(method, path.split('?')[0], time.perf_counter() - start, weight, None)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            if start is not None:
+                self.metrics.record_request(method, path.split('?')[0], time.perf_counter() - start, weight,
+                                            response.status_code)
+            self._record_weight(response, weight)
+            retryable = self.RETRY_STATUS_CODES if idempotent else self.REJECTED_STATUS_CODES
+            if response.status_code not in retryable or attempt >= self.max_retries:
+                return response
+            time.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+    @staticmethod
+    def _current_window() -> int:
+        return int(time.time() // 60)
+
+    # blocks until sending a request of the given weight would stay under weight_limit * weight_headroom
+    def _wait_for_weight(self, weight: int):
+        while True:
+            with self._lock:
+                now = time.time()
+                if self._current_window() != self._weight_window:
+                    self._weight_window = self._current_window()
+                    self.used_weight = 0
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self.used_weight + weight <= self.weight_limit * self.weight_headroom or self.used_weight == 0:
+                    self.used_weight += weight
+                    return
+                else:
+                    delay = 60 - now % 60  # wait out the rest of the minute
+            time.sleep(delay)
+
+    # get_remaining_weight() is how much more weight can be used this minute before requests start waiting
+    def get_remaining_weight(self) -> float:
+        with self._lock:
+            if time.time() < self._blocked_until:
+                return 0
+            used_weight = self.used_weight if self._current_window() == self._weight_window else 0
+            return max(self.weight_limit * self.weight_headroom - used_weight, 0)
+
+    # the exchange's count of our used weight is the one that matters, so it replaces our own estimate
+    def _record_weight(self, response: requests.Response, weight: int):
+        used_weight = response.headers.get(self.weight_header)
+        with self._lock:
+            if used_weight is not None:
+                self.used_weight = max(self.used_weight, int(used_weight))
+            if response.status_code in self.REJECTED_STATUS_CODES:
+                retry_after = response.headers.get('Retry-After')
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, time.time() + int(retry_after))
+                else:
+                    self.used_weight = max(self.used_weight, self.weight_limit)
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+
+class Exchange(ABC):
+
+    # for functions that should be applicable to every exchange. I imagine most exchange APIs don't work
+    # the same way, so most functions will be part of subclasses tailored to each exchange
+    # transport is the HTTPTransport every request goes through, subclasses make a default one if none is given
+    # metrics is the Metrics that the @_traced methods record to, METRICS if none is given
+    # every exchange answers the same calls, with the same arguments and return values as Binance's, so that
+    # VenueRouter can quote and trade on any of them without knowing which one it is. they're abstract, so an
+    # exchange missing any of them can't be made:
+    #   metadata: get_pairing_list(), split_a_pairing()
+    #   books: get_pairing_converted_value(), get_average_price(), get_price_usdc()
+    #   balances: get_balances()
+    #   orders: execute_trade(), and execute_tax_trade() which is built out of the others
+    # along with a router (ConversionRouter) over its pairings and a tax_engine (TaxEngine) for its fills
+    # VENUE is the name its fills are recorded under and fee_rate what it charges per trade, as a fraction of what's
+    # acquired. transport is None for an exchange that doesn't go over HTTP
+
+    VENUE = None
+    FEE_RATE = decimal_zero
+
+    def __init__(self, api_token: str = None, api_token_secret: str = None, transport: HTTPTransport = None,
+                 metrics: Metrics = None):
+        self.api_token = api_token
+        self.api_token_secret = api_token_secret
+        self.transport = transport
+        self.metrics = metrics if metrics is not None else METRICS
+        self.venue = self.VENUE
+        self.fee_rate = self.FEE_RATE
+        self._pending_fills = []
+        self._pending_fills_lock = threading.Lock()
+
+    @_traced
+    def get_signature(self, query_string: str) -> str:
+        # signing the param_strings used to interact with the exchange APIs should be the same everywhere
+        undigested_sig = hmac.new(self.api_token_secret.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256)
+        return undigested_sig.hexdigest()
+
+    # get_tax_due() will need to be formatted at some point to however the specific exchange needs its values formatted
+    # my take is to implement that in a get_tax_due() function in the subclass that
+    # returns a formatted super().get_tax_due()
+    @staticmethod
+    def get_tax_due(spend_total_usd: Decimal, cost_basis_usd: Decimal = None, term: str = 'short') \
+            -> Decimal or str:
+        term = term.lower()
+        if term != 'short' and term != 'long':
+            invalid_term = list()
+            invalid_term.append(term)
+            return tuple(invalid_term)
+        if cost_basis_usd is None:
+            cost_basis_usd = decimal_zero
+        tax_due_usd = decimal_zero
+        based_total = spend_total_usd - cost_basis_usd
+        if term == 'short':
+            tax_due_usd = based_total * Decimal('0.3')
+        elif term == 'long':
+            tax_due_usd = based_total * Decimal('0.16')
+        return tax_due_usd
+
+    # takes a Decimal and returns it with 6 decimal places, rounded up or down depending on round_direction
+    # round_direction: ROUND_DOWN, ROUND_UP
+    @staticmethod
+    def format_a_decimal(dec: Decimal, lot_size: str, round_direction: str = 'ROUND_DOWN') -> Decimal:
+        return dec.quantize(_get_decimal(lot_size), rounding=round_direction)
+
+    # get_pairing_list() returns a tuple of the pairings that can be traded
+    @abstractmethod
+    def get_pairing_list(self) -> tuple:
+        pass
+
+    # split_a_pairing() returns the pairing's (first asset, second asset), or ('invalidPairing',)
+    @abstractmethod
+    def split_a_pairing(self, pairing_to_split: str, ret_valid_pairing: bool = False) -> Tuple[str, str] or tuple:
+        pass
+
+    # get_pairing_converted_value() returns (qty, asset) that spend_amount converts into on side of the pairing
+    @abstractmethod
+    def get_pairing_converted_value(self, pairing: str, spend_amount: Decimal, side: str = 'buy') -> tuple:
+        pass
+
+    # get_average_price() returns (average price, slippage from the best price) of trading qty of the pairing's
+    # first asset on side, or None if the book isn't deep enough
+    @abstractmethod
+    def get_average_price(self, pairing: str, qty: Decimal, side: str = 'buy') -> tuple or None:
+        pass
+
+    # get_price_usdc() returns (qty, asset) that qty of symbol sells for in USDC, or that qty USDC buys of it
+    @abstractmethod
+    def get_price_usdc(self, symbol: str, qty: Decimal, side: str = 'buy') -> tuple:
+        pass
+
+    # get_balances() yields a (free qty, asset) tuple for each symbol, or for every asset held with all_symbols
+    @abstractmethod
+    def get_balances(self, *args, all_symbols: bool = False, show_zero_balances: bool = False):
+        pass
+
+    # execute_trade() places a market order for qty of the pairing's first asset, returning
+    # (amount acquired, asset acquired, the exchange's response as a binance FULL order response)
+    @abstractmethod
+    def execute_trade(self, pairing: str, qty: Decimal, side: str = 'buy', schedule: 'SliceSchedule' = None,
+                      price: Decimal = None) -> tuple:
+        pass
+
+    # _get_route_to_usdc() returns the route the tax trade converts symbol to USDC along, the router's cheapest
+    # the router ranks by fees and spreads only, qty is there for venues that can also weigh depth (see Binance's)
+    def _get_route_to_usdc(self, symbol: str, qty: Decimal = None, candidates: int = 3) -> tuple or None:
+        return self.router.get_route(symbol)
+
+    # a route converting USDC back into the asset: the same hops backwards, each on the other side
+    @staticmethod
+    def _reverse_route(route: tuple) -> tuple:
+        return tuple(RouteHop(hop.pairing, 'sell' if hop.side == 'buy' else 'buy', hop.to_asset, hop.from_asset)
+                     for hop in reversed(route))
+
+    # execute_trade() only queues each order's FillLedger entry, so placing an order never waits on valuing its
+    # fill (a depth request, for a pairing not quoted in dollars) or on saving the lot store. ingest_fills() hands
+    # the queued entries to tax_engine, and is called before anything works out tax from the lots, so they're
+    # always counted by then. call it before exiting too, or the lots from the last orders never get saved
+    # returns the TaxLiability of each disposal ingested
+    @_traced
+    def ingest_fills(self) -> list or tuple:
+        with self._pending_fills_lock:
+            entries, self._pending_fills = self._pending_fills, []
+        if not entries:
+            return []
+        return self.tax_engine.ingest_fills(entries, self._get_fill_usd_value)
+
+    def _queue_fill(self, ledger_entry: dict):
+        with self._pending_fills_lock:
+            self._pending_fills.append(ledger_entry)
+
+    # get_tax_due_for_sale() asks tax_engine for the exact tax on selling qty of asset right now, matching the sale
+    # against the lots held instead of taking a cost basis. the proceeds are valued at the current USDC price
+    @_traced
+    def get_tax_due_for_sale(self, asset: str, qty: Decimal, method: str = None) -> Decimal or tuple:
+        asset = asset.upper()
+        self.ingest_fills()
+        proceeds_usd = self.get_price_usdc(symbol=asset, qty=qty, side='sell')
+        if not isinstance(proceeds_usd, tuple) or not isinstance(proceeds_usd[0], Decimal):
+            return proceeds_usd
+        liability = self.tax_engine.plan_disposal(asset, qty, proceeds_usd[0], method=method)
+        if not isinstance(liability, TaxLiability):
+            return liability
+        return self.format_a_decimal(liability.tax_due_usd, lot_size='.01', round_direction='ROUND_UP')
+
+    # make the tax trade(s) before the main trade's function gets called
+    # figures out the necessary trades to convert the given asset to the USDC amount given
+    # then executes those trades using execute_trade()
+    # without tax_due_usd, qty_being_sold is the size of the planned sale, and the tax due on it comes from
+    # get_tax_due_for_sale(). if there's no tax due nothing gets traded and the amount returned is zero
+    @_traced
+    def execute_tax_trade(self, asset_being_sold: str,  tax_due_usd: Decimal = None,
+                          qty_being_sold: Decimal = None) -> tuple:
+        asset_being_sold = asset_being_sold.upper()
+        if tax_due_usd is None:
+            if qty_being_sold is None:
+                return tuple(['invalidDecimal'])
+            tax_due_usd = self.get_tax_due_for_sale(asset_being_sold, qty_being_sold)
+            if not isinstance(tax_due_usd, Decimal):
+                return tax_due_usd
+        if tax_due_usd == decimal_zero:
+            return decimal_zero, 'USDC', None
+        tax_due_as_sym = self.get_price_usdc(symbol=asset_being_sold, qty=tax_due_usd, side='buy')
+        if not isinstance(tax_due_as_sym, tuple) or not isinstance(tax_due_as_sym[0], Decimal):
+            return tax_due_as_sym
+        tax_due_as_sym = tax_due_as_sym[0]
+        route = self._get_route_to_usdc(asset_being_sold, qty=tax_due_as_sym)
+        if route is None:
+            return tuple(['noRouteToUSDC'])
+        trade_result = None
+        amount = tax_due_as_sym
+        for hop in route:
+            if hop.side == 'sell':
+                trade_result = self.execute_trade(pairing=hop.pairing, qty=amount, side='sell')
+            else:
+                # buying takes a quantity of the asset being bought, so convert what's being spent into it first
+                qty_to_buy = self.get_pairing_converted_value(pairing=hop.pairing, spend_amount=amount, side='buy')
+                if not isinstance(qty_to_buy, tuple) or not isinstance(qty_to_buy[0], Decimal):
+                    return qty_to_buy
+                trade_result = self.execute_trade(pairing=hop.pairing, qty=qty_to_buy[0], side='buy')
+            if not isinstance(trade_result, tuple) or not isinstance(trade_result[0], Decimal):
+                return trade_result
+            amount = trade_result[0]
+        return trade_result
+        # format_a_decimal() isn't necessary here because execute_trade() calls it before returning
+
+    # _get_ledger_entry() works out what a FULL order response executed from its fills
+    # commission charged in the asset acquired comes out of the amount acquired. entries are marked with the venue
+    def _get_ledger_entry(self, result: dict, quote_asset: str, base_asset: str) -> dict:
+        executed_qty, quote_qty = decimal_zero, decimal_zero
+        commissions = {}
+        for fill in result.get('fills', ()):
+            price, qty = Decimal(fill['price']), Decimal(fill['qty'])
+            executed_qty += qty
+            quote_qty += price * qty
+            commission_asset = fill['commissionAsset']
+            commission = Decimal(fill['commission'])
+            commissions[commission_asset] = commissions.get(commission_asset, decimal_zero) + commission
+        if executed_qty == decimal_zero:  # no fills listed, fall back on the order's totals
+            executed_qty = Decimal(result.get('executedQty', '0'))
+            quote_qty = Decimal(result.get('cummulativeQuoteQty', '0'))
+        average_price = quote_qty / executed_qty if executed_qty != decimal_zero else decimal_zero
+        if result['side'] == 'BUY':
+            acquired_asset, acquired_qty, spent_asset, spent_qty = quote_asset, executed_qty, base_asset, quote_qty
+        else:
+            acquired_asset, acquired_qty, spent_asset, spent_qty = base_asset, quote_qty, quote_asset, executed_qty
+        acquired_qty -= commissions.get(acquired_asset, decimal_zero)
+        return {
+            'exchange': self.venue,
+            'pairing': result['symbol'],
+            'side': result['side'],
+            'order_id': result['orderId'],
+            'time': result['transactTime'],
+            'executed_qty': executed_qty,
+            'quote_qty': quote_qty,
+            'average_price': average_price,
+            'commissions': commissions,
+            'acquired_asset': acquired_asset,
+            'acquired_qty': acquired_qty,
+            'spent_asset': spent_asset,
+            'spent_qty': spent_qty,
+        }
+
+
+class ScaledQuantizer(object):
+
+    # ScaledQuantizer converts one pairing's quantities and prices to and from plain integers: a quantity becomes
+    # how many of the pairing's step size it is, and a price how many of its tick size, so a price * quantity
+    # (notional) is counted in step size * tick size units. integer math on those is exact and much cheaper than
+    # 100 digit Decimals, and they only get turned back into Decimals at the edges
+    # strings get parsed straight into integers without making a Decimal first
+
+    PRECISION = 34  # digits for the few Decimal divisions done at the edges, like average prices
+
+    def __init__(self, step_size: str, tick_size: str):
+        self.step_size = Decimal(step_size).normalize()
+        self.tick_size = Decimal(tick_size).normalize()
+        self.notional_size = self.step_size * self.tick_size
+        # the step size as a whole number of the smallest digit it uses, same for tick and notional sizes
+        self.qty_decimals = max(0, -self.step_size.as_tuple().exponent)
+        self.price_decimals = max(0, -self.tick_size.as_tuple().exponent)
+        self.step_units = int(self.step_size.scaleb(self.qty_decimals))
+        self.tick_units = int(self.tick_size.scaleb(self.price_decimals))
+        self.notional_units = self.step_units * self.tick_units
+        self._scalings = {}
+
+    # rounding down is what an order can actually be placed with, round_up=True for amounts owed like taxes
+    def qty_to_steps(self, qty: str or Decimal, round_up: bool = False) -> int:
+        return self._quantize(qty, self.qty_decimals, self.step_units, round_up)
+
+    def price_to_ticks(self, price: str or Decimal, round_up: bool = False) -> int:
+        return self._quantize(price, self.price_decimals, self.tick_units, round_up)
+
+    def notional_to_units(self, notional: str or Decimal, round_up: bool = False) -> int:
+        return self._quantize(notional, self.qty_decimals + self.price_decimals, self.notional_units, round_up)
+
+    # the same as qty_to_steps() and price_to_ticks() (rounding down) for a whole column of a book at once
+    def qtys_to_steps(self, qtys: list) -> list:
+        return self._quantize_many(qtys, self.qty_decimals, self.step_units)
+
+    def prices_to_ticks(self, prices: list) -> list:
+        return self._quantize_many(prices, self.price_decimals, self.tick_units)
+
+    def steps_to_qty(self, steps: int) -> Decimal:
+        return steps * self.step_size
+
+    def ticks_to_price(self, ticks: int) -> Decimal:
+        return ticks * self.tick_size
+
+    def units_to_notional(self, units: int) -> Decimal:
+        return units * self.notional_size
+
+    def _quantize(self, number: str or Decimal, decimals: int, unit: int, round_up: bool) -> int:
+        if isinstance(number, str) and 'e' not in number and 'E' not in number:
+            point = number.find('.')
+            fraction_digits = 0 if point < 0 else len(number) - point - 1
+            multiplier, divisor = self._get_scaling(fraction_digits, decimals, unit)
+            units, remainder = divmod(int(number.replace('.', '', 1)) * multiplier, divisor)
+        else:
+            scaled_decimal = Decimal(number).scaleb(decimals)
+            scaled = int(scaled_decimal)
+            units, remainder = divmod(scaled, unit)
+            remainder = remainder or scaled != scaled_decimal
+        if round_up and remainder:
+            units += 1
+        return units
+
+    # exchanges write every number in a book with the same number of decimal places, so the scaling
+    # only gets looked up again when that changes
+    def _quantize_many(self, numbers: list, decimals: int, unit: int) -> list:
+        quantized = []
+        last_fraction_digits, multiplier, divisor = None, 1, unit
+        for number in numbers:
+            if isinstance(number, str) and 'e' not in number and 'E' not in number:
+                point = number.find('.')
+                fraction_digits = 0 if point < 0 else len(number) - point - 1
+                if fraction_digits != last_fraction_digits:
+                    multiplier, divisor = self._get_scaling(fraction_digits, decimals, unit)
+                    last_fraction_digits = fraction_digits
+                quantized.append(int(number.replace('.', '', 1)) * multiplier // divisor)
+            else:
+                quantized.append(self._quantize(number, decimals, unit, False))
+        return quantized
+
+    # a number written with fraction_digits decimal places, read as a whole number, gets multiplied by
+    # multiplier and divided by divisor to count it in units. these only depend on how many decimal
+    # places the exchange writes, which hardly ever changes, so they're worked out once
+    def _get_scaling(self, fraction_digits: int, decimals: int, unit: int) -> Tuple[int, int]:
+        key = fraction_digits, decimals, unit
+        scaling = self._scalings.get(key)
+        if scaling is None:
+            if fraction_digits <= decimals:
+                scaling = 10 ** (decimals - fraction_digits), unit
+            else:
+                scaling = 1, unit * 10 ** (fraction_digits - decimals)
+            self._scalings[key] = scaling
+        return scaling
+
+
+class MappedExchangeInfo(object):
+
+    # MappedExchangeInfo reads an ExchangeInfoCache file in place through mmap. records() reads the pairing table,
+    # and each pairing's filters only get parsed the first time get_filters() is asked for them
+
+    def __init__(self, mapped: mmap.mmap, count: int, fetched_at: float, etag: str, digest: str):
+        self._mapped = mapped
+        self.count = count
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.digest = digest
+        self._records_offset = ExchangeInfoCache.HEADER.size
+        self._index_offset = self._records_offset + count * ExchangeInfoCache.RECORD.size
+        self._strings_offset = self._index_offset + count * ExchangeInfoCache.INDEX.size
+
+    # records() yields (pairing, quote, base, lot size, listed) for every pairing, lot size is '' if it has none
+    def records(self):
+        for index in range(self.count):
+            record = self._get_record(index)
+            yield self._get_string(record[0], record[1]), self._get_string(record[2], record[3]), \
+                self._get_string(record[4], record[5]), self._get_string(record[6], record[7]), record[10]
+
+    # returns {filter type: filter} like ExchangeInfo.filters, or None if the pairing isn't in the file
+    def get_filters(self, pairing: str) -> dict or None:
+        index = self._find(pairing.encode('utf-8'))
+        if index is None:
+            return None
+        record = self._get_record(index)
+        return json.loads(self._get_string(record[8], record[9]))
+
+    def close(self):
+        self._mapped.close()
+
+    def _get_record(self, index: int) -> tuple:
+        return ExchangeInfoCache.RECORD.unpack_from(self._mapped,
+                                                    self._records_offset + index * ExchangeInfoCache.RECORD.size)
+
+    def _get_string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return self._mapped[start:start + length].decode('utf-8')
+
+    # a binary search through the index, which lists the records in order of their pairings
+    def _find(self, pairing: bytes) -> int or None:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            index = ExchangeInfoCache.INDEX.unpack_from(self._mapped,
+                                                        self._index_offset + middle * ExchangeInfoCache.INDEX.size)[0]
+            offset, length = self._get_record(index)[:2]
+            start = self._strings_offset + offset
+            found = self._mapped[start:start + length]
+            if found == pairing:
+                return index
+            if found < pairing:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+class ExchangeInfoCache(object):
+
+    # ExchangeInfoCache keeps the last exchangeInfo snapshot in a file, so a new process can validate pairings and
+    # work out lot sizes without downloading and parsing it again (see ExchangeInfo's cache)
+    # source is whatever the snapshot came from, like the api url. a file from another source, or written in another
+    # FORMAT_VERSION, gets ignored and replaced by the next save()
+    # etag is the server's ETag for the snapshot ('' if it didn't send one) and digest is a hash of its symbols,
+    # so that a download that didn't change can be recognised either way
+    # layout, little endian:
+    #   HEADER: magic, format version, number of records, fetched_at (unix time), and the offset and length of
+    #           the source, etag and digest in the strings
+    #   RECORD for each pairing, in the order exchangeInfo listed them: the offset and length of the pairing,
+    #           quote asset, base asset, lot size and filters (json) in the strings, and whether the pairing is listed
+    #   INDEX: the record numbers sorted by pairing, for looking one up
+    #   strings: utf-8, each distinct string is only stored once
+
+    MAGIC = b'GTEI'
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct('<4sHxxId6I')
+    RECORD = struct.Struct('<10I?3x')
+    INDEX = struct.Struct('<I')
+    FETCHED_AT_OFFSET = struct.calcsize('<4sHxxI')
+
+    def __init__(self, path: str, source: str = ''):
+        self.path = path
+        self.source = source
+
+    # open() returns the file as a MappedExchangeInfo, or None if there isn't a usable one
+    def open(self) -> MappedExchangeInfo or None:
+        try:
+            with open(self.path, 'rb') as cache_file:
+                mapped = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: the file is empty
+            return None
+        if len(mapped) < self.HEADER.size:
+            mapped.close()
+            return None
+        magic, version, count, fetched_at, *string_fields = self.HEADER.unpack_from(mapped)
+        strings_offset = self.HEADER.size + count * (self.RECORD.size + self.INDEX.size)
+        if magic != self.MAGIC or version != self.FORMAT_VERSION or len(mapped) < strings_offset:
+            mapped.close()
+            return None
+        source, etag, digest = (mapped[strings_offset + offset:strings_offset + offset + length].decode('utf-8')
+                                for offset, length in zip(string_fields[::2], string_fields[1::2]))
+        if source != self.source:
+            mapped.close()
+            return None
+        return MappedExchangeInfo(mapped, count, fetched_at, etag, digest)
+
+    # save() writes a new file next to the old one and swaps it in, so readers never see half of one
+    # returns False if it couldn't be written, the cache is only ever a shortcut so that's not an error
+    def save(self, pairing_assets: dict, pairings: frozenset, lot_sizes: dict, filters: dict, etag: str,
+             digest: str, fetched_at: float = None) -> bool:
+        strings = bytearray()
+        string_offsets = {}
+
+        def add_string(string: str) -> Tuple[int, int]:
+            if string not in string_offsets:
+                encoded = string.encode('utf-8')
+                string_offsets[string] = len(strings), len(encoded)
+                strings.extend(encoded)
+            return string_offsets[string]
+
+        header_strings = add_string(self.source) + add_string(etag or '') + add_string(digest or '')
+        records = bytearray()
+        for pairing in pairing_assets:
+            quote, base = pairing_assets[pairing]
+            filters_json = json.dumps(filters.get(pairing, {}), separators=(',', ':'))
+            records.extend(self.RECORD.pack(*add_string(pairing), *add_string(quote), *add_string(base),
+                                            *add_string(lot_sizes.get(pairing, '')), *add_string(filters_json),
+                                            pairing in pairings))
+        record_pairings = list(pairing_assets)
+        ordered = sorted(range(len(record_pairings)), key=lambda record: record_pairings[record].encode('utf-8'))
+        index = b''.join(self.INDEX.pack(record) for record in ordered)
+        header = self.HEADER.pack(self.MAGIC, self.FORMAT_VERSION, len(pairing_assets),
+                                  time.time() if fetched_at is None else fetched_at, *header_strings)
+        temp_path = self.path + '.tmp'
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'wb') as cache_file:
+                cache_file.write(header + records + index + strings)
+            os.replace(temp_path, self.path)
+        except OSError:
+            return False
+        return True
+
+    # touch() marks the file as fetched at fetched_at, for when a refresh found the snapshot unchanged
+    def touch(self, fetched_at: float = None) -> bool:
+        try:
+            with open(self.path, 'r+b') as cache_file:
+                cache_file.seek(self.FETCHED_AT_OFFSET)
+                cache_file.write(struct.pack('<d', time.time() if fetched_at is None else fetched_at))
+        except OSError:
+            return False
+        return True
+
+
+# filters read out of a MappedExchangeInfo the first time each pairing's are needed
+class _MappedFilters(dict):
+
+    def __init__(self, mapped: MappedExchangeInfo):
+        super().__init__()
+        self._mapped = mapped
+
+    def __missing__(self, pairing: str) -> dict:
+        filters = self._mapped.get_filters(pairing)
+        if filters is None:
+            raise KeyError(pairing)
+        self[pairing] = filters
+        return filters
+
+    def get(self, pairing: str, default=None):
+        try:
+            return self[pairing]
+        except KeyError:
+            return default
+
+
+class ExchangeInfo(object):
+
+    # ExchangeInfo holds one parsed snapshot of an exchange's metadata (pairings, symbols, filters) so that
+    # validation and lookups don't have to download and parse the whole thing every time they're called
+    # fetch is a function that returns the raw metadata response, so each exchange can supply its own
+    # the snapshot reloads itself once it's older than ttl seconds, or whenever refresh() is called
+    # invalid_pairings get left out of the pairing list but keep their filters, since lot sizes still need them
+    # filter_table holds the filters parsed into numbers, see FilterTable
+    # pairing_assets maps every pairing to its (quote, base) symbols, and symbol_trie lets split_pairing() split
+    # concatenations of two symbols that aren't listed pairings in one pass over the string
+    # with a cache (an ExchangeInfoCache), the first lookup loads the snapshot saved there instead of fetching one,
+    # taking its age from when it was fetched, and every snapshot fetched afterwards gets saved to it. refreshes
+    # send the saved ETag as If-None-Match, and a 304 or an unchanged download just marks the snapshot fresh
+    # with background_refresh, a stale snapshot keeps answering lookups while a thread fetches its replacement
+    # fetch takes an optional headers dict for the If-None-Match
+
+    _TRIE_END = ''  # marks a node in symbol_trie where a complete symbol ends
+
+    def __init__(self, fetch, ttl: float = 600.0, invalid_pairings: tuple = (), metrics: Metrics = None,
+                 cache: ExchangeInfoCache = None, background_refresh: bool = False):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.invalid_pairings = frozenset(invalid_pairings)
+        self.loaded_at = None
+        self.pairing_list = ()
+        self.pairings = frozenset()
+        self.symbols = {'base': frozenset(), 'quote': frozenset()}
+        self.filters = {}
+        self.lot_sizes = {}
+        self.pairing_assets = {}
+        self.symbol_trie = {}
+        self._quantizers = {}
+        self.filter_table = FilterTable(self)
+        self.metrics = metrics if metrics is not None else METRICS
+        self.cache = cache
+        self.background_refresh = background_refresh
+        self.etag = None
+        self.digest = None
+        self._cache_checked = False
+        self._refresh_thread = None
+        self._refresh_lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    # refresh() returns True if the snapshot was reloaded, otherwise the status code of the failed request
+    def refresh(self) -> bool or int:
+        if self.etag:
+            response = self._fetch(headers={'If-None-Match': self.etag})
+        else:
+            response = self._fetch()
+        if response.status_code == 304:
+            self._mark_fresh()
+            return True
+        if response.status_code >= 400:
+            return response.status_code
+        info_json = response.json()
+        digest = None
+        if self.cache is not None:
+            digest = self._get_digest(info_json)
+            if digest == self.digest and self.loaded_at is not None:
+                self._mark_fresh()
+                return True
+        self.load(info_json)
+        self.etag, self.digest = response.headers.get('ETag'), digest
+        if self.cache is not None:
+            self.cache.save(self.pairing_assets, self.pairings, self.lot_sizes, self.filters, self.etag, digest)
+        return True
+
+    # refresh_in_background() starts a refresh on another thread, unless one is already running
+    # the thread isn't a daemon, so a short lived process still finishes saving the new snapshot before it exits
+    def refresh_in_background(self):
+        with self._refresh_lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_quietly, name='exchange-info-refresh')
+            self._refresh_thread.start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except OSError:  # connection errors, the stale snapshot just keeps getting used until the next try
+            pass
+
+    # ensure_fresh() only reloads if the snapshot is stale. if a reload fails but there's an older
+    # snapshot, the older one keeps getting used rather than failing every lookup
+    def ensure_fresh(self) -> bool or int:
+        if not self._cache_checked and self.loaded_at is None and self.cache is not None:
+            self._load_cache()
+        stale = self.is_stale()
+        if self.metrics.enabled:
+            self.metrics.record_cache('exchange_info', not stale)
+        if not stale:
+            return True
+        if self.background_refresh and self.loaded_at is not None:
+            self.refresh_in_background()
+            return True
+        refreshed = self.refresh()
+        if refreshed is not True and self.loaded_at is None:
+            return refreshed
+        return True
+
+    @_traced
+    def load(self, info_json: dict):
+        pairing_list = []
+        symbols = {'base': {'USDT', 'USDC'}, 'quote': set()}
+        filters = {}
+        lot_sizes = {}
+        pairing_assets = {}
+        for item in info_json['symbols']:
+            pairing = item['symbol']
+            if pairing not in self.invalid_pairings:
+                pairing_list.append(pairing)
+            pairing_assets[pairing] = (item['baseAsset'], item['quoteAsset'])
+            symbols['base'].add(item['baseAsset'])
+            symbols['quote'].add(item['quoteAsset'])
+            pairing_filters = {}
+            for filter_dict in item['filters']:
+                pairing_filters[filter_dict['filterType']] = filter_dict
+            filters[pairing] = pairing_filters
+            if 'LOT_SIZE' in pairing_filters:
+                lot_sizes[pairing] = str(pairing_filters['LOT_SIZE']['minQty']).rstrip('0')
+        self.pairing_list = tuple(pairing_list)
+        self.pairings = frozenset(pairing_list)
+        self.symbols = {side: frozenset(assets) for side, assets in symbols.items()}
+        self.filters = filters
+        self.lot_sizes = lot_sizes
+        self.pairing_assets = pairing_assets
+        self.symbol_trie = self._build_symbol_trie(self.symbols['base'])
+        self._quantizers = {}
+        self.filter_table.clear()
+        self.loaded_at = time.monotonic()
+
+    # _load_cache() loads the snapshot saved in cache, if there's a usable one. the filters stay in the file
+    # until they're looked up, everything else gets read in now
+    @_traced
+    def _load_cache(self):
+        self._cache_checked = True
+        mapped = self.cache.open()
+        if self.metrics.enabled:
+            self.metrics.record_cache('exchange_info_file', mapped is not None)
+        if mapped is None:
+            return
+        pairing_list = []
+        symbols = {'base': {'USDT', 'USDC'}, 'quote': set()}
+        lot_sizes = {}
+        pairing_assets = {}
+        for pairing, quote, base, lot_size, listed in mapped.records():
+            if listed and pairing not in self.invalid_pairings:
+                pairing_list.append(pairing)
+            pairing_assets[pairing] = (quote, base)
+            symbols['base'].add(quote)
+            symbols['quote'].add(base)
+            if lot_size:
+                lot_sizes[pairing] = lot_size
+        self.pairing_list = tuple(pairing_list)
+        self.pairings = frozenset(pairing_list)
+        self.symbols = {side: frozenset(assets) for side, assets in symbols.items()}
+        self.filters = _MappedFilters(mapped)
+        self.lot_sizes = lot_sizes
+        self.pairing_assets = pairing_assets
+        self.symbol_trie = self._build_symbol_trie(self.symbols['base'])
+        self._quantizers = {}
+        self.filter_table.clear()
+        self.etag, self.digest = mapped.etag or None, mapped.digest or None
+        self.loaded_at = time.monotonic() - max(0.0, time.time() - mapped.fetched_at)
+
+    def _mark_fresh(self):
+        self.loaded_at = time.monotonic()
+        if self.cache is not None:
+            self.cache.touch()
+
+    # a hash of the symbols, which is everything that gets used. the rest of the response (like serverTime)
+    # changes with every request
+    @staticmethod
+    def _get_digest(info_json: dict) -> str:
+        return hashlib.sha1(json.dumps(info_json['symbols'], separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _build_symbol_trie(cls, symbols) -> dict:
+        trie = {}
+        for symbol in symbols:
+            node = trie
+            for char in symbol:
+                node = node.setdefault(char, {})
+            node[cls._TRIE_END] = True
+        return trie
+
+    def has_pairing(self, pairing: str) -> bool:
+        self.ensure_fresh()
+        return pairing in self.pairings
+
+    def has_symbol(self, symbol: str, pairing_side: str = 'base') -> bool:
+        self.ensure_fresh()
+        return symbol in self.symbols[pairing_side]
+
+    # split_pairing() returns (quote, base) for a listed pairing straight from the metadata, otherwise it walks
+    # symbol_trie along the string and takes the first prefix whose remainder is also a symbol
+    # returns None if the string isn't made of two known symbols
+    def split_pairing(self, pairing: str) -> Tuple[str, str] or None:
+        self.ensure_fresh()
+        assets = self.pairing_assets.get(pairing)
+        if assets is not None:
+            return assets
+        node = self.symbol_trie
+        for index, char in enumerate(pairing):
+            node = node.get(char)
+            if node is None:
+                return None
+            if self._TRIE_END in node and pairing[index + 1:] in self.symbols['base']:
+                return pairing[:index + 1], pairing[index + 1:]
+        return None
+
+    # returns None if the pairing or the filter doesn't exist
+    def get_filter(self, pairing: str, filter_type: str) -> dict or None:
+        self.ensure_fresh()
+        return self.filters.get(pairing, {}).get(filter_type)
+
+    # get_quantizer() returns the pairing's ScaledQuantizer, made the first time it's asked for
+    # returns None if the pairing doesn't have a step size and tick size
+    def get_quantizer(self, pairing: str) -> ScaledQuantizer or None:
+        if pairing not in self._quantizers:
+            lot_size_filter = self.get_filter(pairing, 'LOT_SIZE')
+            price_filter = self.get_filter(pairing, 'PRICE_FILTER')
+            quantizer = None
+            if lot_size_filter is not None and price_filter is not None \
+                    and Decimal(lot_size_filter['stepSize']) > decimal_zero \
+                    and Decimal(price_filter['tickSize']) > decimal_zero:
+                quantizer = ScaledQuantizer(lot_size_filter['stepSize'], price_filter['tickSize'])
+            self._quantizers[pairing] = quantizer
+        return self._quantizers[pairing]
+
+
+# the limits out of one pairing's filters that a market order (the only kind placed) gets checked against, as
+# Decimals except max_num_orders. step_size is what the quantity has to be a multiple of: MARKET_LOT_SIZE's step if it
+# sets one, otherwise LOT_SIZE's. min_qty and max_qty are the tighter of the two filters' limits. min_notional and
+# max_notional come from MIN_NOTIONAL or NOTIONAL, only when they apply to market orders. zero means no limit
+SymbolFilters = namedtuple('SymbolFilters', ['pairing', 'step_size', 'min_qty', 'max_qty', 'tick_size', 'min_price',
+                                             'max_price', 'min_notional', 'max_notional', 'max_num_orders'])
+# what FilterTable.check_order() made of an order: qty rounded down to the step size, price (if one was given)
+# rounded to the tick size, and the names of the filters it still doesn't pass, empty if it's fine to send
+OrderCheck = namedtuple('OrderCheck', ['qty', 'price', 'errors'])
+
+
+class FilterTable(object):
+
+    # FilterTable holds the filters of an ExchangeInfo's current snapshot as SymbolFilters, each pairing's made the
+    # first time they're asked for (so filters left in a cache file still only get parsed when they're needed),
+    # and checks orders against them locally, so one binance would reject never costs a signed request
+    # ExchangeInfo clears it whenever it loads a new snapshot
+
+    def __init__(self, exchange_info: 'ExchangeInfo'):
+        self.exchange_info = exchange_info
+        self._symbol_filters = {}
+        self._asset_step_sizes = {}
+
+    def clear(self):
+        self._symbol_filters = {}
+        self._asset_step_sizes = {}
+
+    # returns None if the pairing isn't in the metadata
+    def get(self, pairing: str) -> SymbolFilters or None:
+        self.exchange_info.ensure_fresh()
+        symbol_filters = self._symbol_filters.get(pairing)
+        if symbol_filters is None:
+            filters = self.exchange_info.filters.get(pairing)
+            if filters is None:
+                return None
+            symbol_filters = self._parse(pairing, filters)
+            self._symbol_filters[pairing] = symbol_filters
+        return symbol_filters
+
+    # get_asset_step_size() returns the finest step size of the pairings that have asset as their first asset,
+    # which is how precisely binance counts amounts of it. None if there aren't any
+    def get_asset_step_size(self, asset: str) -> Decimal or None:
+        self.exchange_info.ensure_fresh()
+        if asset not in self._asset_step_sizes:
+            step_sizes = []
+            for pairing, assets in self.exchange_info.pairing_assets.items():
+                if assets[0] == asset:
+                    step_size = self.get(pairing).step_size
+                    if step_size > decimal_zero:
+                        step_sizes.append(step_size)
+            self._asset_step_sizes[asset] = min(step_sizes) if step_sizes else None
+        return self._asset_step_sizes[asset]
+
+    # round_qty() rounds qty down to a multiple of the pairing's step size
+    def round_qty(self, pairing: str, qty: Decimal) -> Decimal:
+        symbol_filters = self.get(pairing)
+        if symbol_filters is None or symbol_filters.step_size == decimal_zero:
+            return qty
+        return (qty // symbol_filters.step_size) * symbol_filters.step_size
+
+    # check_order() checks a market order for qty of the pairing's first asset against LOT_SIZE (and
+    # MARKET_LOT_SIZE), PRICE_FILTER, MIN_NOTIONAL (or NOTIONAL) and MAX_NUM_ORDERS, after rounding qty down to the
+    # step size. price is what the order's expected to fill at, the notional and price filters are only checked
+    # when there is one. open_orders is how many orders are already open on the pairing
+    # the errors are 'unknownPairing', 'belowMinQty', 'aboveMaxQty', 'priceOutOfRange', 'belowMinNotional',
+    # 'aboveMaxNotional' and 'tooManyOrders'
+    def check_order(self, pairing: str, qty: Decimal, price: Decimal = None, open_orders: int = 0) -> OrderCheck:
+        symbol_filters = self.get(pairing)
+        if symbol_filters is None:
+            return OrderCheck(qty, price, tuple(['unknownPairing']))
+        errors = []
+        qty = self.round_qty(pairing, qty)
+        if qty <= decimal_zero or qty < symbol_filters.min_qty:
+            errors.append('belowMinQty')
+        if symbol_filters.max_qty > decimal_zero and qty > symbol_filters.max_qty:
+            errors.append('aboveMaxQty')
+        if price is not None:
+            if symbol_filters.tick_size > decimal_zero:
+                price = (price / symbol_filters.tick_size).to_integral_value() * symbol_filters.tick_size
+            if price < symbol_filters.min_price \
+                    or (symbol_filters.max_price > decimal_zero and price > symbol_filters.max_price):
+                errors.append('priceOutOfRange')
+            notional = qty * price
+            if notional < symbol_filters.min_notional:
+                errors.append('belowMinNotional')
+            if symbol_filters.max_notional > decimal_zero and notional > symbol_filters.max_notional:
+                errors.append('aboveMaxNotional')
+        if symbol_filters.max_num_orders and open_orders >= symbol_filters.max_num_orders:
+            errors.append('tooManyOrders')
+        return OrderCheck(qty, price, tuple(errors))
+
+    @staticmethod
+    def _parse(pairing: str, filters: dict) -> SymbolFilters:
+        def get_limit(filter_type: str, key: str) -> Decimal:
+            filter_dict = filters.get(filter_type)
+            if filter_dict is None or key not in filter_dict:
+                return decimal_zero
+            return Decimal(str(filter_dict[key]))
+
+        max_qtys = [max_qty for max_qty in (get_limit('LOT_SIZE', 'maxQty'), get_limit('MARKET_LOT_SIZE', 'maxQty'))
+                    if max_qty > decimal_zero]
+        min_notional, max_notional = decimal_zero, decimal_zero
+        if filters.get('MIN_NOTIONAL', {}).get('applyToMarket', True):
+            min_notional = get_limit('MIN_NOTIONAL', 'minNotional')
+        if filters.get('NOTIONAL', {}).get('applyMinToMarket', True):
+            min_notional = max(min_notional, get_limit('NOTIONAL', 'minNotional'))
+        if filters.get('NOTIONAL', {}).get('applyMaxToMarket', True):
+            max_notional = get_limit('NOTIONAL', 'maxNotional')
+        return SymbolFilters(
+            pairing=pairing,
+            step_size=get_limit('MARKET_LOT_SIZE', 'stepSize') or get_limit('LOT_SIZE', 'stepSize'),
+            min_qty=max(get_limit('LOT_SIZE', 'minQty'), get_limit('MARKET_LOT_SIZE', 'minQty')),
+            max_qty=min(max_qtys) if max_qtys else decimal_zero,
+            tick_size=get_limit('PRICE_FILTER', 'tickSize'),
+            min_price=get_limit('PRICE_FILTER', 'minPrice'),
+            max_price=get_limit('PRICE_FILTER', 'maxPrice'),
+            min_notional=min_notional,
+            max_notional=max_notional,
+            max_num_orders=int(get_limit('MAX_NUM_ORDERS', 'maxNumOrders')))
+
+
+# acquired: how much of the other asset the spend converts into
+# average_price: the spend's volume weighted price, in the pairing's base asset
+# slippage: how far average_price is from the best price, as a fraction of the best price
+SimulatedFill = namedtuple('SimulatedFill', ['acquired', 'average_price', 'slippage'])
+# a SimulatedFill for a spend that may go past the end of the book: low and high are the ends of the
+# ImpactModel's confidence band for acquired, and extrapolated is the fraction of the spend past the book
+# (zero when the book covered it, in which case all three are the same)
+DepthEstimate = namedtuple('DepthEstimate', ['acquired', 'low', 'high', 'average_price', 'slippage', 'extrapolated'])
+
+
+class ImpactModel(object):
+
+    # ImpactModel extrapolates a book past the levels that were fetched, to estimate spends deeper than it
+    # how much of a book is available within some distance of its best price (distance as a fraction of the best
+    # price) tends to grow like a power of that distance, so beyond the last level fetched the book is continued as
+    # cumulative quantity = last level's cumulative quantity * (distance / last level's distance) ** exponent
+    # the exponent is fitted to the fetched levels by least squares on their logs unless one is given: 1 means the
+    # book stays as deep all the way down, below 1 it thins out and above 1 it thickens
+    # the confidence band is the estimate with the exponent z standard errors either side of the fit (1.96 is ~95%),
+    # or exponent_error either side if that's given. books with too few levels to fit use default_exponent and
+    # default_exponent_error
+
+    def __init__(self, exponent: float = None, exponent_error: float = None, z: float = 1.96,
+                 default_exponent: float = 1.0, default_exponent_error: float = 0.5, min_exponent: float = 0.1):
+        self.exponent = exponent
+        self.exponent_error = exponent_error
+        self.z = z
+        self.default_exponent = default_exponent
+        self.default_exponent_error = default_exponent_error
+        self.min_exponent = min_exponent
+
+    # fit() returns (exponent, standard error) for a book given as each level's distance and cumulative quantity
+    def fit(self, distances: list, cumulative_quantities: list) -> Tuple[float, float]:
+        if self.exponent is not None:
+            return self.exponent, self.exponent_error or 0.0
+        points = [(math.log(distance), math.log(quantity))
+                  for distance, quantity in zip(distances, cumulative_quantities) if distance > 0 and quantity > 0]
+        if len(points) < 3:
+            return self.default_exponent, self._get_error(self.default_exponent_error)
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        sxx = sum((x - mean_x) ** 2 for x, _ in points)
+        if sxx == 0:
+            return self.default_exponent, self._get_error(self.default_exponent_error)
+        exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) / sxx
+        residuals = sum((y - mean_y - exponent * (x - mean_x)) ** 2 for x, y in points)
+        standard_error = math.sqrt(residuals / (len(points) - 2) / sxx)
+        return max(exponent, self.min_exponent), self._get_error(standard_error)
+
+    # the exponents for the low and high ends of the band. a smaller exponent means a thinner book, which always
+    # means less acquired whichever side it is
+    def get_band(self, exponent: float, error: float) -> Tuple[float, float]:
+        return max(exponent - self.z * error, self.min_exponent), exponent + self.z * error
+
+    # extrapolate() returns how much spending spend acquires, as a float, for a spend past the end of the book
+    # book_spent and book_acquired are what the whole fetched book spends and acquires, and last_distance and
+    # book_quantity are the distance and cumulative quantity of its last level. returns None if selling that much
+    # would push the price down to nothing
+    @staticmethod
+    def extrapolate(side: str, best_price: float, last_distance: float, book_quantity: float, book_spent: float,
+                    book_acquired: float, spend: float, exponent: float) -> float or None:
+        power = 1 + 1 / exponent
+
+        # notional traded past the book when the cumulative quantity reaches book_quantity * ratio
+        def notional_past_book(ratio: float) -> float:
+            moved = last_distance * book_quantity * (ratio ** power - 1) / power
+            quantity = book_quantity * (ratio - 1)
+            return best_price * (quantity + moved if side == 'buy' else quantity - moved)
+
+        if side == 'sell':  # spend is quantity, acquired is notional
+            ratio = spend / book_quantity
+            if last_distance * ratio ** (1 / exponent) >= 1:
+                return None
+            return book_acquired + notional_past_book(ratio)
+        # buying spends notional, so find the quantity where the notional reaches spend
+        target = spend - book_spent
+        low, high = 1.0, 2.0
+        while notional_past_book(high) < target:
+            low, high = high, high * 2
+        for _ in range(100):
+            middle = (low + high) / 2
+            if notional_past_book(middle) < target:
+                low = middle
+            else:
+                high = middle
+        return book_quantity * (low + high) / 2
+
+    def _get_error(self, standard_error: float) -> float:
+        if self.exponent_error is not None:
+            return self.exponent_error
+        return standard_error
+
+
+class FillSimulator(object):
+
+    # FillSimulator parses one side of a book into price and quantity lists, along with running totals
+    # of quantity and notional (price * quantity) down the book, so any number of spend amounts can be filled
+    # with a binary search instead of walking the book level by level for each one
+    # side: 'buy' walks the asks spending the base asset, 'sell' walks the bids spending the quote asset
+    # levels are [price, quantity] pairs best price first, like v1/depth returns them. they can be any iterable
+    # (like DepthSnapshot.get_levels()), and only get parsed as far down as the spends asked about reach, apart
+    # from the things that need the whole book (estimate() past the end of it, get_max_qty() and the depth curve)
+
+    def __init__(self, levels, side: str):
+        self.side = side
+        self.prices, self.quantities = [], []
+        self.cumulative_quantity, self.cumulative_notional = [], []
+        self._levels = iter(levels)
+        self._parse_level()  # the best price is always wanted
+
+    # _parse_level() parses the next level onto the lists, returning False once the book has run out
+    def _parse_level(self) -> bool:
+        if self._levels is None:
+            return False
+        level = next(self._levels, None)
+        if level is None:
+            self._levels = None
+            return False
+        price, qty = Decimal(level[0]), Decimal(level[1])
+        self.prices.append(price)
+        self.quantities.append(qty)
+        if self.cumulative_quantity:
+            self.cumulative_quantity.append(self.cumulative_quantity[-1] + qty)
+            self.cumulative_notional.append(self.cumulative_notional[-1] + price * qty)
+        else:
+            self.cumulative_quantity.append(qty)
+            self.cumulative_notional.append(price * qty)
+        return True
+
+    # parses levels until totals (one of the cumulative lists) reaches amount, or the book runs out
+    def _parse_until(self, totals: list, amount) -> None:
+        while (not totals or totals[-1] < amount) and self._parse_level():
+            pass
+
+    def _parse_all(self) -> None:
+        while self._parse_level():
+            pass
+
+    # parse_levels() parses the book down to level_count levels, or all of it
+    def parse_levels(self, level_count: int) -> None:
+        while len(self.prices) < level_count and self._parse_level():
+            pass
+
+    # is_parsed() is whether the whole book has been parsed
+    def is_parsed(self) -> bool:
+        return self._levels is None
+
+    # covers() is whether the book is deep enough to fill spend_amount
+    def covers(self, spend_amount: Decimal) -> bool:
+        spent_totals = self.cumulative_notional if self.side == 'buy' else self.cumulative_quantity
+        self._parse_until(spent_totals, spend_amount)
+        return bool(spent_totals) and spent_totals[-1] >= spend_amount
+
+    # get_spent_total() returns what filling through the first level_count levels would spend, or None if they
+    # haven't all been parsed yet (or the book doesn't have that many)
+    def get_spent_total(self, level_count: int) -> Decimal or None:
+        if len(self.prices) < level_count:
+            return None
+        spent_totals = self.cumulative_notional if self.side == 'buy' else self.cumulative_quantity
+        return spent_totals[level_count - 1]
+
+    # simulate() returns a SimulatedFill for each spend amount, or None for any amount deeper than the book
+    # unless an ImpactModel is given to estimate those with
+    def simulate(self, spend_amounts, model: ImpactModel = None) -> list:
+        fills = [self._fill(spend_amount) for spend_amount in spend_amounts]
+        if model is not None:
+            for index, fill in enumerate(fills):
+                if fill is None:
+                    fills[index] = self.estimate(spend_amounts[index], model)
+        return fills
+
+    # estimate() returns a DepthEstimate of the spend, extrapolating the book with model if it's deeper than it
+    # returns None if the book is empty, or the spend would sell the price down to nothing
+    def estimate(self, spend_amount: Decimal, model: ImpactModel = None) -> DepthEstimate or None:
+        fill = self._fill(spend_amount)
+        if fill is not None:
+            return DepthEstimate(fill.acquired, fill.acquired, fill.acquired, fill.average_price, fill.slippage,
+                                 decimal_zero)
+        if not self.prices:
+            return None
+        if model is None:
+            model = ImpactModel()
+        best_price, distances, cumulative_quantities, book_spent, book_acquired = self._get_depth_curve()
+        exponent, error = model.fit(distances, cumulative_quantities)
+        low_exponent, high_exponent = model.get_band(exponent, error)
+        last_distance = distances[-1] or 1e-4  # a book all at one price still has to move somewhere
+        estimates = [model.extrapolate(self.side, best_price, last_distance, cumulative_quantities[-1], book_spent,
+                                       book_acquired, float(spend_amount), curve_exponent)
+                     for curve_exponent in (exponent, low_exponent, high_exponent)]
+        if estimates[0] is None:
+            return None
+        acquired, low, high = (Decimal(repr(estimate)) if estimate is not None else decimal_zero
+                               for estimate in estimates)
+        if self.side == 'buy':
+            average_price = spend_amount / acquired
+            slippage = (average_price - Decimal(repr(best_price))) / Decimal(repr(best_price))
+        else:
+            average_price = acquired / spend_amount
+            slippage = (Decimal(repr(best_price)) - average_price) / Decimal(repr(best_price))
+        extrapolated = (spend_amount - Decimal(repr(book_spent))) / spend_amount
+        return DepthEstimate(acquired, low, high, average_price, slippage, extrapolated)
+
+    # get_average_price() returns (average price, slippage from the best price) for trading qty of the quote asset
+    # through the book, whichever side it is, or None if qty is deeper than the book
+    def get_average_price(self, qty: Decimal) -> Tuple[Decimal, Decimal] or None:
+        self._parse_until(self.cumulative_quantity, qty)
+        level = bisect_left(self.cumulative_quantity, qty)
+        if level == len(self.cumulative_quantity) or qty <= decimal_zero:
+            return None
+        qty_before, notional_before = decimal_zero, decimal_zero
+        if level > 0:
+            qty_before, notional_before = self.cumulative_quantity[level - 1], self.cumulative_notional[level - 1]
+        average_price = (notional_before + (qty - qty_before) * self.prices[level]) / qty
+        return average_price, self._get_slippage(average_price, self.prices[0])
+
+    # get_max_qty() returns the most of the quote asset that can be traded through the book without the
+    # slippage going over max_slippage
+    def get_max_qty(self, max_slippage: Decimal) -> Decimal:
+        self._parse_all()
+        if not self.cumulative_quantity:
+            return decimal_zero
+        low, high = decimal_zero, self._get_book_quantity()
+        if self.get_average_price(high)[1] <= max_slippage:
+            return high
+        for _ in range(60):
+            middle = (low + high) / 2
+            if self.get_average_price(middle)[1] <= max_slippage:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    # (best price, distance of each level from it, cumulative quantity at each level, what the whole book spends,
+    # what the whole book acquires) as floats, for ImpactModel
+    def _get_depth_curve(self) -> tuple:
+        self._parse_all()
+        best_price = float(self.prices[0])
+        distances = [abs(float(price) - best_price) / best_price for price in self.prices]
+        cumulative_quantities = [float(qty) for qty in self.cumulative_quantity]
+        book_quantity, book_notional = self.cumulative_quantity[-1], self.cumulative_notional[-1]
+        if self.side == 'buy':
+            return best_price, distances, cumulative_quantities, float(book_notional), float(book_quantity)
+        return best_price, distances, cumulative_quantities, float(book_quantity), float(book_notional)
+
+    def _get_book_quantity(self) -> Decimal:
+        self._parse_all()
+        return self.cumulative_quantity[-1]
+
+    def _get_slippage(self, average_price: Decimal, best_price: Decimal) -> Decimal:
+        if self.side == 'buy':
+            return (average_price - best_price) / best_price
+        return (best_price - average_price) / best_price
+
+    def _fill(self, spend_amount: Decimal) -> SimulatedFill or None:
+        # buying spends notional to acquire quantity, selling spends quantity to acquire notional
+        if self.side == 'buy':
+            spent_totals, acquired_totals = self.cumulative_notional, self.cumulative_quantity
+        else:
+            spent_totals, acquired_totals = self.cumulative_quantity, self.cumulative_notional
+        self._parse_until(spent_totals, spend_amount)
+        level = bisect_left(spent_totals, spend_amount)  # first level where the running total covers the spend
+        if level == len(spent_totals):
+            return None
+        spent_before, acquired_before = decimal_zero, decimal_zero
+        if level > 0:
+            spent_before, acquired_before = spent_totals[level - 1], acquired_totals[level - 1]
+        price = self.prices[level]
+        best_price = self.prices[0]
+        if self.side == 'buy':
+            acquired = acquired_before + (spend_amount - spent_before) / price
+            average_price = spend_amount / acquired
+            slippage = (average_price - best_price) / best_price
+        else:
+            acquired = acquired_before + (spend_amount - spent_before) * price
+            average_price = acquired / spend_amount
+            slippage = (best_price - average_price) / best_price
+        return SimulatedFill(acquired, average_price, slippage)
+
+
+class FixedPointFillSimulator(FillSimulator):
+
+    # the same as FillSimulator, but the book is kept as integer ticks and steps from a ScaledQuantizer
+    # what's acquired comes out already rounded down to a whole step (or notional unit when selling)
+    # amounts spent are truncated to a whole step (or notional unit) first too, the way binance rounds an order's
+    # quantity, so quotes can come out a little under the decimal backend's: selling 1.234567 ETH of ETHUSDC
+    # (step 0.00001) gets quoted as selling 1.23456. the Decimals handed back are worked out at the quantizer's
+    # PRECISION, not the module's 100 digits
+
+    def __init__(self, levels, side: str, quantizer: ScaledQuantizer):
+        self.side = side
+        self.quantizer = quantizer
+        self._levels = None  # converted all at once, the quantizer works on whole lists
+        levels = list(levels)
+        self.prices = quantizer.prices_to_ticks([price for price, qty in levels])
+        self.quantities = quantizer.qtys_to_steps([qty for price, qty in levels])
+        self.cumulative_quantity = list(accumulate(self.quantities))
+        self.cumulative_notional = list(accumulate(price * qty for price, qty in zip(self.prices, self.quantities)))
+
+    def simulate(self, spend_amounts, model: ImpactModel = None) -> list:
+        with self._get_context():
+            return super().simulate(spend_amounts, model)
+
+    def estimate(self, spend_amount: Decimal, model: ImpactModel = None) -> DepthEstimate or None:
+        with self._get_context():
+            return super().estimate(spend_amount, model)
+
+    def get_max_qty(self, max_slippage: Decimal) -> Decimal:
+        with self._get_context():
+            return super().get_max_qty(max_slippage)
+
+    def get_average_price(self, qty: Decimal) -> Tuple[Decimal, Decimal] or None:
+        quantizer = self.quantizer
+        steps = quantizer.qty_to_steps(qty)
+        level = bisect_left(self.cumulative_quantity, steps)
+        if level == len(self.cumulative_quantity) or steps == 0:
+            return None
+        steps_before, units_before = 0, 0
+        if level > 0:
+            steps_before, units_before = self.cumulative_quantity[level - 1], self.cumulative_notional[level - 1]
+        units = units_before + (steps - steps_before) * self.prices[level]
+        with self._get_context():
+            average_price = quantizer.units_to_notional(units) / quantizer.steps_to_qty(steps)
+            return average_price, self._get_slippage(average_price, quantizer.ticks_to_price(self.prices[0]))
+
+    def _get_context(self):
+        context = decimal.getcontext().copy()
+        context.prec = self.quantizer.PRECISION
+        return decimal.localcontext(context)
+
+    def _get_book_quantity(self) -> Decimal:
+        return self.quantizer.steps_to_qty(self.cumulative_quantity[-1])
+
+    def covers(self, spend_amount: Decimal) -> bool:
+        if not self.cumulative_quantity:
+            return False
+        if self.side == 'buy':
+            return self.cumulative_notional[-1] >= self.quantizer.notional_to_units(spend_amount)
+        return self.cumulative_quantity[-1] >= self.quantizer.qty_to_steps(spend_amount)
+
+    def get_spent_total(self, level_count: int) -> Decimal or None:
+        if len(self.prices) < level_count:
+            return None
+        if self.side == 'buy':
+            return self.quantizer.units_to_notional(self.cumulative_notional[level_count - 1])
+        return self.quantizer.steps_to_qty(self.cumulative_quantity[level_count - 1])
+
+    def _get_depth_curve(self) -> tuple:
+        quantizer = self.quantizer
+        best_price = float(quantizer.ticks_to_price(self.prices[0]))
+        distances = [abs(price - self.prices[0]) / self.prices[0] for price in self.prices]
+        cumulative_quantities = [float(quantizer.steps_to_qty(steps)) for steps in self.cumulative_quantity]
+        book_quantity = float(quantizer.steps_to_qty(self.cumulative_quantity[-1]))
+        book_notional = float(quantizer.units_to_notional(self.cumulative_notional[-1]))
+        if self.side == 'buy':
+            return best_price, distances, cumulative_quantities, book_notional, book_quantity
+        return best_price, distances, cumulative_quantities, book_quantity, book_notional
+
+    def _fill(self, spend_amount: Decimal) -> SimulatedFill or None:
+        quantizer = self.quantizer
+        if self.side == 'buy':
+            spent_totals, acquired_totals = self.cumulative_notional, self.cumulative_quantity
+            spend_units = quantizer.notional_to_units(spend_amount)
+        else:
+            spent_totals, acquired_totals = self.cumulative_quantity, self.cumulative_notional
+            spend_units = quantizer.qty_to_steps(spend_amount)
+        level = bisect_left(spent_totals, spend_units)
+        if level == len(spent_totals) or spend_units == 0:
+            return None
+        spent_before, acquired_before = 0, 0
+        if level > 0:
+            spent_before, acquired_before = spent_totals[level - 1], acquired_totals[level - 1]
+        price = self.prices[level]
+        best_price = quantizer.ticks_to_price(self.prices[0])
+        if self.side == 'buy':
+            acquired = quantizer.steps_to_qty(acquired_before + (spend_units - spent_before) // price)
+            if acquired == decimal_zero:
+                return SimulatedFill(acquired, quantizer.ticks_to_price(price), decimal_zero)
+            average_price = quantizer.units_to_notional(spend_units) / acquired
+            slippage = (average_price - best_price) / best_price
+        else:
+            acquired = quantizer.units_to_notional(acquired_before + (spend_units - spent_before) * price)
+            average_price = acquired / quantizer.steps_to_qty(spend_units)
+            slippage = (best_price - average_price) / best_price
+        return SimulatedFill(acquired, average_price, slippage)
+
+
+class DepthSnapshot(object):
+
+    # DepthSnapshot is one v1/depth response kept as the bytes it came in, with its levels only parsed as far as
+    # they're read. get_levels() yields [price, quantity] string pairs best price first straight out of the body,
+    # and the best prices get parsed on their own, so a 1000 level response is one bytes object instead of a few
+    # thousand lists and strings, and a quote that stops after a few levels never touches the rest
+    # limit is how many levels were asked for
+
+    __slots__ = ('pairing', 'limit', 'last_update_id', '_body', '_spans')
+
+    _LEVEL = re.compile(rb'\[\s*"([^"]*)"\s*,\s*"([^"]*)"')
+    _LAST_UPDATE_ID = re.compile(rb'"lastUpdateId"\s*:\s*(\d+)')
+
+    def __init__(self, pairing: str, body: bytes, limit: int = None):
+        self.pairing = pairing
+        self.limit = limit
+        self._body = body
+        last_update_id = self._LAST_UPDATE_ID.search(body)
+        self.last_update_id = int(last_update_id.group(1)) if last_update_id is not None else None
+        # each side's levels are between its key and the other side's key (or the end of the body)
+        bids_start, asks_start = body.find(b'"bids"'), body.find(b'"asks"')
+        self._spans = {
+            'bids': (bids_start, asks_start if asks_start > bids_start else len(body)),
+            'asks': (asks_start, bids_start if bids_start > asks_start else len(body)),
+        }
+
+    # book: 'bids' or 'asks'
+    def get_levels(self, book: str):
+        start, end = self._spans[book]
+        if start < 0:
+            return
+        for match in self._LEVEL.finditer(self._body, start, end):
+            yield [match.group(1).decode('ascii'), match.group(2).decode('ascii')]
+
+    # returns the (price, quantity) at the top of the book as Decimals, or None if that side is empty
+    def get_best(self, book: str) -> Tuple[Decimal, Decimal] or None:
+        for price, qty in self.get_levels(book):
+            return Decimal(price), Decimal(qty)
+        return None
+
+    @property
+    def best_bid(self) -> Decimal or None:
+        best = self.get_best('bids')
+        return best[0] if best is not None else None
+
+    @property
+    def best_ask(self) -> Decimal or None:
+        best = self.get_best('asks')
+        return best[0] if best is not None else None
+
+    # mid and spread are None unless both sides have a level, spread is a fraction of mid
+    @property
+    def mid(self) -> Decimal or None:
+        best_bid, best_ask = self.best_bid, self.best_ask
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_bid + best_ask) / 2
+
+    @property
+    def spread(self) -> Decimal or None:
+        best_bid, best_ask = self.best_bid, self.best_ask
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_ask - best_bid) / ((best_ask + best_bid) / 2)
+
+    # the snapshot the way v1/depth's json has it, for the code that wants the whole thing parsed
+    def to_dict(self) -> dict:
+        return {'lastUpdateId': self.last_update_id, 'bids': list(self.get_levels('bids')),
+                'asks': list(self.get_levels('asks'))}
+
+
+class OrderBook(object):
+
+    # OrderBook is a local mirror of one pairing's order book. it gets seeded with a depth snapshot, and then
+    # kept current with diff events applied in lastUpdateId order, the way binance describes here:
+    # https://github.com/binance-exchange/binance-official-api-docs/blob/master/web-socket-streams.md
+    # bids and asks map price -> quantity, both as Decimals
+
+    def __init__(self, pairing: str):
+        self.pairing = pairing
+        self.bids = {}
+        self.asks = {}
+        self.last_update_id = None
+        self._awaiting_first_diff = True
+        self._sorted_levels = {}
+        self._fill_simulators = {}
+
+    def load_snapshot(self, snapshot: dict):
+        self.bids = self._parse_levels(snapshot['bids'])
+        self.asks = self._parse_levels(snapshot['asks'])
+        self.last_update_id = snapshot['lastUpdateId']
+        self._awaiting_first_diff = True
+        self._sorted_levels = {}
+        self._fill_simulators = {}
+
+    # apply_diff() returns False if the event doesn't follow on from the last one applied, which means
+    # some updates were missed and the book has to be seeded again from a fresh snapshot
+    # events that are older than the book are ignored
+    def apply_diff(self, event: dict) -> bool:
+        first_update_id, final_update_id = event['U'], event['u']
+        if self.last_update_id is None:
+            return False
+        if final_update_id <= self.last_update_id:
+            return True
+        if self._awaiting_first_diff:
+            if not first_update_id <= self.last_update_id + 1 <= final_update_id:
+                return False
+        elif first_update_id != self.last_update_id + 1:
+            return False
+        self._apply_levels(self.bids, event['b'])
+        self._apply_levels(self.asks, event['a'])
+        self.last_update_id = final_update_id
+        self._awaiting_first_diff = False
+        self._sorted_levels = {}
+        self._fill_simulators = {}
+        return True
+
+    # get_levels() returns [price, quantity] pairs best price first, the same shape as v1/depth returns them
+    # book: 'bids' or 'asks'
+    def get_levels(self, book: str) -> list:
+        if book not in self._sorted_levels:
+            levels = self.bids if book == 'bids' else self.asks
+            self._sorted_levels[book] = sorted(([price, qty] for price, qty in levels.items()),
+                                               reverse=book == 'bids')
+        return self._sorted_levels[book]
+
+    # the simulator is kept until the next diff changes the book
+    # with a quantizer it's a FixedPointFillSimulator
+    def get_fill_simulator(self, side: str, quantizer: ScaledQuantizer = None) -> FillSimulator:
+        key = side, quantizer is not None
+        if key not in self._fill_simulators:
+            levels = self.get_levels('asks' if side == 'buy' else 'bids')
+            if quantizer is None:
+                self._fill_simulators[key] = FillSimulator(levels, side)
+            else:
+                self._fill_simulators[key] = FixedPointFillSimulator(levels, side, quantizer)
+        return self._fill_simulators[key]
+
+    @staticmethod
+    def _parse_levels(levels: list) -> dict:
+        parsed = {}
+        for price, qty in levels:
+            qty = Decimal(qty)
+            if qty != decimal_zero:
+                parsed[Decimal(price)] = qty
+        return parsed
+
+    # a quantity of zero means the price level was removed
+    @staticmethod
+    def _apply_levels(levels: dict, updates: list):
+        for price, qty in updates:
+            price, qty = Decimal(price), Decimal(qty)
+            if qty == decimal_zero:
+                levels.pop(price, None)
+            else:
+                levels[price] = qty
+
+
+class ReplayFeed(object):
+
+    # feeds stream events (depth diffs, account updates) from a file with one JSON event per line, so recorded
+    # stream data can stand in for the live stream. lines can be the raw event or the combined stream's
+    # {"stream": ..., "data": ...}
+
+    def __init__(self, path: str):
+        self.path = path
+        self._events = None
+
+    def poll(self) -> list:
+        if self._events is None:
+            with open(self.path) as replay_file:
+                self._events = [self._unwrap(json.loads(line)) for line in replay_file if line.strip()]
+            return self._events
+        return []
+
+    @staticmethod
+    def _unwrap(event: dict) -> dict:
+        if 'data' in event:
+            return event['data']
+        return event
+
+
+class QueueFeed(object):
+
+    # a thread safe feed for stream events, whatever is listening to the exchange's stream
+    # calls push() with each event it receives, and poll() hands over everything received since the last poll
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def push(self, event: dict):
+        self._queue.put(event)
+
+    def poll(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+class OrderBookManager(object):
+
+    # OrderBookManager keeps an OrderBook for every pairing being tracked
+    # fetch_snapshot is a function taking a pairing that returns the depth snapshot response
+    # feed is anything with a poll() method returning the depth diff events that arrived since it was last called
+    # (like ReplayFeed or QueueFeed). events for pairings that aren't tracked are ignored
+
+    def __init__(self, fetch_snapshot, feed=None):
+        self._fetch_snapshot = fetch_snapshot
+        self.feed = feed
+        self.books = {}
+
+    def is_tracked(self, pairing: str) -> bool:
+        return pairing in self.books
+
+    # track() seeds a book for the pairing, returns True or the status code of the failed snapshot request
+    def track(self, pairing: str) -> bool or int:
+        book = OrderBook(pairing)
+        seeded = self._seed(book)
+        if seeded is not True:
+            return seeded
+        self.books[pairing] = book
+        return True
+
+    def untrack(self, pairing: str):
+        self.books.pop(pairing, None)
+
+    # get_book() applies any waiting diff events first, and returns None if the pairing isn't tracked
+    def get_book(self, pairing: str) -> OrderBook or None:
+        self.sync()
+        return self.books.get(pairing)
+
+    # sync() applies every event waiting in the feed, reseeding any book that has fallen out of sequence
+    def sync(self):
+        if self.feed is None:
+            return
+        for event in self.feed.poll():
+            book = self.books.get(event['s'])
+            if book is not None and not book.apply_diff(event):
+                self._seed(book)
+
+    def _seed(self, book: OrderBook) -> bool or int:
+        snapshot = self._fetch_snapshot(book.pairing)
+        if snapshot.status_code >= 400:
+            return snapshot.status_code
+        book.load_snapshot(snapshot.json())
+        return True
+
+
+# one hop of a conversion route: trading pairing on side turns from_asset into to_asset
+RouteHop = namedtuple('RouteHop', ['pairing', 'side', 'from_asset', 'to_asset'])
+
+
+class ConversionRouter(object):
+
+    # ConversionRouter works out how to convert any asset into target_asset. it builds a graph with an edge for
+    # every pairing in exchange_info, then keeps a table of candidate routes for each asset: a direct pairing,
+    # or hops through the intermediates (BTC, ETH, BNB, USDT by default), at most max_hops long
+    # candidates get ranked by their fees plus half the spread of each hop. spread_source is a function taking
+    # a pairing that returns its current spread as a fraction of its price, or None if it isn't known,
+    # in which case default_spread is used. the table is updated whenever exchange_info reloads, only redoing
+    # the assets whose pairings changed unless an intermediate's pairings did
+
+    def __init__(self, exchange_info: ExchangeInfo, target_asset: str = 'USDC',
+                 intermediates: tuple = ('BTC', 'ETH', 'BNB', 'USDT'), max_hops: int = 3,
+                 fee_rate: Decimal = Decimal('0.001'), default_spread: Decimal = Decimal('0.002'),
+                 spread_source=None):
+        self.exchange_info = exchange_info
+        self.target_asset = target_asset
+        self.intermediates = tuple(intermediates)
+        self.max_hops = max_hops
+        self.fee_rate = fee_rate
+        self.default_spread = default_spread
+        self.spread_source = spread_source
+        self.graph = {}
+        self.routes = {}
+        self._pairing_assets = {}
+        self._loaded_at = None
+
+    # get_routes() returns every candidate route from asset to target_asset, cheapest first
+    # each route is a tuple of RouteHops, and converting target_asset to itself is an empty route
+    # an asset with only one route doesn't get it scored, so it never costs spread_source a lookup
+    def get_routes(self, asset: str) -> list:
+        self.update()
+        if asset == self.target_asset:
+            return [()]
+        routes = self.routes.get(asset, ())
+        if len(routes) < 2:
+            return list(routes)
+        return sorted(routes, key=self.score_route)
+
+    # get_route() returns the cheapest route, or None if asset can't be converted
+    def get_route(self, asset: str) -> tuple or None:
+        routes = self.get_routes(asset)
+        if not routes:
+            return None
+        return routes[0]
+
+    def score_route(self, route: tuple) -> Decimal:
+        score = decimal_zero
+        for hop in route:
+            spread = None
+            if self.spread_source is not None:
+                spread = self.spread_source(hop.pairing)
+            if spread is None:
+                spread = self.default_spread
+            score += self.fee_rate + spread / 2
+        return score
+
+    # update() brings the graph and route table up to date with exchange_info
+    def update(self):
+        self.exchange_info.ensure_fresh()
+        if self._loaded_at == self.exchange_info.loaded_at:
+            return
+        pairing_assets = {pairing: assets for pairing, assets in self.exchange_info.pairing_assets.items()
+                          if pairing in self.exchange_info.pairings}
+        changed_pairings = set(pairing_assets.items()) ^ set(self._pairing_assets.items())
+        changed_assets = set()
+        for pairing, assets in changed_pairings:
+            changed_assets.update(assets)
+        self._pairing_assets = pairing_assets
+        self._loaded_at = self.exchange_info.loaded_at
+        if not changed_assets:
+            return
+        self.graph = self._build_graph(pairing_assets)
+        if changed_assets & (set(self.intermediates) | {self.target_asset}):
+            changed_assets = set(self.graph)
+            self.routes = {}
+        for asset in changed_assets:
+            routes = self._find_routes(asset)
+            if routes:
+                self.routes[asset] = routes
+            else:
+                self.routes.pop(asset, None)
+
+    # graph maps asset -> {neighbouring asset: RouteHop converting asset into it}
+    @staticmethod
+    def _build_graph(pairing_assets: dict) -> dict:
+        graph = {}
+        for pairing, (quote, base) in pairing_assets.items():
+            graph.setdefault(quote, {})[base] = RouteHop(pairing, 'sell', quote, base)
+            graph.setdefault(base, {})[quote] = RouteHop(pairing, 'buy', base, quote)
+        return graph
+
+    # depth first search out from asset, only passing through intermediates
+    def _find_routes(self, asset: str) -> tuple:
+        if asset == self.target_asset or asset not in self.graph:
+            return ()
+        routes = []
+        pending = [(asset, ())]
+        while pending:
+            current_asset, route = pending.pop()
+            for next_asset, hop in self.graph.get(current_asset, {}).items():
+                if next_asset == self.target_asset:
+                    routes.append(route + (hop,))
+                elif next_asset in self.intermediates and len(route) + 2 <= self.max_hops \
+                        and next_asset != asset and all(next_asset != step.from_asset for step in route):
+                    pending.append((next_asset, route + (hop,)))
+        return tuple(routes)
+
+
+class AccountState(object):
+
+    # AccountState is a local copy of the account's balances, kept as asset -> (free, locked) Decimals
+    # it's seeded from one signed account snapshot (fetch_snapshot returns the response), then kept current by
+    # the account update events from feed (anything with a poll() method, like ReplayFeed or QueueFeed) and by
+    # the fills of orders this program executes. resync() throws it all away and takes a new snapshot
+    # without a feed, max_age is how many seconds it goes before resyncing on its own, None means never
+
+    def __init__(self, fetch_snapshot, feed=None, max_age: float = None, metrics: Metrics = None):
+        self._fetch_snapshot = fetch_snapshot
+        self.feed = feed
+        self.max_age = max_age
+        self.metrics = metrics if metrics is not None else METRICS
+        self.balances = {}
+        self.update_time = None
+        self.synced_at = None
+
+    def resync(self) -> bool or int:
+        snapshot = self._fetch_snapshot()
+        if snapshot.status_code >= 400:
+            return snapshot.status_code
+        snapshot_json = snapshot.json()
+        self.balances = {balance['asset']: (Decimal(balance['free']), Decimal(balance['locked']))
+                         for balance in snapshot_json['balances']}
+        self.update_time = snapshot_json.get('updateTime', 0)
+        self.synced_at = time.monotonic()
+        return True
+
+    # ensure_synced() takes a snapshot if there isn't one (or it's too old), then applies waiting feed events
+    # returns True, or the status code if the snapshot request failed
+    def ensure_synced(self) -> bool or int:
+        expired = self.synced_at is None or \
+            self.max_age is not None and time.monotonic() - self.synced_at > self.max_age
+        if self.metrics.enabled:
+            self.metrics.record_cache('account', not expired)
+        if expired:
+            synced = self.resync()
+            if synced is not True:
+                return synced
+        if self.feed is not None:
+            for event in self.feed.poll():
+                self.apply_event(event)
+        return True
+
+    # get() returns (free, locked), or None if the account has never held the asset
+    def get(self, asset: str) -> Tuple[Decimal, Decimal] or None:
+        return self.balances.get(asset)
+
+    # outboundAccountPosition events carry the new totals of each asset that changed, balanceUpdate events carry
+    # the change from a deposit or withdrawal. events from before the snapshot are already counted in it
+    def apply_event(self, event: dict):
+        event_type = event.get('e')
+        if event_type == 'outboundAccountPosition':
+            if event['u'] <= self.update_time:
+                return
+            for balance in event['B']:
+                self.balances[balance['a']] = (Decimal(balance['f']), Decimal(balance['l']))
+        elif event_type == 'balanceUpdate':
+            if event['T'] <= self.update_time:
+                return
+            free, locked = self.balances.get(event['a'], (decimal_zero, decimal_zero))
+            self.balances[event['a']] = (free + Decimal(event['d']), locked)
+
+    # apply_fill() takes a FillLedger entry, so our own trades show up without waiting for the feed
+    # the feed's next outboundAccountPosition replaces these with the exchange's own totals anyway
+    def apply_fill(self, ledger_entry: dict):
+        changes = {ledger_entry['acquired_asset']: ledger_entry['acquired_qty'],
+                   ledger_entry['spent_asset']: -ledger_entry['spent_qty']}
+        for asset, commission in ledger_entry['commissions'].items():
+            if asset != ledger_entry['acquired_asset']:  # that was already taken out of acquired_qty
+                changes[asset] = changes.get(asset, decimal_zero) - commission
+        for asset, change in changes.items():
+            free, locked = self.balances.get(asset, (decimal_zero, decimal_zero))
+            self.balances[asset] = (free + change, locked)
+
+
+class FillLedger(object):
+
+    # FillLedger is an append-only record of every order that's been executed, with what it cost, what it
+    # acquired, and the commission paid. entries are dicts of Decimals and strings. if a path is given, entries
+    # get appended to it as JSON lines (Decimals written as strings) and read back the next time it's opened
+
+    DECIMAL_FIELDS = ('executed_qty', 'quote_qty', 'average_price', 'acquired_qty', 'spent_qty')
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.entries = []
+        if path is not None and os.path.exists(path):
+            with open(path) as ledger_file:
+                self.entries = [self._from_json(json.loads(line)) for line in ledger_file if line.strip()]
+
+    def append(self, entry: dict):
+        self.entries.append(entry)
+        if self.path is not None:
+            with open(self.path, 'a') as ledger_file:
+                ledger_file.write(json.dumps(self._to_json(entry)) + '\n')
+
+    @classmethod
+    def _to_json(cls, entry: dict) -> dict:
+        json_entry = dict(entry)
+        for field in cls.DECIMAL_FIELDS:
+            json_entry[field] = str(entry[field])
+        json_entry['commissions'] = {asset: str(qty) for asset, qty in entry['commissions'].items()}
+        return json_entry
+
+    @classmethod
+    def _from_json(cls, json_entry: dict) -> dict:
+        entry = dict(json_entry)
+        for field in cls.DECIMAL_FIELDS:
+            entry[field] = Decimal(json_entry[field])
+        entry['commissions'] = {asset: Decimal(qty) for asset, qty in json_entry['commissions'].items()}
+        return entry
+
+
+class KlineStore(object):
+
+    # KlineStore keeps candlestick (kline) history on disk, so the price of a pairing at any past time can be looked
+    # up locally instead of with a request each. each pairing's candles at the store's interval get a directory with
+    # one file per column in COLUMNS, each an array of little endian int64s: open_time in milliseconds, the rest in
+    # units of 1e-8 (binance's precision)
+    # the files are only ever appended to, in open_time order, and get memory mapped for reading, so a lookup is a
+    # binary search of open_time plus one read from the column wanted. open_time gets written last, so a candle only
+    # counts once every column has it, even if an append got cut off part way
+    #   store = KlineStore('~/.gainstaker/klines', interval='1h')
+    #   store.backfill('BTCUSDC', binance._get_klines, start_time=1546300800000)
+    #   store.get_price('BTCUSDC', 1551398400000)
+
+    COLUMNS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+    PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+    SCALE_EXPONENT = 8
+    VALUE = struct.Struct('<q')
+    INTERVALS = {'1m': 60000, '5m': 300000, '15m': 900000, '30m': 1800000, '1h': 3600000, '2h': 7200000,
+                 '4h': 14400000, '6h': 21600000, '8h': 28800000, '12h': 43200000, '1d': 86400000}
+
+    def __init__(self, directory: str, interval: str = '1h'):
+        self.directory = os.path.expanduser(directory)
+        self.interval = interval
+        self.interval_ms = self.INTERVALS[interval]
+        self._columns = {}  # pairing -> {column: _MappedColumn}, mapped the first time each pairing is read
+
+    def get_path(self, pairing: str, column: str) -> str:
+        return os.path.join(self.directory, self.interval, pairing, column + '.i64')
+
+    # count() returns how many candles are stored for the pairing
+    def count(self, pairing: str) -> int:
+        return len(self._get_columns(pairing)['open_time'])
+
+    # get_range() returns the open_time of the first and last candle stored, or None if there aren't any
+    def get_range(self, pairing: str) -> Tuple[int, int] or None:
+        open_times = self._get_columns(pairing)['open_time']
+        if not open_times:
+            return None
+        return open_times[0], open_times[-1]
+
+    # get_price() returns column of the candle open at time at (milliseconds) as a Decimal, or None if no stored
+    # candle covers that time
+    def get_price(self, pairing: str, at: int, column: str = 'close') -> Decimal or None:
+        columns = self._get_columns(pairing)
+        open_times = columns['open_time']
+        index = bisect_right(open_times, at) - 1
+        if index < 0 or at >= open_times[index] + self.interval_ms:
+            return None
+        return Decimal(columns[column][index]).scaleb(-self.SCALE_EXPONENT)
+
+    # get_prices() does get_price() for every time in times
+    def get_prices(self, pairing: str, times, column: str = 'close') -> list:
+        return [self.get_price(pairing, at, column) for at in times]
+
+    # append() adds klines (rows like v3/klines returns them: open time, open, high, low, close, volume, ...)
+    # to the end of the pairing's history, skipping any that don't open after the last one stored
+    # returns how many were added
+    def append(self, pairing: str, klines: list) -> int:
+        stored = self.get_range(pairing)
+        last_open_time = stored[1] if stored is not None else None
+        count = self.count(pairing)
+        rows = []
+        for kline in klines:
+            open_time = int(kline[0])
+            if last_open_time is not None and open_time <= last_open_time:
+                continue
+            rows.append(kline)
+            last_open_time = open_time
+        if not rows:
+            return 0
+        self._unmap(pairing)
+        os.makedirs(os.path.dirname(self.get_path(pairing, 'open_time')), exist_ok=True)
+        for position, column in enumerate(self.PRICE_COLUMNS, 1):
+            path = self.get_path(pairing, column)
+            with open(path, 'ab') as column_file:
+                if column_file.tell() > count * self.VALUE.size:  # left over from an append that got cut off
+                    column_file.truncate(count * self.VALUE.size)
+                    column_file.seek(0, os.SEEK_END)
+                column_file.write(b''.join(self.VALUE.pack(int(Decimal(row[position]).scaleb(self.SCALE_EXPONENT)))
+                                           for row in rows))
+        with open(self.get_path(pairing, 'open_time'), 'ab') as column_file:
+            column_file.write(b''.join(self.VALUE.pack(int(row[0])) for row in rows))
+        return len(rows)
 
-    # for functions that should be applicable to every exchange. I imagine most exchange APIs don't work
-    # the same way, so most functions will be part of subclasses tailored to each exchange
+    # backfill() fetches the pairing's candles from start_time (or just after the last one stored, if that's later)
+    # up to end_time (now by default) and appends them. fetch is a function taking (pairing, interval, start_time,
+    # end_time, limit) that returns at most limit klines in open_time order, or a status code if it fails, like
+    # Binance._get_klines() or a KlineFixtureSource
+    # returns True, or the status code of the first failed fetch (whatever came before it is kept)
+    def backfill(self, pairing: str, fetch, start_time: int, end_time: int = None, limit: int = 1000) -> bool or int:
+        if end_time is None:
+            end_time = int(time.time() * 1000)
+        stored = self.get_range(pairing)
+        if stored is not None:
+            start_time = max(start_time, stored[1] + self.interval_ms)
+        while start_time <= end_time:
+            klines = fetch(pairing, self.interval, start_time, end_time, limit)
+            if isinstance(klines, int):
+                return klines
+            if not klines:
+                break
+            self.append(pairing, klines)
+            start_time = int(klines[-1][0]) + self.interval_ms
+        return True
 
-    def __init__(self, api_token: str = None, api_token_secret: str = None):
-        self.api_token = api_token
-        self.api_token_secret = api_token_secret
+    def close(self):
+        for pairing in list(self._columns):
+            self._unmap(pairing)
 
-    def get_signature(self, query_string: str) -> str:
-        # signing the param_strings used to interact with the exchange APIs should be the same everywhere
-        undigested_sig = hmac.new(self.api_token_secret.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256)
-        return undigested_sig.hexdigest()
+    def _get_columns(self, pairing: str) -> dict:
+        columns = self._columns.get(pairing)
+        if columns is None:
+            columns = {column: _MappedColumn(self.get_path(pairing, column), self.VALUE) for column in self.COLUMNS}
+            count = len(columns['open_time'])
+            for column in self.PRICE_COLUMNS:
+                if len(columns[column]) < count:  # an append got cut off before open_time, so it's never counted
+                    count = len(columns[column])
+            for column in columns.values():
+                column.length = min(column.length, count)
+            self._columns[pairing] = columns
+        return columns
 
-    # get_tax_due() will need to be formatted at some point to however the specific exchange needs its values formatted
-    # my take is to implement that in a get_tax_due() function in the subclass that
-    # returns a formatted super().get_tax_due()
-    @staticmethod
-    def get_tax_due(spend_total_usd: Decimal, cost_basis_usd: Decimal = None, term: str = 'short') \
-            -> Decimal or str:
-        term = term.lower()
-        if term != 'short' and term != 'long':
-            invalid_term = list()
-            invalid_term.append(term)
-            return tuple(invalid_term)
-        if cost_basis_usd is None:
-            cost_basis_usd = decimal_zero
-        tax_due_usd = decimal_zero
-        based_total = spend_total_usd - cost_basis_usd
-        if term == 'short':
-            tax_due_usd = based_total * Decimal('0.3')
-        elif term == 'long':
-            tax_due_usd = based_total * Decimal('0.16')
-        return tax_due_usd
+    def _unmap(self, pairing: str):
+        columns = self._columns.pop(pairing, None)
+        if columns is not None:
+            for column in columns.values():
+                column.close()
+
+
+# one column file of a KlineStore, memory mapped as a read only sequence of ints
+class _MappedColumn(object):
+
+    def __init__(self, path: str, value: struct.Struct):
+        self._value = value
+        self._mapped = None
+        self.length = 0
+        try:
+            with open(path, 'rb') as column_file:
+                self._mapped = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: the file is empty
+            return
+        self.length = len(self._mapped) // value.size
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self._value.unpack_from(self._mapped, index * self._value.size)[0]
+
+    def close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self.length = 0
+
+
+class KlineFixtureSource(object):
+
+    # KlineFixtureSource is a fetch function for KlineStore.backfill() that reads klines out of local files instead
+    # of the API: directory/<PAIRING>-<interval>.json, each a list of klines like v3/klines returns them, in
+    # open_time order (benchmarks/make_fixtures.py writes some). a pairing without a file has no candles
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._klines = {}
+
+    def __call__(self, pairing: str, interval: str, start_time: int, end_time: int, limit: int = 1000) -> list:
+        key = pairing + '-' + interval
+        if key not in self._klines:
+            path = os.path.join(self.directory, key + '.json')
+            klines = []
+            if os.path.exists(path):
+                with open(path) as kline_file:
+                    klines = json.load(kline_file)
+            self._klines[key] = klines, [kline[0] for kline in klines]
+        klines, open_times = self._klines[key]
+        start = bisect_left(open_times, start_time)
+        return [kline for kline in klines[start:start + limit] if kline[0] <= end_time]
+
+
+# acquired_at is in milliseconds like binance's timestamps, unit_cost_usd is the cost basis of one unit
+TaxLot = namedtuple('TaxLot', ['acquired_at', 'qty', 'unit_cost_usd'])
+Disposal = namedtuple('Disposal', ['asset', 'qty', 'proceeds_usd', 'disposed_at'])
+# unmatched_qty is however much of the disposal had no lot to match, which gets a cost basis of zero
+TaxLiability = namedtuple('TaxLiability', ['asset', 'qty', 'proceeds_usd', 'cost_basis_usd', 'short_term_gain',
+                                           'long_term_gain', 'tax_due_usd', 'unmatched_qty'])
+
+
+class LotStore(object):
+
+    # LotStore keeps the acquisition lots still held for each asset, oldest first, as asset -> [TaxLot]
+    # with a path, it's loaded from and saved to a JSON file (saving replaces the file in one step)
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.lots = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as lot_file:
+                for asset, lots in json.load(lot_file).items():
+                    self.lots[asset] = [TaxLot(lot[0], Decimal(lot[1]), Decimal(lot[2])) for lot in lots]
+
+    def add(self, asset: str, lot: TaxLot):
+        lots = self.lots.setdefault(asset, [])
+        lots.append(lot)
+        if len(lots) > 1 and lots[-2].acquired_at > lot.acquired_at:
+            lots.sort(key=lambda held_lot: held_lot.acquired_at)
+
+    def get(self, asset: str) -> list:
+        return self.lots.get(asset, [])
+
+    def replace(self, asset: str, lots: list):
+        if lots:
+            self.lots[asset] = sorted(lots, key=lambda held_lot: held_lot.acquired_at)
+        else:
+            self.lots.pop(asset, None)
+
+    def save(self):
+        if self.path is None:
+            return
+        json_lots = {asset: [[lot.acquired_at, str(lot.qty), str(lot.unit_cost_usd)] for lot in lots]
+                     for asset, lots in self.lots.items()}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as lot_file:
+            json.dump(json_lots, lot_file)
+        os.replace(temp_path, self.path)
+
+
+class _LotMatcher(object):
+
+    # hands out one asset's lots to disposals in the order the matching method says
+    # disposals have to be given in time order, and only lots acquired by the time of a disposal can match it
+    # FIFO takes the oldest lot first, LIFO the newest, HIFO the one with the highest cost basis
+
+    def __init__(self, lots: list, method: str):
+        self.method = method
+        self._pending = deque(sorted(lots, key=lambda lot: lot.acquired_at))
+        self._available = deque() if method == 'FIFO' else []
+        self._counter = 0  # keeps heap entries from ever comparing two lots
+
+    def take(self, qty: Decimal, disposed_at: int) -> Tuple[list, Decimal]:
+        while self._pending and self._pending[0].acquired_at <= disposed_at:
+            self._push(self._pending.popleft())
+        matches = []
+        while qty > decimal_zero and self._available:
+            lot = self._pop()
+            taken = min(lot.qty, qty)
+            matches.append((lot, taken))
+            qty -= taken
+            if taken < lot.qty:
+                self._push(lot._replace(qty=lot.qty - taken), put_back=True)
+        return matches, qty
+
+    def remaining(self) -> list:
+        if self.method == 'HIFO':
+            available = [entry[3] for entry in self._available]
+        else:
+            available = list(self._available)
+        return available + list(self._pending)
+
+    def _push(self, lot: TaxLot, put_back: bool = False):
+        if self.method == 'HIFO':
+            self._counter += 1
+            heapq.heappush(self._available, (-lot.unit_cost_usd, lot.acquired_at, self._counter, lot))
+        elif self.method == 'FIFO' and put_back:
+            self._available.appendleft(lot)
+        else:
+            self._available.append(lot)
+
+    def _pop(self) -> TaxLot:
+        if self.method == 'HIFO':
+            return heapq.heappop(self._available)[3]
+        if self.method == 'FIFO':
+            return self._available.popleft()
+        return self._available.pop()
+
+
+class TaxEngine(object):
+
+    # TaxEngine works out US capital gains on disposals by matching them against the acquisition lots in lot_store
+    # method: 'FIFO', 'LIFO' or 'HIFO'. the part of a gain from lots held longer than LONG_TERM_DAYS is long term
+    # usd_assets are treated as cash, so trading into them isn't an acquisition and spending them isn't a disposal
+    # precision is how many digits batches get worked out to, None keeps the module's 100
+
+    LONG_TERM_DAYS = 365
+    METHODS = ('FIFO', 'LIFO', 'HIFO')
+
+    def __init__(self, lot_store: LotStore = None, method: str = 'FIFO', short_term_rate: Decimal = Decimal('0.3'),
+                 long_term_rate: Decimal = Decimal('0.16'),
+                 usd_assets: tuple = ('USDC', 'USDT', 'TUSD', 'PAX', 'USDS', 'BUSD'), precision: int = None):
+        if lot_store is None:
+            lot_store = LotStore()
+        self.lot_store = lot_store
+        self.method = method.upper()
+        self.short_term_rate = short_term_rate
+        self.long_term_rate = long_term_rate
+        self.usd_assets = frozenset(usd_assets)
+        self.precision = precision
+
+    def record_acquisition(self, asset: str, qty: Decimal, cost_usd: Decimal, acquired_at: int = None):
+        if acquired_at is None:
+            acquired_at = int(time.time() * 1000)
+        self.lot_store.add(asset, TaxLot(acquired_at, qty, cost_usd / qty))
+
+    # plan_disposal() returns the TaxLiability of selling qty of asset for proceeds_usd without using up any lots
+    def plan_disposal(self, asset: str, qty: Decimal, proceeds_usd: Decimal, disposed_at: int = None,
+                      method: str = None) -> TaxLiability or tuple:
+        if disposed_at is None:
+            disposed_at = int(time.time() * 1000)
+        liabilities = self.compute_batch([Disposal(asset, qty, proceeds_usd, disposed_at)], method=method)
+        if not isinstance(liabilities, list):
+            return liabilities
+        return liabilities[0]
+
+    # compute_batch() returns a TaxLiability for every Disposal, in the order given. disposals are matched in time
+    # order, each asset's lots only get sorted once, so thousands of disposals take one pass
+    # with commit=True the lots used up are removed from lot_store and it's saved
+    # returns ('invalidMethod',) if the method isn't one of METHODS
+    def compute_batch(self, disposals: list, method: str = None, commit: bool = False) -> list or tuple:
+        method = (method or self.method).upper()
+        if method not in self.METHODS:
+            return tuple(['invalidMethod'])
+        with decimal.localcontext() as context:
+            if self.precision is not None:
+                context.prec = self.precision
+            return self._compute_batch(disposals, method, commit)
+
+    def _compute_batch(self, disposals: list, method: str, commit: bool) -> list:
+        matchers = {}
+        liabilities = [None] * len(disposals)
+        for index in sorted(range(len(disposals)), key=lambda i: disposals[i].disposed_at):
+            disposal = disposals[index]
+            if disposal.asset not in matchers:
+                matchers[disposal.asset] = _LotMatcher(self.lot_store.get(disposal.asset), method)
+            matches, unmatched_qty = matchers[disposal.asset].take(disposal.qty, disposal.disposed_at)
+            liabilities[index] = self._get_liability(disposal, matches, unmatched_qty)
+        if commit:
+            for asset, matcher in matchers.items():
+                self.lot_store.replace(asset, matcher.remaining())
+            self.lot_store.save()
+        return liabilities
+
+    # ingest_fills() turns FillLedger entries into acquisitions and disposals, and commits the disposals
+    # usd_value is a function taking an entry that returns the trade's value in USD, or None to skip the entry
+    # returns the TaxLiability of each disposal
+    def ingest_fills(self, entries: list, usd_value) -> list or tuple:
+        disposals = []
+        for entry in entries:
+            if entry['acquired_qty'] <= decimal_zero or entry['spent_qty'] <= decimal_zero:
+                continue
+            trade_value_usd = usd_value(entry)
+            if trade_value_usd is None:
+                continue
+            if entry['acquired_asset'] not in self.usd_assets:
+                self.record_acquisition(entry['acquired_asset'], entry['acquired_qty'], trade_value_usd, entry['time'])
+            if entry['spent_asset'] not in self.usd_assets:
+                disposals.append(Disposal(entry['spent_asset'], entry['spent_qty'], trade_value_usd, entry['time']))
+        return self.compute_batch(disposals, commit=True)
+
+    # get_totals() nets the gains of a batch of liabilities against each other, returning
+    # (short term gain, long term gain, tax due), the way they'd add up on a tax return
+    def get_totals(self, liabilities: list) -> Tuple[Decimal, Decimal, Decimal]:
+        short_term_gain = sum((liability.short_term_gain for liability in liabilities), decimal_zero)
+        long_term_gain = sum((liability.long_term_gain for liability in liabilities), decimal_zero)
+        return short_term_gain, long_term_gain, self._get_tax(short_term_gain, long_term_gain)
+
+    def _get_liability(self, disposal: Disposal, matches: list, unmatched_qty: Decimal) -> TaxLiability:
+        long_term_ms = self.LONG_TERM_DAYS * 24 * 60 * 60 * 1000
+        unit_proceeds = disposal.proceeds_usd / disposal.qty
+        cost_basis = decimal_zero
+        short_term_gain = unmatched_qty * unit_proceeds
+        long_term_gain = decimal_zero
+        for lot, qty in matches:
+            lot_cost = qty * lot.unit_cost_usd
+            cost_basis += lot_cost
+            if disposal.disposed_at - lot.acquired_at > long_term_ms:
+                long_term_gain += qty * unit_proceeds - lot_cost
+            else:
+                short_term_gain += qty * unit_proceeds - lot_cost
+        return TaxLiability(disposal.asset, disposal.qty, disposal.proceeds_usd, cost_basis, short_term_gain,
+                            long_term_gain, self._get_tax(short_term_gain, long_term_gain), unmatched_qty)
+
+    # losses offset gains, but there's no tax due below zero
+    def _get_tax(self, short_term_gain: Decimal, long_term_gain: Decimal) -> Decimal:
+        return max(decimal_zero, short_term_gain * self.short_term_rate + long_term_gain * self.long_term_rate)
+
+
+# how Binance.execute_sliced_trade() splits an order: slices is how many child orders, or None to use as few as keep
+# each child's slippage on the book under max_slippage (but no more than max_slices). interval is how many seconds
+# to wait between children for the book to refill, sleep is what does the waiting
+SliceSchedule = namedtuple('SliceSchedule', ['slices', 'max_slippage', 'max_slices', 'interval', 'sleep'],
+                           defaults=(None, Decimal('0.002'), 20, 5.0, time.sleep))
+# one child order of a sliced trade: expected_price is what the book said it would average just before it was placed,
+# slippage is how much worse its average price was than the price when the trade started (the arrival price)
+# error is what execute_trade() returned if it failed, in which case most of the rest is None
+ChildFill = namedtuple('ChildFill', ['qty', 'acquired', 'expected_price', 'average_price', 'slippage', 'order_id',
+                                     'error'])
+SliceReport = namedtuple('SliceReport', ['pairing', 'side', 'requested_qty', 'executed_qty', 'acquired',
+                                         'arrival_price', 'average_price', 'slippage', 'children'])
+# one asset of a Binance.value_portfolio(): price_usdc is what one unit is worth, route is the RouteHops it was
+# priced along, and depth_aware is whether it was valued by simulating the sale through the book instead of at
+# the best prices
+AssetValue = namedtuple('AssetValue', ['asset', 'qty', 'price_usdc', 'value_usdc', 'route', 'depth_aware'])
+# assets are largest value first, unpriced is (asset, qty, why) for the ones that couldn't be valued
+PortfolioValue = namedtuple('PortfolioValue', ['total_usdc', 'assets', 'unpriced'])
+# one order for Binance.execute_batch(), with the same arguments as execute_trade()
+PlannedTrade = namedtuple('PlannedTrade', ['pairing', 'qty', 'side'])
+# what execute_batch() did with a PlannedTrade. tax_asset is the asset the order disposes of (None if it spends
+# dollars or taxes weren't paid), tax_due_usd is the order's share of the tax on that asset, tax_paid_usdc its share of
+# the USDC the asset's conversion got, and trade is what execute_trade() returned, or the error that stopped it
+BatchOrderResult = namedtuple('BatchOrderResult', ['order', 'tax_asset', 'tax_due_usd', 'tax_paid_usdc', 'trade'])
 
 
 class Binance(Exchange):
     # https://github.com/binance-exchange/binance-official-api-docs/blob/master/rest-api.md
 
-    def __init__(self, api_token: str = None, api_token_secret: str = None):
-        super().__init__(api_token, api_token_secret)
-        self.API_URL = 'https://api.binance.com/api/'
+    VENUE = 'binance'
+    FEE_RATE = Decimal('0.001')  # the standard spot fee, without BNB discounts
+
+    # oddly, these return as valid pairings from exchangeInfo when they are not
+    INVALID_PAIRINGS = ('USDCBTC', 'USDCBNB', 'USDCUSDT', 'USDCTUSD', 'USDCPAX')
+
+    # request weight of each endpoint, v1/depth is worked out from its limit in _get_depth_weight()
+    ENDPOINT_WEIGHTS = {
+        'v1/exchangeInfo': 1,
+        'v3/account': 5,
+        'v3/order': 1,
+        'v3/ticker/bookTicker': 2,  # for every symbol at once
+        'v3/klines': 2,
+    }
+    WEIGHT_LIMIT = 1200  # per minute
+    # the depth limits quotes choose from, and how many times over the spend the levels fetched have to have
+    # covered last time for a limit to be chosen (see _get_depth_limit())
+    DEPTH_LIMITS = (20, 100, 500, 1000)
+    DEPTH_MARGIN = 2
+    # how many seconds the book tickers are reused for when ranking routes through books that aren't mirrored
+    BOOK_TICKER_TTL = 10
+
+    # exchange_info can be passed in to share one metadata snapshot between several Binance instances
+    # otherwise with an exchange_info_cache path, the snapshot is kept in that file between runs and refreshed in the
+    # background once it's stale (see ExchangeInfoCache)
+    # api_url or transport can be passed in to talk to something other than the live API
+    # with a depth_feed, order books get mirrored locally the first time they're quoted (see OrderBookManager)
+    # otherwise quotes fetch snapshots only as deep as the spend needs, going by how deep it had to go last time
+    # every executed order is recorded in fill_ledger, which only lives in memory unless one with a path is passed in
+    # balances are answered from an AccountState kept current by user_data_feed, without one it's resynced
+    # once it's older than account_max_age seconds
+    # tax_engine keeps the acquisition lots that planned sales get matched against, executed fills are added to it
+    # numeric_backend: 'decimal', or 'fixed' to simulate fills with ScaledQuantizer integers and work out taxes
+    # at 34 digits of precision instead of 100
+    # metrics gets passed on to the default transport, exchange_info and account, see Metrics
+    # impact_model is the ImpactModel that spends deeper than the fetched book are estimated with
+    # kline_store is a KlineStore of price history, for working out cost bases and valuing fills at the time they
+    # happened (see get_historical_price_usd())
+    def __init__(self, api_token: str = None, api_token_secret: str = None,
+                 exchange_info: ExchangeInfo = None, exchange_info_ttl: float = 600.0,
+                 transport: HTTPTransport = None, api_url: str = 'https://api.binance.com/api/',
+                 depth_feed=None, fill_ledger: FillLedger = None, user_data_feed=None,
+                 account_max_age: float = 60.0, tax_engine: TaxEngine = None, numeric_backend: str = 'decimal',
+                 metrics: Metrics = None, exchange_info_cache: str = None, impact_model: ImpactModel = None,
+                 kline_store: KlineStore = None):
+        super().__init__(api_token, api_token_secret, transport, metrics)
+        self.API_URL = api_url
         self.headers = {
             'X-MBX-APIKEY': self.api_token
         }
+        if self.transport is None:
+            self.transport = HTTPTransport(self.API_URL, weight_limit=self.WEIGHT_LIMIT,
+                                           endpoint_weights=self.ENDPOINT_WEIGHTS, metrics=self.metrics)
+        if exchange_info is None:
+            cache = None
+            if exchange_info_cache is not None:
+                cache = ExchangeInfoCache(exchange_info_cache, source=self.API_URL)
+            exchange_info = ExchangeInfo(self._fetch_exchange_info, ttl=exchange_info_ttl,
+                                         invalid_pairings=self.INVALID_PAIRINGS, metrics=self.metrics, cache=cache,
+                                         background_refresh=cache is not None)
+        self.exchange_info = exchange_info
+        self.order_books = OrderBookManager(self._fetch_depth_snapshot, feed=depth_feed)
+        self.router = ConversionRouter(self.exchange_info, fee_rate=self.fee_rate, spread_source=self._get_spread)
+        if fill_ledger is None:
+            fill_ledger = FillLedger()
+        self.fill_ledger = fill_ledger
+        self.account = AccountState(self._fetch_account_snapshot, feed=user_data_feed,
+                                    max_age=account_max_age if user_data_feed is None else None, metrics=self.metrics)
+        self.numeric_backend = numeric_backend
+        if tax_engine is None:
+            tax_engine = TaxEngine(precision=34 if numeric_backend == 'fixed' else None)
+        self.tax_engine = tax_engine
+        if impact_model is None:
+            impact_model = ImpactModel()
+        self.impact_model = impact_model
+        self._depth_profiles = {}
+        self._depth_profiles_lock = threading.Lock()
+        self._order_books_lock = threading.Lock()
+        self._book_tickers, self._book_tickers_at = None, None
+        self._book_tickers_lock = threading.Lock()
+        self.kline_store = kline_store
+
+    @_traced
+    def _fetch_exchange_info(self, headers: dict = None):
+        return self.transport.get('v1/exchangeInfo', headers=headers)
+
+    @_traced
+    def _fetch_klines(self, pairing: str, interval: str, start_time: int, end_time: int, limit: int = 1000):
+        return self.transport.get('v3/klines', params={'symbol': pairing, 'interval': interval,
+                                                       'startTime': start_time, 'endTime': end_time, 'limit': limit})
+
+    # the klines as a list, or the status code if the request fails. this is the fetch for KlineStore.backfill()
+    def _get_klines(self, pairing: str, interval: str, start_time: int, end_time: int,
+                    limit: int = 1000) -> list or int:
+        response = self._fetch_klines(pairing, interval, start_time, end_time, limit)
+        if response.status_code >= 400:
+            return response.status_code
+        return response.json()
+
+    @_traced
+    def _fetch_book_tickers(self):
+        return self.transport.get('v3/ticker/bookTicker')
+
+    @_traced
+    def _fetch_account_snapshot(self):
+        query_string = 'timestamp=' + str(int(time.time()) * 1000)
+        sig = self.get_signature(query_string)
+        return self.transport.get('v3/account?' + query_string + '&signature=' + sig, headers=self.headers)
+
+    @_traced
+    def _fetch_depth_snapshot(self, pairing: str, limit: int = 1000):
+        return self.transport.get('v1/depth', params={'symbol': pairing, 'limit': limit},
+                                  weight=self._get_depth_weight(limit))
 
-    # takes a Decimal and returns it with 6 decimal places, rounded up or down depending on round_direction
-    # round_direction: ROUND_DOWN, ROUND_UP
     @staticmethod
-    def format_a_decimal(dec: Decimal, lot_size: str, round_direction: str = 'ROUND_DOWN') -> Decimal:
-        lot_size = Decimal(lot_size)
-        return Decimal(dec.quantize(Decimal(lot_size), rounding=round_direction))
+    def _get_depth_weight(limit: int) -> int:
+        if limit <= 100:
+            return 1
+        if limit <= 500:
+            return 5
+        if limit <= 1000:
+            return 10
+        return 50
 
     # Binance gets its own get_tax_due() because it only works with up to 6 decimal places, so it needs
     # to be formatted as such
-    def get_tax_due(self, spend_total_usd: Decimal, cost_basis_usd: Decimal = None, term: str = 'short') \
-            -> Decimal or str:
-        return self.format_a_decimal(super().get_tax_due(spend_total_usd, cost_basis_usd, term),
-                                     lot_size='.01', round_direction='ROUND_UP')
+    # without a cost_basis_usd, if the asset, qty and when it was acquired (acquired_at, in milliseconds) are given,
+    # the cost basis is what qty was worth then, from kline_store (see get_historical_price_usd())
+    # a sale at a loss owes nothing, the same as in TaxEngine, rather than a negative amount to trade
+    def get_tax_due(self, spend_total_usd: Decimal, cost_basis_usd: Decimal = None, term: str = 'short',
+                    asset: str = None, qty: Decimal = None, acquired_at: int = None) -> Decimal or str:
+        if cost_basis_usd is None and asset is not None and qty is not None and acquired_at is not None:
+            unit_cost_usd = self.get_historical_price_usd(asset, acquired_at)
+            if unit_cost_usd is not None:
+                cost_basis_usd = qty * unit_cost_usd
+        tax_due_usd = super().get_tax_due(spend_total_usd, cost_basis_usd, term)
+        if not isinstance(tax_due_usd, Decimal):
+            return tax_due_usd
+        return self.format_a_decimal(max(decimal_zero, tax_due_usd), lot_size='.01', round_direction='ROUND_UP')
         # LOT_SIZE of .01 here because although though usdc supports more decimal places,
         # this will be getting rounded up for the tax man anyway
 
+    # get_historical_price_usd() returns what one unit of asset was worth in USD at time at (milliseconds), from the
+    # candles in kline_store, or None if there's no kline_store or it doesn't have the candles. assets without a
+    # USDC pairing are priced along the router's routes (XMR through XMRBTC and BTCUSDC, say), cheapest route first,
+    # using the first one that every candle needed is stored for
+    def get_historical_price_usd(self, asset: str, at: int) -> Decimal or None:
+        asset = asset.upper()
+        if asset in self.tax_engine.usd_assets:
+            return Decimal(1)
+        if self.kline_store is None:
+            return None
+        for route in self.router.get_routes(asset):
+            price = Decimal(1)
+            for hop in route:
+                hop_price = self.kline_store.get_price(hop.pairing, at)
+                if hop_price is None or hop_price == decimal_zero:
+                    price = None
+                    break
+                price = price * hop_price if hop.side == 'sell' else price / hop_price
+            if price is not None:
+                return price
+        return None
+
+    # backfill_prices() fills kline_store with the candles that get_historical_price_usd() needs for each asset,
+    # every pairing along its cheapest route to USDC, from start_time up to end_time (now by default)
+    # source is the fetch for KlineStore.backfill(), the klines endpoint unless it's something like a
+    # KlineFixtureSource. returns True, the status code of a failed fetch, or ('noKlineStore',)
+    @_traced
+    def backfill_prices(self, assets, start_time: int, end_time: int = None, source=None) -> bool or int or tuple:
+        if self.kline_store is None:
+            return tuple(['noKlineStore'])
+        if source is None:
+            source = self._get_klines
+        pairings = []
+        for asset in assets:
+            route = self.router.get_route(asset.upper())
+            for hop in route or ():
+                if hop.pairing not in pairings:
+                    pairings.append(hop.pairing)
+        for pairing in pairings:
+            filled = self.kline_store.backfill(pairing, source, start_time, end_time)
+            if filled is not True:
+                return filled
+        return True
+
+    # record_acquisition() adds qty of asset acquired at acquired_at (milliseconds) to tax_engine's lots, for
+    # holdings that weren't bought through this program. without cost_usd, the cost is what qty was worth then
+    # returns True, or ('noHistoricalPrice',) if it can't be priced
+    def record_acquisition(self, asset: str, qty: Decimal, acquired_at: int,
+                           cost_usd: Decimal = None) -> bool or tuple:
+        asset = asset.upper()
+        if cost_usd is None:
+            unit_cost_usd = self.get_historical_price_usd(asset, acquired_at)
+            if unit_cost_usd is None:
+                return tuple(['noHistoricalPrice'])
+            cost_usd = qty * unit_cost_usd
+        self.tax_engine.record_acquisition(asset, qty, cost_usd, acquired_at)
+        return True
+
     # The following functions work with information from Binance using the following formats:
 
     #   Examples:
@@ -91,67 +2725,294 @@ class Binance(Exchange):
     # with 'ETHUSDC' as 'pairing' in get_pairing_converted_value():
     # side = 'buy' to convert USDC value to ETH value
     # side = 'sell' to convert ETH value to USDC value
-    # API seems to only return the order books about 1,000,000 USD deep
-    # TODO make this function estimate spends for crazy large amounts quickly
+    # API seems to only return the order books about 1,000,000 USD deep, so anything deeper returns
+    # ('insufficientDepth',). estimate_pairing_converted_value() estimates those by extrapolating the book with
+    # impact_model, marked as estimates, for callers that can use one
+    @_traced
     def get_pairing_converted_value(self, pairing: str, spend_amount: Decimal, side: str = 'buy') -> tuple:
+        converted_values = self.get_pairing_converted_values(pairing, [spend_amount], side)
+        if not isinstance(converted_values, list):
+            return converted_values
+        if converted_values[0] is None:
+            return tuple(['insufficientDepth'])
+        return converted_values[0]
+
+    # get_pairing_converted_values() does the same as get_pairing_converted_value() for any number of spend amounts
+    # at once, reading the book only one time. returns a list with a (qty, asset) tuple for each spend amount
+    # amounts deeper than the book get None, or with extrapolate=True they're estimated instead (an amount that would
+    # sell the price down to nothing still gets None)
+    @_traced
+    def get_pairing_converted_values(self, pairing: str, spend_amounts: list, side: str = 'buy',
+                                     extrapolate: bool = False) -> list or tuple:
+        side = side.lower()
+        pairing = pairing.upper()
+        fills = self.simulate_fills(pairing, spend_amounts, side, extrapolate=extrapolate)
+        if not isinstance(fills, list):
+            return fills
+        return [self._format_fill(pairing, side, fill) for fill in fills]
+
+    # turns a SimulatedFill into the (qty, asset) tuple get_pairing_converted_value() returns
+    def _format_fill(self, pairing: str, side: str, fill: SimulatedFill or None) -> tuple or None:
+        if fill is None:
+            return None
+        quote, base = self.split_a_pairing(pairing)
+        acquired_asset = quote if side == 'buy' else base
+        lot_size = self._get_pairing_lot_size(pairing=pairing, side=side)
+        return self.format_a_decimal(dec=fill.acquired, lot_size=lot_size), acquired_asset
+
+    # get_average_price() returns (average price, slippage from the best price) of trading qty of the pairing's first
+    # asset on side, None if the book isn't deep enough. a sell is fetched only as deep as qty needs, a buy spends an
+    # amount of the second asset that isn't known until the book's been read, so it's quoted from the deepest book
+    @_traced
+    def get_average_price(self, pairing: str, qty: Decimal, side: str = 'buy') -> tuple or None:
+        pairing = pairing.upper()
+        side = side.lower()
+        input_check = self._input_check(pairing=pairing, side=side, qty=qty)
+        if input_check is not True:
+            return input_check
+        simulator = self._get_fill_simulator(pairing, side, qty if side == 'sell' else None)
+        if isinstance(simulator, int):
+            return simulator
+        return simulator.get_average_price(qty)
+
+    # estimate_pairing_converted_value() is get_pairing_converted_value() with the confidence band of the estimate:
+    # (qty, asset, low qty, high qty). low and high are the same as qty when the book covers the spend
+    # returns ('insufficientDepth',) if the spend would sell the price down to nothing
+    @_traced
+    def estimate_pairing_converted_value(self, pairing: str, spend_amount: Decimal, side: str = 'buy') -> tuple:
         side = side.lower()
         pairing = pairing.upper()
-        book = None
         input_check = self._input_check(pairing=pairing, side=side, qty=spend_amount)
         if input_check is not True:
             return input_check
-        if side == 'buy':
-            book = 'asks'
-        if side == 'sell':
-            book = 'bids'
-        api_url = self.API_URL + "v1/depth"
-        orders = requests.get(api_url, params={'symbol': pairing, 'limit': 1000})
-        if orders.status_code >= 400:
-            return orders.status_code
-        running_cost = decimal_zero
-        qty_counter = decimal_zero
-        quote, base = self.split_a_pairing(pairing)
+        simulator = self._get_fill_simulator(pairing, side, spend_amount)
+        if isinstance(simulator, int):
+            return simulator
+        estimate = simulator.estimate(spend_amount, self.impact_model)
+        if estimate is None:
+            return tuple(['insufficientDepth'])
+        qty, asset = self._format_fill(pairing, side, estimate)
         lot_size = self._get_pairing_lot_size(pairing=pairing, side=side)
-        for order in orders.json()[book]:
-            order_0, order_1 = Decimal(order[0]), Decimal(order[1])
-            cost = order_0 * order_1
-            if side == 'buy':
-                if cost + running_cost >= spend_amount:
-                    left_to_spend = spend_amount - running_cost
-                    remaining_qty_to_buy = left_to_spend/order_0
-                    total_bought = qty_counter + remaining_qty_to_buy
-                    total_bought = self.format_a_decimal(dec=total_bought, lot_size=lot_size)
-                    return total_bought, quote
-                running_cost += cost
-                qty_counter += order_1
-            if side == 'sell':
-                if order_1 + running_cost >= spend_amount:
-                    left_to_spend = spend_amount - running_cost
-                    remaining_qty_to_buy = order_0 * left_to_spend
-                    total_bought = qty_counter + remaining_qty_to_buy
-                    total_bought = self.format_a_decimal(dec=total_bought, lot_size=lot_size)
-                    return total_bought, base
-                running_cost += order_1
-                qty_counter += cost
+        return qty, asset, self.format_a_decimal(estimate.low, lot_size=lot_size), \
+            self.format_a_decimal(estimate.high, lot_size=lot_size)
+
+    # simulate_fills() returns a SimulatedFill for each spend amount (see FillSimulator), unrounded
+    # with extrapolate=True, amounts deeper than the book get a DepthEstimate from impact_model instead of None
+    @_traced
+    def simulate_fills(self, pairing: str, spend_amounts: list, side: str = 'buy',
+                       extrapolate: bool = False) -> list or tuple or int:
+        side = side.lower()
+        pairing = pairing.upper()
+        if not spend_amounts:
+            return []
+        input_check = self._input_check(pairing=pairing, side=side, qty=min(spend_amounts))
+        if input_check is not True:
+            return input_check
+        simulator = self._get_fill_simulator(pairing, side, max(spend_amounts))
+        if isinstance(simulator, int):
+            return simulator
+        return simulator.simulate(spend_amounts, self.impact_model if extrapolate else None)
+
+    # _get_fill_simulator() returns a FillSimulator for the side of the pairing's book, from the local mirror if
+    # it's being tracked, otherwise from a snapshot as deep as spend_amount needs (see _get_depth_limit()). if that
+    # turns out not to be deep enough, the deepest snapshot is fetched instead
+    def _get_fill_simulator(self, pairing: str, side: str, spend_amount: Decimal = None) -> FillSimulator or int:
+        quantizer = None
+        if self.numeric_backend == 'fixed':
+            quantizer = self.exchange_info.get_quantizer(pairing)
+        local_book = self._get_local_book(pairing)
+        if local_book is not None:
+            return local_book.get_fill_simulator(side, quantizer)
+        book = 'asks' if side == 'buy' else 'bids'
+        limit = self._get_depth_limit(pairing, side, spend_amount)
+        while True:
+            snapshot = self._get_depth_snapshot(pairing, limit)
+            if isinstance(snapshot, int):
+                return snapshot
+            if quantizer is not None:
+                simulator = FixedPointFillSimulator(snapshot.get_levels(book), side, quantizer)
+            else:
+                simulator = FillSimulator(snapshot.get_levels(book), side)
+            if spend_amount is None or simulator.covers(spend_amount) or limit == self.DEPTH_LIMITS[-1]:
+                break
+            limit = self.DEPTH_LIMITS[-1]
+        if spend_amount is not None:
+            self._record_depth(pairing, side, simulator, limit, spend_amount)
+        return simulator
+
+    # _get_depth_limit() picks the smallest depth limit whose levels covered DEPTH_MARGIN times spend_amount the
+    # last time that many were parsed on this side of the pairing. the deepest one the first time, or without a
+    # spend_amount
+    def _get_depth_limit(self, pairing: str, side: str, spend_amount: Decimal = None) -> int:
+        with self._depth_profiles_lock:
+            profile = self._depth_profiles.get((pairing, side))
+            if profile is not None and spend_amount is not None:
+                for limit in self.DEPTH_LIMITS[:-1]:
+                    spent_total = profile.get(limit)
+                    if spent_total is not None and spent_total >= spend_amount * self.DEPTH_MARGIN:
+                        return limit
+        return self.DEPTH_LIMITS[-1]
+
+    # _record_depth() notes what the first DEPTH_LIMITS levels of the book can fill, parsing down through them until
+    # one covers DEPTH_MARGIN times spend_amount, so the next quote like it can tell which snapshot would do
+    # a book shorter than the limit fetched is all there is, so its total counts for every limit
+    # the profile is worked out on the side and swapped in under the lock, since AsyncBinance records from its pool
+    def _record_depth(self, pairing: str, side: str, simulator: FillSimulator, fetched_limit: int,
+                      spend_amount: Decimal):
+        with self._depth_profiles_lock:
+            profile = dict(self._depth_profiles.get((pairing, side), {}))
+        for limit in self.DEPTH_LIMITS:
+            if limit > fetched_limit:
+                break
+            simulator.parse_levels(limit)
+            spent_total = simulator.get_spent_total(limit)
+            if spent_total is None:
+                if not simulator.prices or len(simulator.prices) >= fetched_limit:
+                    break
+                spent_total = simulator.get_spent_total(len(simulator.prices))  # the whole book
+                for shorter_limit in self.DEPTH_LIMITS:
+                    if shorter_limit >= limit:
+                        profile[shorter_limit] = spent_total
+                break
+            profile[limit] = spent_total
+            if spent_total >= spend_amount * self.DEPTH_MARGIN:
+                break
+        with self._depth_profiles_lock:
+            self._depth_profiles.setdefault((pairing, side), {}).update(profile)
+
+    # _get_book_levels() returns one side of a pairing's book, from the local mirror if it's being tracked,
+    # otherwise from a fresh snapshot (lazily parsed, see DepthSnapshot). returns the status code if the snapshot
+    # request fails
+    # book: 'bids' or 'asks'
+    def _get_book_levels(self, pairing: str, book: str) -> list or int:
+        local_book = self._get_local_book(pairing)
+        if local_book is not None:
+            return local_book.get_levels(book)
+        return self._get_snapshot_levels(pairing, book)
+
+    # the same, always from a fresh snapshot
+    def _get_snapshot_levels(self, pairing: str, book: str):
+        snapshot = self._get_depth_snapshot(pairing)
+        if isinstance(snapshot, int):
+            return snapshot
+        return snapshot.get_levels(book)
+
+    # _get_depth_snapshot() fetches limit levels of the pairing's book as a DepthSnapshot, or returns the status
+    # code if the request fails
+    def _get_depth_snapshot(self, pairing: str, limit: int = 1000) -> DepthSnapshot or int:
+        response = self._fetch_depth_snapshot(pairing, limit)
+        if response.status_code >= 400:
+            return response.status_code
+        return DepthSnapshot(pairing, response.content, limit)
+
+    # with a depth feed, a pairing starts being tracked the first time its book is needed
+    # tracking and syncing happen under a lock, since AsyncBinance can get here from several pool threads at once
+    def _get_local_book(self, pairing: str) -> OrderBook or None:
+        with self._order_books_lock:
+            if self.order_books.feed is not None and not self.order_books.is_tracked(pairing):
+                self.order_books.track(pairing)
+            local_book = self.order_books.get_book(pairing)
+        if self.metrics.enabled:
+            self.metrics.record_cache('order_book', local_book is not None)
+        return local_book
 
     # get_price_usdc() is like a get_pairing_price(), except it is exclusively USDC, and if a pairing
-    # doesn't exist, it uses BTC as a go between and returns the appropriate values as though it did
-    # so now we can get a USDC price for every asset available on Binance
+    # doesn't exist, it converts through the cheapest route the router knows and returns the appropriate values
+    # as though it did, so now we can get a USDC price for every asset available on Binance
     # if symbol is 'XMR': 'buy' means send usdc value return xmr value; 'sell' means send xmr value return usdc value
+    @_traced
     def get_price_usdc(self, symbol: str, qty: Decimal, side: str = 'buy') -> tuple:
         symbol = symbol.upper()
         side = side.lower()
         input_check = self._input_check(None, side, qty, symbol)
         if input_check is not True:
             return input_check
-        path_to_usdc = self._get_pairing_path_to_usdc(symbol=symbol)
-        if len(path_to_usdc) == 1:
-            return self.get_pairing_converted_value(pairing=path_to_usdc[0], spend_amount=qty, side=side)
-        if side == 'sell':
-            btc_qty = self.get_pairing_converted_value(pairing=path_to_usdc[0], spend_amount=qty, side='sell')
-            return self.get_pairing_converted_value(pairing=path_to_usdc[1], spend_amount=btc_qty[0], side='sell')
-        btc_qty = self.get_pairing_converted_value(pairing=path_to_usdc[1], spend_amount=qty, side='buy')
-        return self.get_pairing_converted_value(pairing=path_to_usdc[0], spend_amount=btc_qty[0], side='buy')
+        route = self._get_route_to_usdc(symbol)
+        if route is None:
+            return tuple(['noRouteToUSDC'])
+        if side == 'buy':
+            route = self._reverse_route(route)
+        converted_value = (qty, symbol if side == 'sell' else 'USDC')
+        for hop in route:
+            converted_value = self.get_pairing_converted_value(pairing=hop.pairing, spend_amount=converted_value[0],
+                                                               side=hop.side)
+            if not isinstance(converted_value, tuple) or not isinstance(converted_value[0], Decimal):
+                return converted_value
+        return converted_value
+
+    # _get_route_to_usdc() returns the cheapest route from symbol to USDC as a tuple of RouteHops
+    # the router ranks candidates by fees plus the spreads of mirrored books or book tickers (see _get_spread())
+    # if qty is given and every hop of the top candidates is mirrored locally, the candidates are compared by
+    # simulating selling qty through each of them (net of fees), which accounts for depth as well as spread
+    # depth isn't weighed otherwise, since simulating through snapshots would cost a depth request per hop per route
+    @_traced
+    def _get_route_to_usdc(self, symbol: str, qty: Decimal = None, candidates: int = 3) -> tuple or None:
+        routes = self.router.get_routes(symbol)
+        if not routes:
+            return None
+        routes = routes[:candidates]
+        if qty is None or len(routes) == 1:
+            return routes[0]
+        if not all(self.order_books.is_tracked(hop.pairing) for route in routes for hop in route):
+            return routes[0]
+        best_route, best_usdc = routes[0], None
+        for route in routes:
+            amount = qty
+            for hop in route:
+                fill = self.simulate_fills(hop.pairing, [amount], hop.side)
+                if not isinstance(fill, list) or fill[0] is None:
+                    amount = None
+                    break
+                amount = fill[0].acquired * (1 - self.router.fee_rate)
+            if amount is not None and (best_usdc is None or amount > best_usdc):
+                best_route, best_usdc = route, amount
+        return best_route
+
+    # the best price on the side of a locally mirrored book that an order on side would fill against,
+    # None if the pairing's book isn't mirrored
+    def _get_local_best_price(self, pairing: str, side: str) -> Decimal or None:
+        local_book = self.order_books.books.get(pairing)
+        if local_book is None:
+            return None
+        levels = local_book.get_levels('asks' if side == 'buy' else 'bids')
+        return levels[0][0] if levels else None
+
+    # the router's spread_source. a locally mirrored book is used if there is one, otherwise the pairing's book
+    # ticker, so ranking routes costs at most one bulk ticker request every BOOK_TICKER_TTL seconds
+    # None if neither has the pairing, in which case the router falls back on its default_spread
+    def _get_spread(self, pairing: str) -> Decimal or None:
+        spread = self._get_local_spread(pairing)
+        if spread is not None:
+            return spread
+        ticker = self._get_recent_book_tickers().get(pairing)
+        if ticker is None:
+            return None
+        best_bid, best_ask = ticker
+        return (best_ask - best_bid) / ((best_ask + best_bid) / 2)
+
+    # the spread of the pairing's locally mirrored book, None if it isn't mirrored
+    def _get_local_spread(self, pairing: str) -> Decimal or None:
+        local_book = self.order_books.books.get(pairing)
+        if local_book is None:
+            return None
+        bids, asks = local_book.get_levels('bids'), local_book.get_levels('asks')
+        if not bids or not asks:
+            return None
+        best_bid, best_ask = bids[0][0], asks[0][0]
+        return (best_ask - best_bid) / ((best_ask + best_bid) / 2)
+
+    # the book tickers from the last get_book_tickers(), fetching them again once they're BOOK_TICKER_TTL seconds
+    # old. a failed request counts as an empty set of tickers until the next refetch, so it isn't retried every call
+    def _get_recent_book_tickers(self) -> dict:
+        with self._book_tickers_lock:
+            if self._book_tickers_at is not None and time.time() - self._book_tickers_at < self.BOOK_TICKER_TTL:
+                return self._book_tickers
+        tickers = self.get_book_tickers()
+        if isinstance(tickers, int):
+            with self._book_tickers_lock:
+                self._book_tickers, self._book_tickers_at = {}, time.time()
+            return {}
+        return tickers
 
     # get_balances() takes any number of symbols passed in as parameters, and yields balances in tuples
     # if all_symbols is True, it yields all balances
@@ -159,111 +3020,412 @@ class Binance(Exchange):
     # zero_balances does nothing if all_symbols isn't True
     # sending symbols as *argv parameter with all_symbols turned on and zero balances off results
     # in specified zero balances being displayed along with all nonzero balances
+    # balances come from self.account, call self.account.resync() to force a fresh snapshot
+    @_traced
     def get_balances(self, *args, all_symbols: bool = False, show_zero_balances: bool = False):
-        query_string = 'timestamp=' + str(int(time.time()) * 1000)
-        sig = self.get_signature(query_string)
-        balances = requests.get(self.API_URL + 'v3/account?' +
-                                query_string + '&signature=' + sig, headers=self.headers)
-        if balances.status_code >= 400:
-            return balances.status_code
+        synced = self.account.ensure_synced()
+        if synced is not True:
+            return synced
         if all_symbols:
-            for asset_dict in balances.json()['balances']:
-                return_dec = self.format_a_decimal(Decimal(asset_dict['free']), lot_size='.000001')
+            for asset, (free, locked) in self.account.balances.items():
+                return_dec = self.format_a_decimal(free, lot_size='.000001')
                 if not show_zero_balances and return_dec != decimal_zero:
-                    yield return_dec, asset_dict['asset']
+                    yield return_dec, asset
                 elif show_zero_balances:
-                    yield return_dec, asset_dict['asset']
+                    yield return_dec, asset
         for symbol in args:
             symbol = symbol.upper()
             input_check = self._input_check(None, None, None, symbol)
             if input_check is not True:
                 return input_check
             else:
-                for asset_dict in balances.json()['balances']:
-                    if asset_dict['asset'] == symbol:
-                        yield self.format_a_decimal(Decimal(asset_dict['free']), lot_size='.000001'), symbol
+                balance = self.account.get(symbol)
+                if balance is not None:
+                    yield self.format_a_decimal(balance[0], lot_size='.000001'), symbol
 
-    # make the tax trade(s) before the main trade's function gets called
-    # figures out the necessary trades to convert the given asset to the USDC amount given
-    # then executes those trades using execute_trade()
-    def execute_tax_trade(self, asset_being_sold: str,  tax_due_usd: Decimal) -> tuple:
-        path_to_usdc = self._get_pairing_path_to_usdc(symbol=asset_being_sold)
-        tax_due_as_sym = self.get_price_usdc(symbol=asset_being_sold, qty=tax_due_usd, side='buy')[0]
-        if len(path_to_usdc) == 1:
-            symusdc = path_to_usdc[0]
-            return self.execute_trade(pairing=symusdc, qty=tax_due_as_sym, side='sell')
-        symbtc = path_to_usdc[0]
-        btcusdc = path_to_usdc[1]
-        tax_to_btc = self.execute_trade(pairing=symbtc, qty=tax_due_as_sym, side='sell')[0]
-        return self.execute_trade(pairing=btcusdc, qty=tax_to_btc, side='sell')
-        # format_a_decimal() isn't necessary in either of these conditionals because execute_trade() calls it
-        # before returning
-    #     TODO this is untested, spun it while running a different OS where I don't have my API keys
-    #     TODO add commit description to record on ubuntu
+    # value_portfolio() values the whole account in USDC from one bulk book ticker request, instead of a quote per
+    # asset. each asset is marked at the best bid (or ask, for hops that buy) of every pairing along its route,
+    # trying each of the router's candidate routes and keeping whichever's worth the most, so assets without a USDC
+    # pairing are priced through BTC, ETH and so on without any depth requests
+    # balances maps asset -> qty to value something other than the account. otherwise it's the account's free
+    # balances, plus locked ones if include_locked
+    # depth_aware is how many of the largest positions get valued by simulating selling them through the book
+    # instead (see get_price_usdc()), which costs the depth requests but accounts for slippage
+    # returns a PortfolioValue, or the status code if the ticker or account request fails
+    @_traced
+    def value_portfolio(self, balances: dict = None, include_locked: bool = True,
+                        depth_aware: int = 0) -> PortfolioValue or int:
+        if balances is None:
+            synced = self.account.ensure_synced()
+            if synced is not True:
+                return synced
+            balances = {asset: free + locked if include_locked else free
+                        for asset, (free, locked) in self.account.balances.items()}
+        tickers = self.get_book_tickers()
+        if isinstance(tickers, int):
+            return tickers
+        values, unpriced = [], []
+        for asset, qty in balances.items():
+            if qty <= decimal_zero:
+                continue
+            priced = self._get_ticker_price_usdc(asset, tickers)
+            if priced is None:
+                unpriced.append((asset, qty, 'noRouteToUSDC'))
+                continue
+            price, route = priced
+            values.append(AssetValue(asset, qty, price, qty * price, route, False))
+        values.sort(key=lambda value: value.value_usdc, reverse=True)
+        routed = [index for index, value in enumerate(values) if value.route]  # USDC itself has nothing to sell
+        for index in routed[:depth_aware]:
+            value = values[index]
+            depth_value = self._get_usdc_values(value.asset, [value.qty])[0]
+            if isinstance(depth_value, Decimal):
+                values[index] = AssetValue(value.asset, value.qty, depth_value / value.qty, depth_value,
+                                           value.route, True)
+        total = sum((value.value_usdc for value in values), decimal_zero)
+        return PortfolioValue(self.format_a_decimal(total, lot_size='.01'), tuple(values), tuple(unpriced))
+
+    # get_book_tickers() returns pairing -> (best bid, best ask) as Decimals for every pairing, all from one request
+    # pairings with an empty side are left out. returns the status code if the request fails
+    # the tickers are kept for ranking routes with (see _get_spread())
+    @_traced
+    def get_book_tickers(self) -> dict or int:
+        response = self._fetch_book_tickers()
+        if response.status_code >= 400:
+            return response.status_code
+        tickers = {}
+        for ticker in response.json():
+            bid, ask = Decimal(ticker['bidPrice']), Decimal(ticker['askPrice'])
+            if bid > decimal_zero and ask > decimal_zero:
+                tickers[ticker['symbol']] = (bid, ask)
+        with self._book_tickers_lock:
+            self._book_tickers, self._book_tickers_at = tickers, time.time()
+        return tickers
+
+    # (USDC price of one unit of asset, route it was priced along) using the book tickers, or None if none of the
+    # asset's routes has a ticker for every hop
+    def _get_ticker_price_usdc(self, asset: str, tickers: dict) -> Tuple[Decimal, tuple] or None:
+        best = None
+        for route in self.router.get_routes(asset):
+            price = Decimal(1)
+            for hop in route:
+                ticker = tickers.get(hop.pairing)
+                if ticker is None:
+                    price = None
+                    break
+                price = price * ticker[0] if hop.side == 'sell' else price / ticker[1]
+            if price is not None and (best is None or price > best[0]):
+                best = price, route
+        return best
 
     # execute_trade() actually executes the trade
-    def execute_trade(self, pairing: str, qty: Decimal, side: str = 'buy') -> tuple:
+    # with a schedule, it's split into child orders by execute_sliced_trade(), which returns a SliceReport
+    # in place of binance's response
+    # the order gets checked against the pairing's filters first (see FilterTable.check_order()), and if it doesn't
+    # pass, the names of the filters it fails are returned without sending it. price is what it's expected to fill
+    # at, for the notional and price filters. without one, the best price of a locally mirrored book is used if
+    # there is one, otherwise those are left to binance
+    @_traced
+    def execute_trade(self, pairing: str, qty: Decimal, side: str = 'buy', schedule: SliceSchedule = None,
+                      price: Decimal = None) -> tuple:
+        if schedule is not None:
+            return self.execute_sliced_trade(pairing, qty, side, schedule)
         pairing = pairing.upper()
         side = side.lower()  # make it lower because that's how i made my _input_check() want it
         input_check = self._input_check(pairing=pairing, side=side, qty=qty)
         if input_check is not True:
             return input_check
-        side = side.upper()  # making it upper now to format for insertion into the query string
+        if price is None:
+            price = self._get_local_best_price(pairing, side)
+        order_check = self.exchange_info.filter_table.check_order(pairing, qty, price)
+        if order_check.errors:
+            return order_check.errors
         lot_size = self._get_pairing_lot_size(pairing, side)
-        qty = self.format_a_decimal(qty, lot_size=lot_size)
-        qty = str(qty)
-
-        # split the pairing, determine the balance of the asset being gained,
-        # store the balance compare with new balance after the order is executed
-        # so it can be returned, I don't see a way to do this through Binance API
-        # an alternative approach might've been to use newOrderRespType=FULL below, and
-        # derive it from the 'fills' values, but this seemed easier
+        side = side.upper()  # making it upper now to format for insertion into the query string
+        qty = str(order_check.qty)
+
+        # split the pairing to determine which asset is being gained
+        # newOrderRespType=FULL below has binance return the order's 'fills', so the amount acquired
+        # gets worked out from them instead of comparing balances from before and after
         quote_asset, base_asset = self.split_a_pairing(pairing)
         if side == 'BUY':
             asset_to_use = quote_asset
         else:
             asset_to_use = base_asset
-        bal_before_acquiring = tuple(self.get_balances(asset_to_use))
 
         # construct the query_string and signature
         symbol = 'symbol=' + pairing + '&'
         side = 'side=' + side + '&'
         type_ = 'type=' + 'MARKET&'  # TODO implement limit orders someday maybe
         quantity = 'quantity=' + qty + '&'
-        new_order_resp_type = 'newOrderRespType=RESULT&'
+        new_order_resp_type = 'newOrderRespType=FULL&'
         timestamp = 'timestamp=' + str(int(time.time()) * 1000)
         query_string = symbol + side + type_ + quantity + new_order_resp_type + timestamp
         sig = self.get_signature(query_string)
 
         # POST the order
-        order = requests.post(self.API_URL + 'v3/order?' + query_string + '&signature=' + sig, headers=self.headers)
+        order = self.transport.post('v3/order?' + query_string + '&signature=' + sig, headers=self.headers)
         if order.status_code >= 400:
             return order.status_code
 
-        # parse and return results
+        # parse, record and return results
         result = order.json()
-        bal_after_acquiring = tuple(self.get_balances(asset_to_use))  # returns a Decimal
-        amt_of_asset_acquired = Decimal(bal_after_acquiring[0][0]) - Decimal(bal_before_acquiring[0][0])
-        # these are only casted as Decimal to humor my IDE ^
-        amt_of_asset_acquired = self.format_a_decimal(amt_of_asset_acquired, lot_size=lot_size)
+        ledger_entry = self._get_ledger_entry(result, quote_asset, base_asset)
+        self.fill_ledger.append(ledger_entry)
+        self.account.apply_fill(ledger_entry)
+        self._queue_fill(ledger_entry)
+        amt_of_asset_acquired = self.format_a_decimal(ledger_entry['acquired_qty'], lot_size=lot_size)
         return amt_of_asset_acquired, asset_to_use, result
         # returns a tuple: (Decimal containing amount acquired, asset acquired, binance's response to POST)
 
+    # execute_sliced_trade() splits a market order into child orders spaced schedule.interval seconds apart (see
+    # SliceSchedule), so a large order doesn't take the whole book at once. the book is read again before each child
+    # to know the price it's expected to fill at. stops at the first child that fails
+    # returns (amount acquired, asset acquired, SliceReport), or the error if the first child couldn't be placed
+    @_traced
+    def execute_sliced_trade(self, pairing: str, qty: Decimal, side: str = 'buy',
+                             schedule: SliceSchedule = None) -> tuple:
+        pairing = pairing.upper()
+        side = side.lower()
+        if schedule is None:
+            schedule = SliceSchedule()
+        input_check = self._input_check(pairing=pairing, side=side, qty=qty)
+        if input_check is not True:
+            return input_check
+        book = 'asks' if side == 'buy' else 'bids'
+        levels = self._get_book_levels(pairing, book)
+        if isinstance(levels, int):
+            return levels
+        simulator = FillSimulator(levels, side)
+        if not simulator.prices:
+            return tuple(['emptyBook'])
+        arrival_price = simulator.prices[0]
+        quote_asset, base_asset = self.split_a_pairing(pairing)
+        children = []
+        acquired, executed_qty, quote_qty = decimal_zero, decimal_zero, decimal_zero
+        for number, child_qty in enumerate(self._get_child_qtys(pairing, side, qty, simulator, schedule)):
+            if number > 0:
+                schedule.sleep(schedule.interval)
+                levels = self._get_book_levels(pairing, book)
+                if isinstance(levels, int):
+                    children.append(ChildFill(child_qty, decimal_zero, None, None, None, None, levels))
+                    break
+                simulator = FillSimulator(levels, side)
+            expected = simulator.get_average_price(child_qty)
+            expected_price = expected[0] if expected is not None else None
+            trade = self.execute_trade(pairing=pairing, qty=child_qty, side=side, price=expected_price)
+            if not isinstance(trade, tuple) or not isinstance(trade[0], Decimal):
+                if not children:
+                    return trade
+                children.append(ChildFill(child_qty, decimal_zero, expected_price, None, None, None, trade))
+                break
+            entry = self._get_ledger_entry(trade[2], quote_asset, base_asset)
+            child_slippage = self._get_slippage(side, entry['average_price'], arrival_price)
+            children.append(ChildFill(entry['executed_qty'], trade[0], expected_price, entry['average_price'],
+                                      child_slippage, entry['order_id'], None))
+            acquired += trade[0]
+            executed_qty += entry['executed_qty']
+            quote_qty += entry['quote_qty']
+        average_price = quote_qty / executed_qty if executed_qty != decimal_zero else None
+        slippage = self._get_slippage(side, average_price, arrival_price) if average_price is not None else None
+        report = SliceReport(pairing, side, qty, executed_qty, acquired, arrival_price, average_price, slippage,
+                             tuple(children))
+        return acquired, quote_asset if side == 'buy' else base_asset, report
+
+    # _get_child_qtys() splits qty into schedule.slices child orders, or if that's None, into as few as keep each
+    # child's slippage on the current book under schedule.max_slippage, at most schedule.max_slices. each child is
+    # rounded down to the step size and the last one takes whatever's left
+    def _get_child_qtys(self, pairing: str, side: str, qty: Decimal, simulator: FillSimulator,
+                        schedule: SliceSchedule) -> list:
+        slices = schedule.slices
+        if slices is None:
+            max_child_qty = simulator.get_max_qty(schedule.max_slippage)
+            slices = schedule.max_slices
+            if max_child_qty > decimal_zero:
+                slices = min(int((qty / max_child_qty).to_integral_value(rounding=decimal.ROUND_CEILING)),
+                             schedule.max_slices)
+        slices = max(int(slices), 1)
+        child_qty = self.exchange_info.filter_table.round_qty(pairing, qty / slices)
+        if child_qty == decimal_zero:
+            return [qty]
+        return [child_qty] * (slices - 1) + [qty - child_qty * (slices - 1)]
+
+    # how much worse than price the average price was, as a fraction of price
+    @staticmethod
+    def _get_slippage(side: str, average_price: Decimal, price: Decimal) -> Decimal:
+        if side == 'buy':
+            return (average_price - price) / price
+        return (price - average_price) / price
+
+    # execute_batch() executes a list of PlannedTrades, paying the tax due on all of them with one USDC conversion
+    # per asset disposed of instead of one before every order. the tax on each asset is the batch's gains and
+    # losses in it netted together (see plan_batch_taxes()), and each order is attributed a share of it and of
+    # the USDC the conversion got, in proportion to its own tax. then the trades are executed in the order given
+    # orders disposing of an asset whose conversion failed aren't executed, so nothing is sold without its tax
+    # returns a BatchOrderResult for each order, in the same order
+    @_traced
+    def execute_batch(self, orders: list, pay_tax: bool = True) -> list:
+        orders = [PlannedTrade(order[0].upper(), order[1], order[2].lower()) for order in orders]
+        results = [None] * len(orders)
+        valid = []
+        for index, order in enumerate(orders):
+            input_check = self._input_check(pairing=order.pairing, side=order.side, qty=order.qty)
+            if input_check is not True:
+                results[index] = BatchOrderResult(order, None, decimal_zero, decimal_zero, input_check)
+            else:
+                valid.append(index)
+        liabilities = {}  # order index: TaxLiability
+        if pay_tax:
+            planned = self.plan_batch_taxes([orders[index] for index in valid])
+            for index, liability in zip(valid, planned):
+                if isinstance(liability, TaxLiability):
+                    liabilities[index] = liability
+                elif liability is not None:
+                    results[index] = BatchOrderResult(orders[index], None, decimal_zero, decimal_zero, liability)
+        tax_due = self._net_batch_taxes(liabilities)
+        asset_totals = {}
+        for index, due in tax_due.items():
+            asset = liabilities[index].asset
+            asset_totals[asset] = asset_totals.get(asset, decimal_zero) + due
+        usdc_acquired = {}  # asset: USDC its conversion got, or the error it returned
+        for asset, total in asset_totals.items():
+            total = self.format_a_decimal(total, lot_size='.01', round_direction='ROUND_UP')
+            if total == decimal_zero:
+                usdc_acquired[asset] = decimal_zero
+                continue
+            tax_result = self.execute_tax_trade(asset, tax_due_usd=total)
+            if isinstance(tax_result, tuple) and isinstance(tax_result[0], Decimal):
+                usdc_acquired[asset] = tax_result[0]
+            else:
+                usdc_acquired[asset] = tax_result
+        for index in valid:
+            if results[index] is not None:
+                continue
+            order = orders[index]
+            asset, due, paid = None, decimal_zero, decimal_zero
+            if index in liabilities:
+                asset, due = liabilities[index].asset, tax_due[index]
+                if not isinstance(usdc_acquired[asset], Decimal):
+                    results[index] = BatchOrderResult(order, asset, due, decimal_zero, usdc_acquired[asset])
+                    continue
+                if asset_totals[asset] > decimal_zero:
+                    paid = self.format_a_decimal(usdc_acquired[asset] * due / asset_totals[asset],
+                                                 lot_size='.000001')
+            trade = self.execute_trade(pairing=order.pairing, qty=order.qty, side=order.side)
+            results[index] = BatchOrderResult(order, asset, due, paid, trade)
+        return results
+
+    # plan_batch_taxes() returns the TaxLiability of each PlannedTrade's disposal, matching them against the lots
+    # held one after another (in the order given) so that two orders never use the same lot. a sell disposes of
+    # qty of the quote asset, a buy of the base asset it spends, which is estimated at what selling qty would bring
+    # back. each disposal is valued at the USDC it would get on its own, the books for every pairing involved only
+    # getting read once. returns None for an order that spends dollars, and the error for one that can't be valued
+    def plan_batch_taxes(self, orders: list) -> list:
+        self.ingest_fills()
+        planned = [None] * len(orders)
+        disposals = {}  # order index: (asset, qty)
+        buys = {}  # pairing: [order index]
+        for index, order in enumerate(orders):
+            assets = self.split_a_pairing(order.pairing)
+            if len(assets) != 2:
+                planned[index] = assets
+            elif order.side == 'sell':
+                disposals[index] = (assets[0], order.qty)
+            elif assets[1] not in self.tax_engine.usd_assets:
+                buys.setdefault(order.pairing, []).append(index)
+        for pairing, indexes in buys.items():
+            spent = self.get_pairing_converted_values(pairing, [orders[index].qty for index in indexes], 'sell')
+            base_asset = self.split_a_pairing(pairing)[1]
+            for position, index in enumerate(indexes):
+                if not isinstance(spent, list):
+                    planned[index] = spent
+                elif spent[position] is None:
+                    planned[index] = tuple(['insufficientDepth'])
+                else:
+                    disposals[index] = (base_asset, spent[position][0])
+        by_asset = {}
+        for index, (asset, qty) in disposals.items():
+            if asset not in self.tax_engine.usd_assets:
+                by_asset.setdefault(asset, []).append(index)
+        disposed_at = int(time.time() * 1000)
+        batch, batch_indexes = [], []
+        for asset, indexes in by_asset.items():
+            values = self._get_usdc_values(asset, [disposals[index][1] for index in indexes])
+            for index, value in zip(indexes, values):
+                if isinstance(value, Decimal):
+                    batch.append(Disposal(asset, disposals[index][1], value, disposed_at))
+                    batch_indexes.append(index)
+                else:
+                    planned[index] = value
+        batch_indexes, batch = zip(*sorted(zip(batch_indexes, batch))) if batch else ((), ())
+        liabilities = self.tax_engine.compute_batch(list(batch))
+        for index, liability in zip(batch_indexes, liabilities):
+            planned[index] = liability
+        return planned
+
+    # the tax due on each asset is worked out from the batch's gains and losses in it netted together, then split
+    # between the orders in proportion to the tax each would owe on its own. returns order index: tax due
+    def _net_batch_taxes(self, liabilities: dict) -> dict:
+        by_asset = {}
+        for index, liability in liabilities.items():
+            by_asset.setdefault(liability.asset, []).append(index)
+        tax_due = {}
+        for asset, indexes in by_asset.items():
+            total = self.tax_engine.get_totals([liabilities[index] for index in indexes])[2]
+            unnetted = sum((liabilities[index].tax_due_usd for index in indexes), decimal_zero)
+            for index in indexes:
+                if total == decimal_zero:
+                    tax_due[index] = decimal_zero
+                else:
+                    tax_due[index] = self.format_a_decimal(total * liabilities[index].tax_due_usd / unnetted,
+                                                           lot_size='.000001', round_direction='ROUND_UP')
+        return tax_due
+
+    # _get_usdc_values() converts each of qtys of asset to USDC through the cheapest route, the way
+    # get_price_usdc() does, but converting all of them at once at each hop. returns a Decimal for each qty,
+    # or the error that kept it from being converted
+    def _get_usdc_values(self, asset: str, qtys: list) -> list:
+        route = self._get_route_to_usdc(asset)
+        if route is None:
+            return [tuple(['noRouteToUSDC'])] * len(qtys)
+        values = list(qtys)
+        for hop in route:
+            pending = [index for index, value in enumerate(values) if isinstance(value, Decimal)]
+            if not pending:
+                break
+            converted = self.get_pairing_converted_values(hop.pairing, [values[index] for index in pending], hop.side)
+            for position, index in enumerate(pending):
+                if not isinstance(converted, list):
+                    values[index] = converted
+                elif converted[position] is None:
+                    values[index] = tuple(['insufficientDepth'])
+                else:
+                    values[index] = converted[position][0]
+        return values
+
+    # the USD value of a FillLedger entry, taken from whichever side is a USD asset, or failing that from the price
+    # of either side at the time of the fill in kline_store, or failing that from the current USDC price of what
+    # was acquired. returns None if it can't be priced
+    def _get_fill_usd_value(self, entry: dict) -> Decimal or None:
+        if entry['acquired_asset'] in self.tax_engine.usd_assets:
+            return entry['acquired_qty']
+        if entry['spent_asset'] in self.tax_engine.usd_assets:
+            return entry['spent_qty']
+        for side in ('acquired', 'spent'):
+            unit_price = self.get_historical_price_usd(entry[side + '_asset'], entry['time'])
+            if unit_price is not None:
+                return entry[side + '_qty'] * unit_price
+        usd_value = self.get_price_usdc(symbol=entry['acquired_asset'], qty=entry['acquired_qty'], side='sell')
+        if not isinstance(usd_value, tuple) or not isinstance(usd_value[0], Decimal):
+            return None
+        return usd_value[0]
+
     # get_pairing_list() returns a tuple of possible pairings available on binance
     # oddly, USDCBTC returns as a valid pairing, when it is not, resulting in changes to several of
     # this class' functions
     def get_pairing_list(self) -> tuple:
-        symbols_string = requests.get(self.API_URL + 'v1/exchangeInfo')
-        symbols_json = symbols_string.json()
-        return_list = []
-        for item in symbols_json['symbols']:
-            return_list.append(item['symbol'])
-        return_list.remove('USDCBTC')
-        return_list.remove('USDCBNB')
-        return_list.remove('USDCUSDT')
-        return_list.remove('USDCTUSD')
-        return_list.remove('USDCPAX')
-        return tuple(return_list)
+        self.exchange_info.ensure_fresh()
+        return self.exchange_info.pairing_list
 
     # _get_asset_symbols() returns a tuple of asset symbols
     # pairing_side:'quote' produces a list of symbols that are the first part of a pairing
@@ -274,15 +3436,8 @@ class Binance(Exchange):
         input_check = self._input_check(None, None, None, None, pairing_side)
         if input_check is not True:
             return input_check
-        symbols_string = requests.get(self.API_URL + 'v1/exchangeInfo')
-        symbols_json = symbols_string.json()
-        assets_set = set()
-        if pairing_side == 'base':
-            assets_set.add('USDT')
-            assets_set.add('USDC')
-        for item in symbols_json['symbols']:
-            assets_set.add(item[pairing_side + 'Asset'])  # add each asset to a set to remove duplicates
-        return tuple(assets_set)
+        self.exchange_info.ensure_fresh()
+        return tuple(self.exchange_info.symbols[pairing_side])
 
     # get_valid_pairing() returns a tuple for a valid pairing if one exists for the given assets
     # it returns the side assuming you want to acquire the first symbol in the parameters
@@ -320,14 +3475,12 @@ class Binance(Exchange):
     # if ret_valid_pairing is False it returns two valid symbols in the order passed in,
     # regardless of if there's a valid pairing
     # if ret_valid_pairing is True it will flip the symbols around to make a valid pairing if necessary
+    # returns ('invalidPairing',) if it can't be split into two valid symbols
     def split_a_pairing(self, pairing_to_split: str, ret_valid_pairing: bool = False) -> Tuple[str, str] or str:
-        quote_asset, base_asset = self._pair_splitter(pairing_to_split)
-        input_check_qa = self._input_check(symbol=quote_asset)
-        input_check_ba = self._input_check(symbol=base_asset)
-        if input_check_qa is not True:
-            return input_check_qa
-        elif input_check_ba is not True:
-            return input_check_ba
+        split_pairing = self._pair_splitter(pairing_to_split)
+        if split_pairing is None:
+            return tuple(['invalidPairing'])
+        quote_asset, base_asset = split_pairing
         if ret_valid_pairing is False:
             return quote_asset, base_asset
 
@@ -347,42 +3500,22 @@ class Binance(Exchange):
                 return input_check_p2
 
     # does the actual splitting for _split_a_pairing()
-    def _pair_splitter(self, pairing_to_split: str) -> Tuple[str, str]:
-        # input will be checked in _split_a_pairing(), so no need for that here
-        while True:
-            for symbol in self._get_asset_symbols():
-                if symbol == pairing_to_split[0:len(symbol)]:
-                    quote = symbol
-                    base = pairing_to_split[len(symbol):]
-                    base_check = self._input_check(symbol=base)
-                    if base_check is True:
-                        return quote, base
+    # both symbols it returns are valid, and it returns None instead if the pairing can't be split
+    def _pair_splitter(self, pairing_to_split: str) -> Tuple[str, str] or None:
+        return self.exchange_info.split_pairing(pairing_to_split)
 
     # USDC is the asset this program has to use every single transaction, so if a pairing with it
     # doesn't exist this function returns a 'pairing path' to USDC so I can pay the tax man
-    def _get_pairing_path_to_usdc(self, symbol: str) -> Tuple[str] or Tuple[str, str]:
+    # returns the pairings of the cheapest route, see ConversionRouter
+    def _get_pairing_path_to_usdc(self, symbol: str) -> Tuple[str, ...] or tuple:
         symbol = symbol.upper()
-        pairings_with_asset = []
         input_check = self._input_check(None, None, None, symbol, None)
         if input_check is not True:
             return input_check
-        else:
-            for pairing in self.get_pairing_list():  # grabs all possible pairings for the asset
-                if symbol in pairing:
-                    pairings_with_asset.append(pairing)
-            pairing_path = []
-            for pairing in pairings_with_asset:  # cycles through all possible pairings
-                if 'USDC' in pairing:   # if there's a direct pairing with USDC, then great!
-                    pairing_path.append(pairing)
-                    return tuple(pairing_path)
-            for pairing in pairings_with_asset:  # if not, add the asset's BTC pairing to a list, then add BTCUSDC to it
-                if 'BTC' in pairing:
-                    pairing_path.append(pairing)
-                    pairing_path.append('BTCUSDC')
-                    return tuple(pairing_path)
-        # this only works because every single asset on Binance has a BTC pairing. if that changes later
-        # then this logic has to change
-        # TODO rethinking this to work around that sounds like a fun challenge for later
+        route = self._get_route_to_usdc(symbol)
+        if route is None:
+            return tuple(['noRouteToUSDC'])
+        return tuple(hop.pairing for hop in route)
 
     # formatting for these parameters (like pairing.upper() or side.lower()
     # in the following functions should done in the functions that send them
@@ -391,16 +3524,10 @@ class Binance(Exchange):
     # these functions check user input in the cli, and tells you if you constructed something wrong in a gui
 
     def _confirm_pairing_valid(self, pairing: str) -> bool:
-        for item in self.get_pairing_list():
-            if pairing == item:
-                return True
-        return False
+        return self.exchange_info.has_pairing(pairing)
 
     def _confirm_symbol_valid(self, symbol: str) -> bool:
-        for item in self._get_asset_symbols():
-            if symbol == item:
-                return True
-        return False
+        return self.exchange_info.has_symbol(symbol)
 
     @staticmethod
     def _confirm_valid_side(side: str) -> bool:
@@ -426,9 +3553,7 @@ class Binance(Exchange):
                      pairing_side: str = None) -> bool or tuple:
         error_list = []
         if pairing is not None:
-            if not self._confirm_pairing_valid(pairing) or pairing == 'USDCBTC' \
-                    or pairing == 'USDCBNB' or pairing == 'USDCUSDT' or pairing == 'USDCTUSD' \
-                    or pairing == 'USDCPAX':
+            if not self._confirm_pairing_valid(pairing) or pairing in self.INVALID_PAIRINGS:
                 error_list.append('invalidPairing')
         if side is not None:
             if not self._confirm_valid_side(side):
@@ -453,55 +3578,566 @@ class Binance(Exchange):
     #       symbol: 'ETH'
     #       pairing_side: 'quote' or 'base'
 
-    # I need these to determine the lot size in execute_trade()
-    def _get_pairing_lot_size(self, pairing: str, side: str) -> str:
-        # fetches this pairing's lot size
-        this_lot = self._get_lot_size(pairing)
+    # _get_pairing_lot_size() returns how precisely the amount acquired on side of a pairing gets counted, as a lot
+    # size for format_a_decimal(). a buy acquires the first asset, counted in the pairing's step size. a sell
+    # acquires the second, counted in the finest step size of the pairings that trade it as their first asset (for
+    # a pairing like IOTAETH, ETH is counted a lot more precisely than IOTA's whole units)
+    # returns None if the pairing isn't in the metadata
+    def _get_pairing_lot_size(self, pairing: str, side: str) -> str or None:
+        filter_table = self.exchange_info.filter_table
+        symbol_filters = filter_table.get(pairing)
+        if symbol_filters is None:
+            return None
+        step_size = symbol_filters.step_size
+        if side.lower() == 'sell':
+            asset_step_size = filter_table.get_asset_step_size(self.exchange_info.pairing_assets[pairing][1])
+            if asset_step_size is not None and (step_size == decimal_zero or asset_step_size < step_size):
+                step_size = asset_step_size
+        if step_size == decimal_zero or step_size >= 1:
+            return '1'
+        return str(step_size.normalize())
+
+
+class AsyncBinance(object):
+
+    # AsyncBinance is an asyncio version of Binance's quoting and trading. it wraps a Binance instance and runs
+    # its blocking requests on a thread pool (sharing the Binance instance's connection pool and weight budget),
+    # so requests that don't depend on each other can be in flight at the same time
+    # quotes fetch the books for every hop of a route at once and then convert through them locally,
+    # trades still go one hop at a time since each hop spends what the one before it acquired
+    # the books are fetched as deep as Binance would fetch them (see Binance._get_depth_limit()) and simulated with
+    # its numeric_backend. hops after the first don't know what they'll spend until the hop before is converted, so
+    # they go by what was spent on that side of the pairing last time, and refetch the deepest book if that's short
+    # either pass in a Binance instance, or the arguments to make one
+
+    def __init__(self, binance: Binance = None, max_workers: int = 8, **binance_kwargs):
+        if binance is None:
+            binance = Binance(**binance_kwargs)
+        self.binance = binance
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._last_spends = {}
+        self._simulator_lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(function, *args, **kwargs))
+
+    # get_price_usdc() returns the same thing as Binance.get_price_usdc()
+    async def get_price_usdc(self, symbol: str, qty: Decimal, side: str = 'buy') -> tuple:
+        await self._run(self.binance.exchange_info.ensure_fresh)
+        return await self._quote_usdc(symbol, qty, side, {})
+
+    # quote_many() values several assets at once, like a whole portfolio. quotes is a list of
+    # (symbol, qty, side) tuples, and the result is a list of what get_price_usdc() returns for each
+    # a pairing that shows up in several routes only has its book fetched once
+    async def quote_many(self, quotes: list) -> list:
+        await self._run(self.binance.exchange_info.ensure_fresh)
+        books = {}
+        return list(await asyncio.gather(*[self._quote_usdc(symbol, qty, side, books)
+                                           for symbol, qty, side in quotes]))
+
+    async def get_pairing_converted_value(self, pairing: str, spend_amount: Decimal, side: str = 'buy') -> tuple:
+        return await self._run(self.binance.get_pairing_converted_value, pairing, spend_amount, side)
+
+    async def get_balances(self, *args, all_symbols: bool = False, show_zero_balances: bool = False) -> tuple:
+        return await self._run(lambda: tuple(self.binance.get_balances(*args, all_symbols=all_symbols,
+                                                                       show_zero_balances=show_zero_balances)))
+
+    async def execute_trade(self, pairing: str, qty: Decimal, side: str = 'buy') -> tuple:
+        return await self._run(self.binance.execute_trade, pairing, qty, side)
+
+    # execute_tax_trade() quotes concurrently like get_price_usdc(), then executes the route one hop at a time
+    async def execute_tax_trade(self, asset_being_sold: str, tax_due_usd: Decimal = None,
+                                qty_being_sold: Decimal = None) -> tuple:
+        asset_being_sold = asset_being_sold.upper()
+        if tax_due_usd is None:
+            if qty_being_sold is None:
+                return tuple(['invalidDecimal'])
+            tax_due_usd = await self._run(self.binance.get_tax_due_for_sale, asset_being_sold, qty_being_sold)
+            if not isinstance(tax_due_usd, Decimal):
+                return tax_due_usd
+        if tax_due_usd == decimal_zero:
+            return decimal_zero, 'USDC', None
+        tax_due_as_sym = await self.get_price_usdc(asset_being_sold, tax_due_usd, 'buy')
+        if not isinstance(tax_due_as_sym, tuple) or not isinstance(tax_due_as_sym[0], Decimal):
+            return tax_due_as_sym
+        route = await self._run(self.binance._get_route_to_usdc, asset_being_sold, qty=tax_due_as_sym[0])
+        if route is None:
+            return tuple(['noRouteToUSDC'])
+        trade_result = None
+        amount = tax_due_as_sym[0]
+        for hop in route:
+            if hop.side == 'sell':
+                trade_result = await self.execute_trade(hop.pairing, amount, 'sell')
+            else:
+                qty_to_buy = await self.get_pairing_converted_value(hop.pairing, amount, 'buy')
+                if not isinstance(qty_to_buy, tuple) or not isinstance(qty_to_buy[0], Decimal):
+                    return qty_to_buy
+                trade_result = await self.execute_trade(hop.pairing, qty_to_buy[0], 'buy')
+            if not isinstance(trade_result, tuple) or not isinstance(trade_result[0], Decimal):
+                return trade_result
+            amount = trade_result[0]
+        return trade_result
+
+    async def _quote_usdc(self, symbol: str, qty: Decimal, side: str, books: dict) -> tuple:
+        symbol = symbol.upper()
+        side = side.lower()
+        route = await self._run(self._get_quote_route, symbol, qty, side)
+        if route and not isinstance(route[0], RouteHop):
+            return route
+        deepest = self.binance.DEPTH_LIMITS[-1]
+        spends = [qty] + [self._last_spends.get((hop.pairing, hop.side)) for hop in route[1:]]
+        limits = [self.binance._get_depth_limit(hop.pairing, hop.side, spend) for hop, spend in zip(route, spends)]
+        sources = await asyncio.gather(*[self._get_simulator(hop.pairing, hop.side, limit, books)
+                                         for hop, limit in zip(route, limits)])
+        converted_value = (qty, symbol if side == 'sell' else 'USDC')
+        for hop, source in zip(route, sources):
+            spend_amount = converted_value[0]
+            self._last_spends[(hop.pairing, hop.side)] = spend_amount
+            converted_value = None
+            while converted_value is None:
+                if isinstance(source, int):
+                    return source
+                converted_value = await self._run(self._convert, hop, source[0], source[1], spend_amount)
+                if converted_value is None:
+                    source = await self._get_simulator(hop.pairing, hop.side, deepest, books)
+            if not isinstance(converted_value[0], Decimal):
+                return converted_value
+        return converted_value
+
+    # the route for the quote, or the error tuple if the input is bad or there isn't one
+    def _get_quote_route(self, symbol: str, qty: Decimal, side: str) -> tuple:
+        input_check = self.binance._input_check(None, side, qty, symbol)
+        if input_check is not True:
+            return input_check
+        route = self.binance._get_route_to_usdc(symbol)
+        if route is None:
+            return tuple(['noRouteToUSDC'])
         if side == 'buy':
-            return this_lot
-        # below corrects a sell side issue with IOTA, but will apply to other cryptos with very large supply
-        # fetches an alternate size
-        alt_pairing = self._get_alt_lot_pairing(pairing)
-        alt_lot = self._get_lot_size(alt_pairing)
-        # goes with whichever's bigger if side sent is 'sell'
-        if len(alt_lot) > len(this_lot):
-            return alt_lot
-        return this_lot
-
-    def _get_lot_size(self, pairing: str):
-        symbols_string = requests.get(self.API_URL + 'v1/exchangeInfo')
-        if symbols_string.status_code >= 400:
-            return symbols_string.status_code
-        symbols_json = symbols_string.json()
-        for item in symbols_json['symbols']:
-            if item['symbol'] == pairing:
-                for filter_dict in item['filters']:
-                    if filter_dict['filterType'] == 'LOT_SIZE':
-                        return str(filter_dict['minQty']).rstrip('0')
-
-    # if there's any pairings where the sent base can be used as a quote, _pairing_with_given_base_as_quote()
-    # returns it, otherwise it returns None
-    # binance appears to default to the larger lot size for a symbol in a pair, so I have to compare two pairings
-    # to get an appropriate lot size
-    def _get_alt_lot_pairing(self, pairing: str) -> str:
-        quote, base = self.split_a_pairing(pairing)
-        if base == 'USDC':
-            return 'USDCBTC'
-        if base == 'ETH':
-            return 'ETHBTC'
-        if base == 'TUSD':
-            return 'TUSDBTC'
-        if base == 'USDS':
-            return 'USDSPAX'
-        if base == 'PAX':
-            return 'PAXBTC'
-        if base == 'TRX':
-            return 'TRXBTC'
-        if base == 'BNB':
-            return 'BNBBTC'
-        if base == 'BTC':
-            return 'BTCUSDT'
-        if base == 'XRP':
-            return 'XRPBTC'
-        if base == 'USDT':
-            return pairing
+            route = self.binance._reverse_route(route)
+        return tuple(route)
+
+    # books caches one simulator per side of a pairing and depth, shared by every quote made in the same call
+    async def _get_simulator(self, pairing: str, side: str, limit: int, books: dict):
+        key = (pairing, side, limit)
+        if key not in books:
+            books[key] = asyncio.ensure_future(self._run(self._load_simulator, pairing, side, limit))
+        return await books[key]
+
+    # returns (simulator, limit fetched) from a limit deep snapshot, (simulator, None) from the local book if it's
+    # mirrored, or the status code if the snapshot request fails
+    def _load_simulator(self, pairing: str, side: str, limit: int) -> tuple or int:
+        quantizer = None
+        if self.binance.numeric_backend == 'fixed':
+            quantizer = self.binance.exchange_info.get_quantizer(pairing)
+        local_book = self.binance._get_local_book(pairing)
+        if local_book is not None:
+            return local_book.get_fill_simulator(side, quantizer), None
+        snapshot = self.binance._get_depth_snapshot(pairing, limit)
+        if isinstance(snapshot, int):
+            return snapshot
+        book = 'asks' if side == 'buy' else 'bids'
+        if quantizer is not None:
+            return FixedPointFillSimulator(snapshot.get_levels(book), side, quantizer), limit
+        return FillSimulator(snapshot.get_levels(book), side), limit
+
+    # _convert() fills spend_amount through one hop, returning None if the snapshot wasn't deep enough for it
+    # simulators parse their levels lazily and can be shared between quotes, so only one is worked at a time
+    def _convert(self, hop: RouteHop, simulator: FillSimulator, fetched_limit: int or None,
+                 spend_amount: Decimal) -> tuple or None:
+        with self._simulator_lock:
+            if fetched_limit is not None:
+                if fetched_limit < self.binance.DEPTH_LIMITS[-1] and not simulator.covers(spend_amount):
+                    return None
+                self.binance._record_depth(hop.pairing, hop.side, simulator, fetched_limit, spend_amount)
+            fill = simulator.simulate([spend_amount])[0]
+        converted_value = self.binance._format_fill(hop.pairing, hop.side, fill)
+        if converted_value is None:
+            return tuple(['insufficientDepth'])
+        return converted_value
+
+
+class SimulatedExchange(Exchange):
+
+    # SimulatedExchange is a venue that only exists in memory, for trying out VenueRouter (or anything else written
+    # against Exchange) without sending orders anywhere. exchange_info_json is metadata shaped like binance's
+    # v1/exchangeInfo response, books maps pairings to books shaped like v1/depth's (pairings left out have no
+    # liquidity), and balances maps each asset to the quantity held
+    # market orders fill against the books and take the liquidity they use out of them, fee_rate of what's acquired
+    # is kept as commission, and the responses are shaped like binance's FULL order responses, so fills go into
+    # fill_ledger, the balances and tax_engine the same way Binance's do. an order that needs more than is held
+    # returns ('insufficientBalance',), and one deeper than the book returns ('insufficientDepth',), without trading
+    # name is the venue's name, so that several can be given to one VenueRouter
+    # invalid_pairings are left out like ExchangeInfo leaves them out, binance's by default since the metadata is
+    # shaped like binance's
+
+    VENUE = 'simulated'
+    FEE_RATE = Decimal('0.001')
+    QTY_PRECISION = '.00000001'
+
+    def __init__(self, exchange_info_json: dict, books: dict, balances: dict = None, fee_rate: Decimal = None,
+                 name: str = None, tax_engine: TaxEngine = None, fill_ledger: FillLedger = None,
+                 metrics: Metrics = None, invalid_pairings: tuple = Binance.INVALID_PAIRINGS):
+        super().__init__(metrics=metrics)
+        if name is not None:
+            self.venue = name
+        if fee_rate is not None:
+            self.fee_rate = fee_rate
+        self.exchange_info = ExchangeInfo(None, ttl=float('inf'), invalid_pairings=invalid_pairings,
+                                          metrics=self.metrics)
+        self.exchange_info.load(exchange_info_json)
+        self.router = ConversionRouter(self.exchange_info, fee_rate=self.fee_rate, spread_source=self._get_spread)
+        self.books = {}
+        for pairing in self.exchange_info.pairing_list:
+            depth = books.get(pairing, {})
+            self.books[pairing] = OrderBook(pairing)
+            self.books[pairing].load_snapshot({'bids': depth.get('bids', ()), 'asks': depth.get('asks', ()),
+                                               'lastUpdateId': depth.get('lastUpdateId', 0)})
+        # the account never needs syncing, it starts out as balances and only changes with fills
+        self.account = AccountState(None, metrics=self.metrics)
+        self.account.balances = {asset: (Decimal(qty), decimal_zero) for asset, qty in (balances or {}).items()}
+        self.account.synced_at = time.monotonic()
+        if fill_ledger is None:
+            fill_ledger = FillLedger()
+        self.fill_ledger = fill_ledger
+        if tax_engine is None:
+            tax_engine = TaxEngine()
+        self.tax_engine = tax_engine
+        self._order_id = 0
+        self._lock = threading.Lock()
+
+    def get_pairing_list(self) -> tuple:
+        return self.exchange_info.pairing_list
+
+    def split_a_pairing(self, pairing_to_split: str, ret_valid_pairing: bool = False) -> Tuple[str, str] or tuple:
+        split_pairing = self.exchange_info.split_pairing(pairing_to_split.upper())
+        if split_pairing is None:
+            return tuple(['invalidPairing'])
+        if ret_valid_pairing and not self.exchange_info.has_pairing(split_pairing[0] + split_pairing[1]):
+            return split_pairing[1], split_pairing[0]
+        return split_pairing
+
+    @_traced
+    def get_pairing_converted_value(self, pairing: str, spend_amount: Decimal, side: str = 'buy') -> tuple:
+        pairing = pairing.upper()
+        side = side.lower()
+        input_check = self._input_check(pairing, side, spend_amount)
+        if input_check is not True:
+            return input_check
+        fill = self.books[pairing].get_fill_simulator(side).simulate([spend_amount])[0]
+        if fill is None:
+            return tuple(['insufficientDepth'])
+        quote, base = self.exchange_info.pairing_assets[pairing]
+        return self.format_a_decimal(fill.acquired, self.QTY_PRECISION), quote if side == 'buy' else base
+
+    @_traced
+    def get_average_price(self, pairing: str, qty: Decimal, side: str = 'buy') -> tuple or None:
+        pairing = pairing.upper()
+        side = side.lower()
+        input_check = self._input_check(pairing, side, qty)
+        if input_check is not True:
+            return input_check
+        return self.books[pairing].get_fill_simulator(side).get_average_price(qty)
+
+    @_traced
+    def get_price_usdc(self, symbol: str, qty: Decimal, side: str = 'buy') -> tuple:
+        symbol = symbol.upper()
+        side = side.lower()
+        input_check = self._input_check(None, side, qty, symbol)
+        if input_check is not True:
+            return input_check
+        route = self._get_route_to_usdc(symbol)
+        if route is None:
+            return tuple(['noRouteToUSDC'])
+        if side == 'buy':
+            route = self._reverse_route(route)
+        converted_value = (qty, symbol if side == 'sell' else 'USDC')
+        for hop in route:
+            converted_value = self.get_pairing_converted_value(hop.pairing, converted_value[0], hop.side)
+            if not isinstance(converted_value[0], Decimal):
+                return converted_value
+        return converted_value
+
+    @_traced
+    def get_balances(self, *args, all_symbols: bool = False, show_zero_balances: bool = False):
+        if all_symbols:
+            for asset, (free, locked) in self.account.balances.items():
+                if show_zero_balances or free != decimal_zero:
+                    yield self.format_a_decimal(free, self.QTY_PRECISION), asset
+        for symbol in args:
+            balance = self.account.get(symbol.upper())
+            if balance is not None:
+                yield self.format_a_decimal(balance[0], self.QTY_PRECISION), symbol.upper()
+
+    # slicing isn't simulated, so schedule has to be None
+    @_traced
+    def execute_trade(self, pairing: str, qty: Decimal, side: str = 'buy', schedule: SliceSchedule = None,
+                      price: Decimal = None) -> tuple:
+        pairing = pairing.upper()
+        side = side.lower()
+        input_check = self._input_check(pairing, side, qty)
+        if input_check is not True:
+            return input_check
+        if schedule is not None:
+            return tuple(['unsupportedSchedule'])
+        order_check = self.exchange_info.filter_table.check_order(pairing, qty, price)
+        if order_check.errors:
+            return order_check.errors
+        qty = order_check.qty
+        quote_asset, base_asset = self.exchange_info.pairing_assets[pairing]
+        acquired_asset = quote_asset if side == 'buy' else base_asset
+        book = self.books[pairing]
+        with self._lock:
+            fills, remaining = [], qty
+            for level_price, level_qty in book.get_levels('asks' if side == 'buy' else 'bids'):
+                if remaining == decimal_zero:
+                    break
+                fills.append((level_price, min(remaining, level_qty)))
+                remaining -= fills[-1][1]
+            if remaining > decimal_zero:
+                return tuple(['insufficientDepth'])
+            notional = sum((fill_price * fill_qty for fill_price, fill_qty in fills), decimal_zero)
+            spent_asset, spent_qty = (base_asset, notional) if side == 'buy' else (quote_asset, qty)
+            balance = self.account.get(spent_asset)
+            if balance is None or balance[0] < spent_qty:
+                return tuple(['insufficientBalance'])
+            self._order_id += 1
+            result = {
+                'symbol': pairing,
+                'orderId': self._order_id,
+                'transactTime': int(time.time() * 1000),
+                'side': side.upper(),
+                'type': 'MARKET',
+                'status': 'FILLED',
+                'executedQty': str(qty),
+                'cummulativeQuoteQty': str(notional),
+                'fills': [{'price': str(fill_price), 'qty': str(fill_qty),
+                           'commission': str((fill_qty if side == 'buy' else fill_price * fill_qty) * self.fee_rate),
+                           'commissionAsset': acquired_asset} for fill_price, fill_qty in fills],
+            }
+            # what the fills took is applied to the book as a diff, the way the exchange's stream would report it
+            levels = book.asks if side == 'buy' else book.bids
+            updates = [[fill_price, levels[fill_price] - fill_qty] for fill_price, fill_qty in fills]
+            book.apply_diff({'U': book.last_update_id + 1, 'u': book.last_update_id + 1,
+                             'b': updates if side == 'sell' else [], 'a': updates if side == 'buy' else []})
+            ledger_entry = self._get_ledger_entry(result, quote_asset, base_asset)
+            self.fill_ledger.append(ledger_entry)
+            self.account.apply_fill(ledger_entry)
+        self._queue_fill(ledger_entry)
+        return self.format_a_decimal(ledger_entry['acquired_qty'], self.QTY_PRECISION), acquired_asset, result
+
+    # the cheapest of the router's routes that has both sides of every hop's book, so a conversion never goes
+    # through a pairing with nothing to fill against. None if there isn't one
+    def _get_route_to_usdc(self, symbol: str, qty: Decimal = None, candidates: int = 3) -> tuple or None:
+        for route in self.router.get_routes(symbol):
+            if all(self._get_spread(hop.pairing) is not None for hop in route):
+                return route
+        return None
+
+    # the router's spread_source, from the pairing's book. None if either side of it is empty
+    def _get_spread(self, pairing: str) -> Decimal or None:
+        book = self.books.get(pairing)
+        if book is None:
+            return None
+        bids, asks = book.get_levels('bids'), book.get_levels('asks')
+        if not bids or not asks:
+            return None
+        best_bid, best_ask = bids[0][0], asks[0][0]
+        return (best_ask - best_bid) / ((best_ask + best_bid) / 2)
+
+    # the USD value of a FillLedger entry, from whichever side is a USD asset, otherwise from what was acquired
+    # would sell for now. None if it can't be priced
+    def _get_fill_usd_value(self, entry: dict) -> Decimal or None:
+        if entry['acquired_asset'] in self.tax_engine.usd_assets:
+            return entry['acquired_qty']
+        if entry['spent_asset'] in self.tax_engine.usd_assets:
+            return entry['spent_qty']
+        usd_value = self.get_price_usdc(entry['acquired_asset'], entry['acquired_qty'], 'sell')
+        if not isinstance(usd_value[0], Decimal):
+            return None
+        return usd_value[0]
+
+    def _input_check(self, pairing: str = None, side: str = None, qty: Decimal = None,
+                     symbol: str = None) -> bool or tuple:
+        error_list = []
+        if pairing is not None and not self.exchange_info.has_pairing(pairing):
+            error_list.append('invalidPairing')
+        if side is not None and side not in ('buy', 'sell'):
+            error_list.append('invalidSide')
+        if qty is not None and not qty > decimal_zero:
+            error_list.append('invalidDecimal')
+        if symbol is not None and not self.exchange_info.has_symbol(symbol):
+            error_list.append('invalidSymbol')
+        if not error_list:
+            return True
+        return tuple(error_list)
+
+
+# venue: the name of the venue quoted
+# average_price: the volume weighted price the trade would fill at (for a tax trade, how much of the asset each USDC
+# raised costs along the venue's cheapest route)
+# net_price: average_price after the venue's fees, what each unit really costs or brings in
+# error: why the venue couldn't quote it, in which case the prices are None
+VenueQuote = namedtuple('VenueQuote', ['venue', 'average_price', 'net_price', 'error'])
+# what VenueRouter.execute_order() did. venue is where the order was placed and tax_venue where its tax was raised
+# (None if no tax was paid), trade is what the venue's execute_trade() returned, or the error that stopped it
+RoutedOrderResult = namedtuple('RoutedOrderResult', ['order', 'venue', 'tax_venue', 'tax_due_usd', 'tax_paid_usdc',
+                                                     'trade'])
+
+
+class VenueRouter(object):
+
+    # VenueRouter spreads trading across several exchanges (anything that implements Exchange). each quote asks every
+    # venue at once on a thread pool, and each trade goes wherever it nets the most after that venue's fees: the
+    # main trade to the best price, and the trade paying its tax to whichever venue raises the USDC for the least
+    # of the asset being sold. venues with less than reserve_weight of their request weight left this minute are
+    # left out while any other venue has more, so orders go around a rate limited venue instead of waiting on it
+    # tax_engine is what the tax is worked out with, the first venue's if none is given. give every venue the same
+    # TaxEngine so that lots bought on one get matched when they're sold on another
+
+    def __init__(self, venues: list, tax_engine: TaxEngine = None, max_workers: int = 8, reserve_weight: int = 50,
+                 metrics: Metrics = None):
+        self.venues = {venue.venue: venue for venue in venues}
+        if tax_engine is None:
+            tax_engine = venues[0].tax_engine
+        self.tax_engine = tax_engine
+        self.reserve_weight = reserve_weight
+        self.metrics = metrics if metrics is not None else METRICS
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    # quote_trade() returns a VenueQuote from every venue for trading qty of the pairing's first asset on side,
+    # best net_price first (lowest for a buy, highest for a sell), and the venues that can't fill it last
+    @_traced
+    def quote_trade(self, pairing: str, qty: Decimal, side: str = 'buy') -> list:
+        pairing = pairing.upper()
+        side = side.lower()
+        return self._rank(self._ask_venues(self._quote_trade, pairing, qty, side), lowest_first=side == 'buy')
+
+    # quote_tax_trade() returns a VenueQuote from every venue for raising tax_due_usd USDC by selling asset, the
+    # one selling the least of it for each USDC it nets first. a venue's tax trade sells what tax_due_usd would buy
+    # of the asset, so that's what gets quoted selling, with the venue's fee paid on every hop of its route
+    @_traced
+    def quote_tax_trade(self, asset: str, tax_due_usd: Decimal) -> list:
+        return self._rank(self._ask_venues(self._quote_tax_trade, asset.upper(), tax_due_usd), lowest_first=True)
+
+    # get_tax_due_for_sale() is the tax on selling qty of asset now, matched against tax_engine's lots, with the
+    # proceeds valued at the best USDC price among the venues. rounded up to the cent. every venue's queued fills
+    # get ingested first, since they might share tax_engine
+    @_traced
+    def get_tax_due_for_sale(self, asset: str, qty: Decimal) -> Decimal or tuple or int:
+        asset = asset.upper()
+        for venue in self.venues.values():
+            venue.ingest_fills()
+        proceeds = list(self._ask_venues(lambda venue: venue.get_price_usdc(asset, qty, 'sell')).values())
+        proceeds_usd = [value[0] for value in proceeds if isinstance(value, tuple) and isinstance(value[0], Decimal)]
+        if not proceeds_usd:
+            return proceeds[0]
+        liability = self.tax_engine.plan_disposal(asset, qty, max(proceeds_usd))
+        if not isinstance(liability, TaxLiability):
+            return liability
+        return Exchange.format_a_decimal(liability.tax_due_usd, lot_size='.01', round_direction='ROUND_UP')
+
+    # execute_order() places a market order for qty of the pairing's first asset on whichever venue quotes it best,
+    # first paying the tax due on what it disposes of (unless pay_tax is off) on whichever venue raises it best
+    # a buy disposes of the second asset, as much of it as the order's expected to spend. dollars aren't taxed
+    @_traced
+    def execute_order(self, pairing: str, qty: Decimal, side: str = 'buy', pay_tax: bool = True) -> RoutedOrderResult:
+        order = PlannedTrade(pairing.upper(), qty, side.lower())
+        quote = self.quote_trade(order.pairing, order.qty, order.side)[0]
+        if quote.error is not None:
+            return RoutedOrderResult(order, None, None, decimal_zero, decimal_zero, quote.error)
+        venue = self.venues[quote.venue]
+        tax_venue, tax_due, tax_paid = None, decimal_zero, decimal_zero
+        if pay_tax:
+            assets = venue.split_a_pairing(order.pairing)
+            if order.side == 'sell':
+                disposed_asset, disposed_qty = assets[0], order.qty
+            else:
+                disposed_asset, disposed_qty = assets[1], order.qty * quote.average_price
+            if disposed_asset not in self.tax_engine.usd_assets:
+                tax_due = self.get_tax_due_for_sale(disposed_asset, disposed_qty)
+                if not isinstance(tax_due, Decimal):
+                    return RoutedOrderResult(order, quote.venue, None, decimal_zero, decimal_zero, tax_due)
+            if tax_due > decimal_zero:
+                tax_quote = self.quote_tax_trade(disposed_asset, tax_due)[0]
+                if tax_quote.error is not None:
+                    return RoutedOrderResult(order, quote.venue, None, tax_due, decimal_zero, tax_quote.error)
+                tax_venue = tax_quote.venue
+                tax_result = self.venues[tax_venue].execute_tax_trade(disposed_asset, tax_due_usd=tax_due)
+                if not isinstance(tax_result, tuple) or not isinstance(tax_result[0], Decimal):
+                    return RoutedOrderResult(order, quote.venue, tax_venue, tax_due, decimal_zero, tax_result)
+                tax_paid = tax_result[0]
+        trade = venue.execute_trade(order.pairing, order.qty, order.side, price=quote.average_price)
+        return RoutedOrderResult(order, quote.venue, tax_venue, tax_due, tax_paid, trade)
+
+    def _quote_trade(self, venue: Exchange, pairing: str, qty: Decimal, side: str) -> VenueQuote:
+        average_price = venue.get_average_price(pairing, qty, side)
+        if average_price is None:
+            return VenueQuote(venue.venue, None, None, tuple(['insufficientDepth']))
+        if not isinstance(average_price, tuple) or not isinstance(average_price[0], Decimal):
+            return VenueQuote(venue.venue, None, None, average_price)
+        average_price = average_price[0]
+        if side == 'buy':
+            return VenueQuote(venue.venue, average_price, average_price / (1 - venue.fee_rate), None)
+        return VenueQuote(venue.venue, average_price, average_price * (1 - venue.fee_rate), None)
+
+    def _quote_tax_trade(self, venue: Exchange, asset: str, tax_due_usd: Decimal) -> VenueQuote:
+        qty_sold = venue.get_price_usdc(asset, tax_due_usd, 'buy')
+        if not isinstance(qty_sold, tuple) or not isinstance(qty_sold[0], Decimal):
+            return VenueQuote(venue.venue, None, None, qty_sold)
+        raised = venue.get_price_usdc(asset, qty_sold[0], 'sell')
+        if not isinstance(raised, tuple) or not isinstance(raised[0], Decimal):
+            return VenueQuote(venue.venue, None, None, raised)
+        if raised[0] == decimal_zero:
+            return VenueQuote(venue.venue, None, None, tuple(['insufficientDepth']))
+        average_price = qty_sold[0] / raised[0]
+        hops = len(venue._get_route_to_usdc(asset) or ())
+        return VenueQuote(venue.venue, average_price, average_price / (1 - venue.fee_rate) ** hops, None)
+
+    # _ask_venues() calls function(venue, *args) on every available venue at once, returning {venue name: what it
+    # returned}. a venue that can't be reached returns ('venueUnavailable',)
+    def _ask_venues(self, function, *args) -> dict:
+        futures = {venue.venue: self._executor.submit(function, venue, *args)
+                   for venue in self._get_available_venues()}
+        results = {}
+        for venue, future in futures.items():
+            try:
+                results[venue] = future.result()
+            except requests.RequestException:
+                results[venue] = tuple(['venueUnavailable'])
+        return results
+
+    # the venues with at least reserve_weight of request weight left this minute, or every venue if none have
+    # venues that don't go over HTTP are always available
+    def _get_available_venues(self) -> list:
+        venues = list(self.venues.values())
+        available = [venue for venue in venues
+                     if venue.transport is None or venue.transport.get_remaining_weight() >= self.reserve_weight]
+        return available or venues
+
+    # _rank() takes what _ask_venues() returned from the _quote functions
+    @staticmethod
+    def _rank(quotes: dict, lowest_first: bool) -> list:
+        quotes = [quote if isinstance(quote, VenueQuote) else VenueQuote(venue, None, None, quote)
+                  for venue, quote in quotes.items()]
+        priced = sorted((quote for quote in quotes if quote.error is None), key=lambda quote: quote.net_price,
+                        reverse=not lowest_first)
+        return priced + [quote for quote in quotes if quote.error is not None]
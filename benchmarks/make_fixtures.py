@@ -0,0 +1,202 @@
+# writes the fixtures the mock server in mock_binance.py serves: exchangeInfo.json, account.json,
+# depth/<PAIRING>.json for the pairings the benchmarks use, and klines/<PAIRING>-1d.json, a year of daily candles
+# for the ones cost basis lookups need (in the format GainsTaker.KlineFixtureSource reads)
+# by default they're generated (the same every time, from a fixed seed) in the shape binance returns them,
+# with --record-from the public ones get downloaded from a real API instead (account.json is always generated)
+#   python benchmarks/make_fixtures.py
+#   python benchmarks/make_fixtures.py --record-from https://api.binance.com/api/
+
+import argparse
+import json
+import math
+import os
+import random
+import zlib
+from decimal import Decimal
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# asset: rough USD price
+ASSET_PRICES = {
+    'BTC': 30000, 'ETH': 1500, 'BNB': 300, 'USDT': 1, 'USDC': 1, 'TUSD': 1, 'PAX': 1, 'USDS': 1,
+    'XMR': 150, 'LTC': 90, 'XRP': 0.5, 'TRX': 0.07, 'ADA': 0.3, 'DOT': 5, 'LINK': 7, 'IOTA': 0.2,
+    'EOS': 0.7, 'NEO': 9, 'ZEC': 30, 'DASH': 35, 'ETC': 18, 'XLM': 0.12, 'ARDR': 0.07, 'ATOM': 9,
+    'ALGO': 0.15, 'VET': 0.02, 'FIL': 4, 'AAVE': 70, 'UNI': 5, 'SOL': 25,
+}
+# ordered so an asset is only ever the quote asset of the ones after it (ETHBTC, BTCUSDT...)
+QUOTE_ASSETS = ('BNB', 'ETH', 'BTC', 'USDT', 'USDC')
+# assets without a USDC pairing, so conversions have to be routed through something else
+NO_USDC_PAIRING = ('XMR', 'ARDR', 'DASH', 'ZEC', 'IOTA', 'NEO')
+# binance lists these, and GainsTaker works around them
+EXTRA_PAIRINGS = (('USDC', 'BTC'), ('USDC', 'BNB'), ('USDC', 'USDT'), ('USDC', 'TUSD'), ('USDC', 'PAX'),
+                  ('TUSD', 'BTC'), ('PAX', 'BTC'), ('USDS', 'PAX'), ('USDS', 'USDT'), ('TUSD', 'USDT'),
+                  ('PAX', 'USDT'))
+DEPTH_PAIRINGS = ('ETHUSDC', 'BTCUSDC', 'XMRBTC', 'XMRETH', 'ETHBTC', 'BTCUSDT', 'USDCBTC', 'BNBUSDC', 'LTCUSDC')
+DEPTH_LEVELS = 1000
+KLINE_PAIRINGS = ('BTCUSDC', 'ETHUSDC', 'XMRBTC')
+KLINE_START = 1546300800000  # 2019-01-01
+KLINE_INTERVALS = {'1m': 60000, '5m': 300000, '15m': 900000, '30m': 1800000, '1h': 3600000, '2h': 7200000,
+                   '4h': 14400000, '6h': 21600000, '8h': 28800000, '12h': 43200000, '1d': 86400000}
+
+
+def format_number(number: Decimal) -> str:
+    return '{:.8f}'.format(number)
+
+
+def power_of_ten(exponent: int) -> Decimal:
+    return Decimal(1).scaleb(exponent)
+
+
+def pairing_price(quote: str, base: str) -> Decimal:
+    return Decimal(str(ASSET_PRICES[quote])) / Decimal(str(ASSET_PRICES[base]))
+
+
+# tick sizes keep about 5 significant digits of price, step sizes make one step worth at most 10 cents
+def pairing_filters(quote: str, base: str) -> list:
+    price = pairing_price(quote, base)
+    tick_size = power_of_ten(max(-8, min(0, math.floor(math.log10(price)) - 4)))
+    step_size = power_of_ten(max(-8, min(0, -math.ceil(math.log10(ASSET_PRICES[quote] * 10)))))
+    if quote == 'IOTA':
+        step_size = Decimal(1)
+    return [
+        {'filterType': 'PRICE_FILTER', 'minPrice': format_number(tick_size), 'maxPrice': '100000.00000000',
+         'tickSize': format_number(tick_size)},
+        {'filterType': 'PERCENT_PRICE', 'multiplierUp': '5', 'multiplierDown': '0.2', 'avgPriceMins': 5},
+        {'filterType': 'LOT_SIZE', 'minQty': format_number(step_size), 'maxQty': '90000000.00000000',
+         'stepSize': format_number(step_size)},
+        {'filterType': 'MIN_NOTIONAL', 'minNotional': format_number(Decimal('10') / Decimal(ASSET_PRICES[base])),
+         'applyToMarket': True, 'avgPriceMins': 5},
+        {'filterType': 'MARKET_LOT_SIZE', 'minQty': '0.00000000', 'maxQty': '100000.00000000',
+         'stepSize': '0.00000000'},
+        {'filterType': 'MAX_NUM_ORDERS', 'maxNumOrders': 200},
+        {'filterType': 'MAX_NUM_ALGO_ORDERS', 'maxNumAlgoOrders': 5},
+    ]
+
+
+def make_exchange_info() -> dict:
+    pairings = []
+    for quote in ASSET_PRICES:
+        for base in QUOTE_ASSETS:
+            if quote in QUOTE_ASSETS and QUOTE_ASSETS.index(quote) >= QUOTE_ASSETS.index(base):
+                continue
+            if base == 'USDC' and quote in NO_USDC_PAIRING:
+                continue
+            if base in ('ETH', 'BNB', 'USDT') and quote not in QUOTE_ASSETS and zlib.crc32(quote.encode()) % 3 == 0:
+                continue
+            if quote in ('TUSD', 'PAX', 'USDS', 'USDC') or quote + base == 'USDTUSDC':
+                continue
+            pairings.append((quote, base))
+    pairings.extend(EXTRA_PAIRINGS)
+    symbols = []
+    for quote, base in pairings:
+        symbols.append({
+            'symbol': quote + base, 'status': 'TRADING', 'baseAsset': quote, 'baseAssetPrecision': 8,
+            'quoteAsset': base, 'quotePrecision': 8, 'orderTypes': ['LIMIT', 'LIMIT_MAKER', 'MARKET'],
+            'icebergAllowed': True, 'isSpotTradingAllowed': True, 'filters': pairing_filters(quote, base)})
+    return {
+        'timezone': 'UTC', 'serverTime': 1565246363776,
+        'rateLimits': [
+            {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200},
+            {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 100},
+            {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 200000}],
+        'exchangeFilters': [], 'symbols': symbols}
+
+
+# makes a book around the pairing's price. each pairing gets its own seed so it comes out the same every time
+def make_depth(pairing: str, quote: str, base: str, levels: int = DEPTH_LEVELS) -> dict:
+    generator = random.Random(zlib.crc32(pairing.encode()))
+    filters = {filter_dict['filterType']: filter_dict for filter_dict in pairing_filters(quote, base)}
+    tick_size = Decimal(filters['PRICE_FILTER']['tickSize']).normalize()
+    step_size = Decimal(filters['LOT_SIZE']['stepSize']).normalize()
+    mid = pairing_price(quote, base).quantize(tick_size)
+    usd_per_level = 3000  # roughly 3M USD on each side of a 1000 level book
+    bids, asks = [], []
+    for side, direction in ((bids, -1), (asks, 1)):
+        price = mid + direction * tick_size
+        for _ in range(levels):
+            qty = Decimal(usd_per_level * generator.lognormvariate(0, 1) / ASSET_PRICES[quote])
+            qty = max(step_size, qty.quantize(step_size))
+            side.append([format_number(price), format_number(qty)])
+            price += direction * tick_size * generator.randint(1, 5)
+            if price <= 0:
+                break
+    return {'lastUpdateId': generator.randint(10 ** 8, 10 ** 9), 'bids': bids, 'asks': asks}
+
+
+# makes the candles opening from start_time up to end_time. prices swing around the pairing's price over a month
+# or so, with noise seeded by pairing and open time, so any range comes out the same every time it's asked for
+def make_klines(pairing: str, quote: str, base: str, interval: str, start_time: int, end_time: int) -> list:
+    interval_ms = KLINE_INTERVALS[interval]
+    tick_size = Decimal(pairing_filters(quote, base)[0]['tickSize']).normalize()
+    price = float(pairing_price(quote, base))
+    phase = zlib.crc32(pairing.encode()) % 1000
+    klines = []
+    open_time = -(-start_time // interval_ms) * interval_ms
+    while open_time <= end_time:
+        generator = random.Random(zlib.crc32(pairing.encode()) ^ open_time)
+        points = []
+        for offset in (0, interval_ms):
+            days = (open_time + offset) / 86400000
+            points.append(price * (1 + 0.25 * math.sin(days / 5 + phase)) * (1 + generator.uniform(-0.01, 0.01)))
+        open_price, close_price = points
+        high = max(points) * (1 + generator.uniform(0, 0.01))
+        low = min(points) * (1 - generator.uniform(0, 0.01))
+        volume = Decimal(100000 * generator.lognormvariate(0, 0.5) / ASSET_PRICES[quote])
+        klines.append([open_time] + [format_number(Decimal(repr(number)).quantize(tick_size))
+                                     for number in (open_price, high, low, close_price)]
+                      + [format_number(volume), open_time + interval_ms - 1, '0', 100, '0', '0', '0'])
+        open_time += interval_ms
+    return klines
+
+
+def make_account(exchange_info: dict) -> dict:
+    assets = sorted({symbol['baseAsset'] for symbol in exchange_info['symbols']} |
+                    {symbol['quoteAsset'] for symbol in exchange_info['symbols']})
+    balances = []
+    for asset in assets:
+        free = Decimal(25000) / Decimal(str(ASSET_PRICES[asset]))
+        balances.append({'asset': asset, 'free': format_number(free), 'locked': '0.00000000'})
+    return {'makerCommission': 10, 'takerCommission': 10, 'buyerCommission': 0, 'sellerCommission': 0,
+            'canTrade': True, 'canWithdraw': True, 'canDeposit': True, 'updateTime': 1565246363776,
+            'accountType': 'SPOT', 'balances': balances}
+
+
+def write_json(path: str, data: dict):
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, separators=(',', ':'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='write the benchmark fixtures')
+    parser.add_argument('--record-from', help='API url to download exchangeInfo and depth fixtures from')
+    parser.add_argument('--output', default=FIXTURES_DIR, help='fixtures directory')
+    args = parser.parse_args()
+    os.makedirs(os.path.join(args.output, 'depth'), exist_ok=True)
+    os.makedirs(os.path.join(args.output, 'klines'), exist_ok=True)
+    kline_end = KLINE_START + 365 * KLINE_INTERVALS['1d']
+    if args.record_from:
+        import requests
+        exchange_info = requests.get(args.record_from + 'v1/exchangeInfo').json()
+        depths = {pairing: requests.get(args.record_from + 'v1/depth',
+                                        params={'symbol': pairing, 'limit': DEPTH_LEVELS}).json()
+                  for pairing in DEPTH_PAIRINGS}
+        klines = {pairing: requests.get(args.record_from + 'v3/klines',
+                                        params={'symbol': pairing, 'interval': '1d', 'startTime': KLINE_START,
+                                                'limit': 365}).json()
+                  for pairing in KLINE_PAIRINGS}
+    else:
+        exchange_info = make_exchange_info()
+        assets = {symbol['symbol']: (symbol['baseAsset'], symbol['quoteAsset']) for symbol in exchange_info['symbols']}
+        depths = {pairing: make_depth(pairing, *assets[pairing]) for pairing in DEPTH_PAIRINGS}
+        klines = {pairing: make_klines(pairing, *assets[pairing], '1d', KLINE_START, kline_end - 1)
+                  for pairing in KLINE_PAIRINGS}
+    write_json(os.path.join(args.output, 'exchangeInfo.json'), exchange_info)
+    write_json(os.path.join(args.output, 'account.json'), make_account(exchange_info))
+    for pairing, depth in depths.items():
+        write_json(os.path.join(args.output, 'depth', pairing + '.json'), depth)
+    for pairing, pairing_klines in klines.items():
+        write_json(os.path.join(args.output, 'klines', pairing + '-1d.json'), pairing_klines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+# a local stand in for the parts of the binance REST API that GainsTaker uses, serving the fixtures from
+# make_fixtures.py. it counts every request and the weight binance would charge for it, sends the
+# X-MBX-USED-WEIGHT-1M header like binance does, checks signatures on signed endpoints, and fills market orders
+# against the fixture books (they don't change afterwards, but the account balances do)
+# exchangeInfo is sent with an ETag, and If-None-Match with the same one gets a 304 without a body
+# v3/ticker/bookTicker answers with the top of each fixture book, and v3/klines with candles made the same way
+# make_fixtures.py makes the klines fixtures
+#   server = MockBinance()
+#   server.start()
+#   client = GainsTaker.Binance(server.api_key, server.api_secret, api_url=server.url)
+# or on its own, to point something else at it:
+#   python benchmarks/mock_binance.py --port 8765
+
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from make_fixtures import FIXTURES_DIR, KLINE_INTERVALS, make_depth, make_klines
+
+# endpoint: request weight, v1/depth is worked out from its limit in depth_weight()
+ENDPOINT_WEIGHTS = {
+    'v1/exchangeInfo': 1,
+    'v3/account': 5,
+    'v3/order': 1,
+    'v3/ticker/bookTicker': 2,  # 1 with a symbol
+    'v3/klines': 2,
+}
+COMMISSION_RATE = Decimal('0.001')
+
+
+def depth_weight(limit: int) -> int:
+    if limit <= 100:
+        return 1
+    if limit <= 500:
+        return 5
+    if limit <= 1000:
+        return 10
+    return 50
+
+
+def format_number(number: Decimal) -> str:
+    return '{:.8f}'.format(number)
+
+
+class MockBinance(object):
+
+    # latency is how many seconds to wait before answering each request, to stand in for the network
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, host: str = '127.0.0.1', port: int = 0,
+                 api_key: str = 'benchmark-key', api_secret: str = 'benchmark-secret', latency: float = 0.0):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.latency = latency
+        with open(os.path.join(fixtures_dir, 'exchangeInfo.json')) as info_file:
+            self.exchange_info = json.load(info_file)
+        with open(os.path.join(fixtures_dir, 'account.json')) as account_file:
+            self._account_fixture = json.load(account_file)
+        self.depths = {}
+        depth_dir = os.path.join(fixtures_dir, 'depth')
+        for file_name in os.listdir(depth_dir):
+            with open(os.path.join(depth_dir, file_name)) as depth_file:
+                self.depths[file_name[:-len('.json')]] = json.load(depth_file)
+        self.symbols = {symbol['symbol']: symbol for symbol in self.exchange_info['symbols']}
+        self.exchange_info_etag = '"%s"' % hashlib.sha1(
+            json.dumps(self.exchange_info, sort_keys=True).encode('utf-8')).hexdigest()
+        self._lock = threading.Lock()
+        self._order_id = 0
+        self.reset_account()
+        self.reset_stats()
+        server = self
+
+        class Handler(MockBinanceHandler):
+            mock = server
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return 'http://%s:%d/api/' % self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'weight': 0, 'endpoints': {}}
+            self._window, self._window_weight = int(time.time() // 60), 0
+
+    def reset_account(self):
+        with self._lock:
+            self.account = copy.deepcopy(self._account_fixture)
+            self.balances = {balance['asset']: balance for balance in self.account['balances']}
+
+    # returns the book for the pairing, making one the same way make_fixtures.py does if there's no fixture
+    def get_depth(self, pairing: str) -> dict:
+        if pairing not in self.depths:
+            symbol = self.symbols[pairing]
+            self.depths[pairing] = make_depth(pairing, symbol['baseAsset'], symbol['quoteAsset'])
+        return self.depths[pairing]
+
+    # the v3/ticker/bookTicker entry for the pairing, from the top of its book. books that haven't been made yet
+    # are made one level deep for it, which gets the same prices (though not the same ask quantity) as the full one
+    def get_book_ticker(self, pairing: str) -> dict:
+        depth = self.depths.get(pairing)
+        if depth is None:
+            symbol = self.symbols[pairing]
+            depth = make_depth(pairing, symbol['baseAsset'], symbol['quoteAsset'], levels=1)
+        bid = depth['bids'][0] if depth['bids'] else ['0.00000000', '0.00000000']
+        ask = depth['asks'][0] if depth['asks'] else ['0.00000000', '0.00000000']
+        return {'symbol': pairing, 'bidPrice': bid[0], 'bidQty': bid[1], 'askPrice': ask[0], 'askQty': ask[1]}
+
+    # counts the request and returns the used weight header value
+    def record(self, endpoint: str, weight: int) -> int:
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['weight'] += weight
+            endpoint_stats = self.stats['endpoints'].setdefault(endpoint, {'requests': 0, 'weight': 0})
+            endpoint_stats['requests'] += 1
+            endpoint_stats['weight'] += weight
+            if int(time.time() // 60) != self._window:
+                self._window, self._window_weight = int(time.time() // 60), 0
+            self._window_weight += weight
+            return self._window_weight
+
+    def is_signed(self, query_string: str) -> bool:
+        payload, _, signature = query_string.rpartition('&signature=')
+        expected = hmac.new(self.api_secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    # fills a market order against the fixture book, returning (status, response)
+    def place_order(self, params: dict) -> tuple:
+        symbol = self.symbols.get(params.get('symbol'))
+        if symbol is None:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        if params.get('type') != 'MARKET' or params.get('side') not in ('BUY', 'SELL'):
+            return 400, {'code': -1116, 'msg': 'Invalid orderType.'}
+        quantity = Decimal(params.get('quantity', '0'))
+        filters = {filter_dict['filterType']: filter_dict for filter_dict in symbol['filters']}
+        lot_size = filters['LOT_SIZE']
+        if quantity < Decimal(lot_size['minQty']) or quantity > Decimal(lot_size['maxQty']) \
+                or quantity % Decimal(lot_size['stepSize']) != 0:
+            return 400, {'code': -1013, 'msg': 'Filter failure: LOT_SIZE'}
+        side = params['side']
+        book = self.get_depth(symbol['symbol'])['asks' if side == 'BUY' else 'bids']
+        fills, remaining, notional = [], quantity, Decimal(0)
+        for price, qty in book:
+            if remaining <= 0:
+                break
+            price, taken = Decimal(price), min(Decimal(qty), remaining)
+            fills.append((price, taken))
+            remaining -= taken
+            notional += price * taken
+        if remaining > 0:
+            return 400, {'code': -2010, 'msg': 'Order book too thin.'}
+        min_notional = filters.get('MIN_NOTIONAL')
+        if min_notional is not None and notional < Decimal(min_notional['minNotional']):
+            return 400, {'code': -1013, 'msg': 'Filter failure: MIN_NOTIONAL'}
+        quote, base = symbol['baseAsset'], symbol['quoteAsset']
+        spent_asset, spent = (base, notional) if side == 'BUY' else (quote, quantity)
+        acquired_asset = quote if side == 'BUY' else base
+        with self._lock:
+            if Decimal(self.balances[spent_asset]['free']) < spent:
+                return 400, {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'}
+            response_fills = []
+            acquired = Decimal(0)
+            for price, qty in fills:
+                gross = qty if side == 'BUY' else price * qty
+                commission = gross * COMMISSION_RATE
+                acquired += gross - commission
+                response_fills.append({'price': format_number(price), 'qty': format_number(qty),
+                                       'commission': format_number(commission), 'commissionAsset': acquired_asset,
+                                       'tradeId': self._order_id * 1000 + len(response_fills)})
+            self._change_balance(spent_asset, -spent)
+            self._change_balance(acquired_asset, acquired)
+            self._order_id += 1
+            transact_time = int(time.time() * 1000)
+            self.account['updateTime'] = transact_time
+            order_id = self._order_id
+        return 200, {'symbol': symbol['symbol'], 'orderId': order_id, 'orderListId': -1,
+                     'clientOrderId': 'mock%d' % order_id, 'transactTime': transact_time,
+                     'price': '0.00000000', 'origQty': format_number(quantity),
+                     'executedQty': format_number(quantity), 'cummulativeQuoteQty': format_number(notional),
+                     'status': 'FILLED', 'timeInForce': 'GTC', 'type': 'MARKET', 'side': side,
+                     'fills': response_fills}
+
+    def _change_balance(self, asset: str, change: Decimal):
+        balance = self.balances.setdefault(asset, {'asset': asset, 'free': '0', 'locked': '0.00000000'})
+        if balance not in self.account['balances']:
+            self.account['balances'].append(balance)
+        balance['free'] = format_number(Decimal(balance['free']) + change)
+
+
+class MockBinanceHandler(BaseHTTPRequestHandler):
+
+    mock = None  # set on the subclass MockBinance makes
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes, without this nagle holds the body back for the client's ack
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method: str):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length:
+            self.rfile.read(content_length)
+        split_url = urlsplit(self.path)
+        endpoint = split_url.path[len('/api/'):] if split_url.path.startswith('/api/') else split_url.path
+        params = dict(parse_qsl(split_url.query))
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+        status, body, weight = self._route(method, endpoint, split_url.query, params)
+        used_weight = self.mock.record(endpoint, weight)
+        payload = json.dumps(body, separators=(',', ':')).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('X-MBX-USED-WEIGHT-1M', str(used_weight))
+        if endpoint in ('v1/exchangeInfo', 'v3/exchangeInfo'):
+            self.send_header('ETag', self.mock.exchange_info_etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # returns (status, body, weight)
+    def _route(self, method: str, endpoint: str, query_string: str, params: dict) -> tuple:
+        mock = self.mock
+        if method == 'GET' and endpoint in ('v1/exchangeInfo', 'v3/exchangeInfo'):
+            if self.headers.get('If-None-Match') == mock.exchange_info_etag:
+                return 304, None, ENDPOINT_WEIGHTS['v1/exchangeInfo']
+            return 200, mock.exchange_info, ENDPOINT_WEIGHTS['v1/exchangeInfo']
+        if method == 'GET' and endpoint in ('v1/depth', 'v3/depth'):
+            limit = int(params.get('limit', 100))
+            if params.get('symbol') not in mock.symbols:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, depth_weight(limit)
+            depth = mock.get_depth(params['symbol'])
+            return 200, {'lastUpdateId': depth['lastUpdateId'], 'bids': depth['bids'][:limit],
+                         'asks': depth['asks'][:limit]}, depth_weight(limit)
+        if method == 'GET' and endpoint == 'v3/ticker/bookTicker':
+            if 'symbol' in params:
+                if params['symbol'] not in mock.symbols:
+                    return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, 1
+                return 200, mock.get_book_ticker(params['symbol']), 1
+            return 200, [mock.get_book_ticker(pairing) for pairing in mock.symbols], \
+                ENDPOINT_WEIGHTS['v3/ticker/bookTicker']
+        if method == 'GET' and endpoint == 'v3/klines':
+            weight = ENDPOINT_WEIGHTS['v3/klines']
+            if params.get('symbol') not in mock.symbols or params.get('interval') not in KLINE_INTERVALS:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol or interval.'}, weight
+            limit = min(int(params.get('limit', 500)), 1000)
+            interval_ms = KLINE_INTERVALS[params['interval']]
+            end_time = int(params.get('endTime', time.time() * 1000))
+            start_time = int(params.get('startTime', end_time - (limit - 1) * interval_ms))
+            end_time = min(end_time, start_time + (limit - 1) * interval_ms, int(time.time() * 1000))
+            symbol = mock.symbols[params['symbol']]
+            return 200, make_klines(params['symbol'], symbol['baseAsset'], symbol['quoteAsset'], params['interval'],
+                                    start_time, end_time), weight
+        signed_endpoints = {('GET', 'v3/account'), ('POST', 'v3/order')}
+        if (method, endpoint) in signed_endpoints:
+            weight = ENDPOINT_WEIGHTS[endpoint]
+            if self.headers.get('X-MBX-APIKEY') != mock.api_key:
+                return 401, {'code': -2015, 'msg': 'Invalid API-key, IP, or permissions for action.'}, weight
+            if not mock.is_signed(query_string):
+                return 400, {'code': -1022, 'msg': 'Signature for this request is not valid.'}, weight
+            if endpoint == 'v3/account':
+                with mock._lock:
+                    return 200, copy.deepcopy(mock.account), weight
+            status, body = mock.place_order(params)
+            return status, body, weight
+        return 404, {'code': -1, 'msg': 'Not found: %s %s' % (method, endpoint)}, 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='serve a mock binance API from the benchmark fixtures')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    args = parser.parse_args()
+    server = MockBinance(port=args.port, latency=args.latency)
+    print('serving on ' + server.url + ' (key: %s, secret: %s)' % (server.api_key, server.api_secret))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
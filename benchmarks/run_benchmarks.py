@@ -0,0 +1,135 @@
+# runs GainsTaker's Binance operations against the mock server in mock_binance.py and reports, for each one,
+# the wall time, the number of HTTP requests and the request weight they cost
+# 'cold' is the first call on a brand new client, 'warm' is the average of the calls after it
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --latency 0.02 --iterations 20
+#   python benchmarks/run_benchmarks.py --save-baseline      (writes benchmarks/baseline.json)
+#   python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+# when comparing against a baseline it exits with 1 if any operation makes more requests or uses more weight
+# than it did in the baseline, times are only reported since they depend on the machine
+
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import GainsTaker  # noqa: E402
+from mock_binance import MockBinance  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+# name: function taking a client that runs the operation once
+BENCHMARKS = {
+    'get_pairing_converted_value': lambda client: client.get_pairing_converted_value('ETHUSDC', Decimal('1000'),
+                                                                                     'buy'),
+    'get_price_usdc': lambda client: client.get_price_usdc('XMR', Decimal('100'), 'buy'),
+    'split_a_pairing': lambda client: client.split_a_pairing('XMRETH'),
+    'get_balances': lambda client: tuple(client.get_balances('ETH', 'BTC', 'USDC')),
+    'execute_tax_trade': lambda client: client.execute_tax_trade('XMR', Decimal('50')),
+    'execute_trade': lambda client: client.execute_trade('ETHUSDC', Decimal('0.5'), 'sell'),
+    'value_portfolio': lambda client: client.value_portfolio(),
+}
+
+
+def make_client(server: MockBinance) -> GainsTaker.Binance:
+    return GainsTaker.Binance(server.api_key, server.api_secret, api_url=server.url)
+
+
+def measure(server: MockBinance, operation, client, calls: int) -> dict:
+    server.reset_stats()
+    start = time.perf_counter()
+    for _ in range(calls):
+        operation(client)
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed / calls, 'requests': server.stats['requests'] / calls,
+            'weight': server.stats['weight'] / calls,
+            'endpoints': {endpoint: endpoint_stats['requests'] / calls
+                          for endpoint, endpoint_stats in server.stats['endpoints'].items()}}
+
+
+def run(server: MockBinance, iterations: int, names: list) -> dict:
+    results = {}
+    for name in names:
+        operation = BENCHMARKS[name]
+        server.reset_account()
+        client = make_client(server)
+        cold = measure(server, operation, client, 1)
+        warm = measure(server, operation, client, iterations)
+        results[name] = {'cold': cold, 'warm': warm}
+    return results
+
+
+def print_results(results: dict, baseline: dict = None):
+    header = '{:<28} {:>5} {:>11} {:>9} {:>8}'.format('operation', '', 'ms', 'requests', 'weight')
+    if baseline is not None:
+        header += '   {:>11} {:>9} {:>8}'.format('baseline ms', 'requests', 'weight')
+    print(header)
+    for name, runs in results.items():
+        for run_name in ('cold', 'warm'):
+            result = runs[run_name]
+            line = '{:<28} {:>5} {:>11.3f} {:>9.2f} {:>8.2f}'.format(
+                name if run_name == 'cold' else '', run_name, result['seconds'] * 1000, result['requests'],
+                result['weight'])
+            if baseline is not None and name in baseline:
+                base = baseline[name][run_name]
+                line += '   {:>11.3f} {:>9.2f} {:>8.2f}'.format(base['seconds'] * 1000, base['requests'],
+                                                                base['weight'])
+            print(line)
+
+
+# returns the (operation, run, measure) that got worse than the baseline
+def find_regressions(results: dict, baseline: dict) -> list:
+    regressions = []
+    for name, runs in results.items():
+        if name not in baseline:
+            continue
+        for run_name, result in runs.items():
+            for measure_name in ('requests', 'weight'):
+                if result[measure_name] > baseline[name][run_name][measure_name] + 1e-9:
+                    regressions.append((name, run_name, measure_name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark GainsTaker against a local mock binance API')
+    parser.add_argument('--iterations', type=int, default=10, help='warm calls per operation')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the mock server waits per request')
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help='operations to run')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='write the results here')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    server = MockBinance(latency=args.latency)
+    server.start()
+    try:
+        results = run(server, args.iterations, args.only or list(BENCHMARKS))
+    finally:
+        server.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = find_regressions(results, baseline)
+        for name, run_name, measure_name in regressions:
+            print('regression: %s (%s) uses more %s than the baseline' % (name, run_name, measure_name))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,13 @@
-import click
 import decimal
-import GainsTaker
+import os
+import sys
+import click
+
+# GainsTaker (and requests along with it) takes a while to import, so it's only imported once an action needs it
+# and choices or exit don't wait on it. the exchange metadata is kept in CACHE_DIR between runs, so a new run can
+# validate pairings and work out lot sizes without downloading it first. the acquisition lots that taxes are worked
+# out against and the record of every order executed are kept there too, so each run carries on from the last one
+CACHE_DIR = os.environ.get('GAINSTAKER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.gainstaker'))
 
 
 # add to these as I expand the program {action : description}
@@ -9,31 +16,260 @@ supported_choices = {'choices': 'list available choices',
                      'pairings': 'show a list of available pairings',
                      'symbols': 'display a list of symbols',
                      'balances': 'display your balances for a given exchange',
+                     'portfolio': 'display what everything in your account is worth in USDC',
                      'exit': 'exit the program'}
 
+
+# with --action it runs that one action and exits, with --batch it runs the orders in the file and exits,
+# otherwise it keeps asking for actions until 'exit', all of them going through the same Session
+# batch files have one order per line: pairing, side and quantity, separated by spaces or commas
+#   ETHUSDC sell 0.5
+#   XMRETH, buy, 10
+# blank lines and lines starting with # are skipped. '-' reads the orders from stdin
 @click.command()
-@click.option('--action', prompt="What would you like to do? enter 'choices' to see supported choices",
-              help='use choices to see available choices')
-def choose_an_action(action):  # this will be the first functions the program calls
-    action = action.lower()
-    if action in supported_choices:
+@click.option('--action', help='run one action and exit, use choices to see available choices')
+@click.option('--batch', type=click.File('r'), help="file of orders to execute, or '-' for stdin")
+@click.option('--profile', is_flag=True,
+              help='after each action, print where its time went: method timings, requests and cache hits')
+@click.option('--no-tax', is_flag=True, help="don't precede orders with a trade paying the tax due on them")
+@click.option('--api-key', envvar='BINANCE_API_KEY', help='or set BINANCE_API_KEY')
+@click.option('--api-secret', envvar='BINANCE_API_SECRET', help='or set BINANCE_API_SECRET')
+@click.option('--api-url', envvar='GAINSTAKER_API_URL', default='https://api.binance.com/api/',
+              help='or set GAINSTAKER_API_URL, to use something other than the live API')
+def choose_an_action(action, batch, profile, no_tax, api_key, api_secret, api_url):  # the first function called
+    session = Session(api_key, api_secret, api_url, pay_tax=not no_tax, profile=profile)
+    if batch is not None:
+        failures = session.run_batch(batch)
+        sys.exit(1 if failures else 0)
+    if action is not None:
+        session.run(action)
+        return
+    while True:
+        action = click.prompt("What would you like to do? enter 'choices' to see supported choices")
+        if not session.run(action):
+            break
+
+
+class Session(object):
+
+    # Session keeps one exchange client for as long as the program runs, so its metadata, connection pool,
+    # order books and balances stay warm from one action (or batch order) to the next
+    # the client isn't made until the first action that needs it
+
+    def __init__(self, api_key: str = None, api_secret: str = None,
+                 api_url: str = 'https://api.binance.com/api/', pay_tax: bool = True, profile: bool = False):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.api_url = api_url
+        self.pay_tax = pay_tax
+        self.profile = profile
+        self._exchange = None
+        if profile:
+            get_gainstaker().METRICS.enable()
+            get_gainstaker().METRICS.reset()
+
+    @property
+    def exchange(self):
+        if self._exchange is None:
+            gainstaker = get_gainstaker()
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self._exchange = gainstaker.Binance(
+                self.api_key, self.api_secret, api_url=self.api_url,
+                exchange_info_cache=os.path.join(CACHE_DIR, 'binance_exchange_info.bin'),
+                tax_engine=gainstaker.TaxEngine(gainstaker.LotStore(os.path.join(CACHE_DIR, 'tax_lots.json'))),
+                fill_ledger=gainstaker.FillLedger(os.path.join(CACHE_DIR, 'fill_ledger.jsonl')))
+        return self._exchange
+
+    # run() does one action, returning False once it's time to exit
+    def run(self, action: str) -> bool:
+        action = action.strip().lower()
+        if action not in supported_choices:
+            click.echo('unsupported choice, please choose from below:')
+            choices()
+            return True
+        if action == 'exit':
+            return False
         if action == 'choices':
             choices()
-            click.echo()
         if action == 'market':
-            click.echo('market executed')
+            self.market()
         if action == 'pairings':
-            click.echo('pairings executed')
+            click.echo(', '.join(self.exchange.get_pairing_list()))
         if action == 'symbols':
-            click.echo('symbols executed')
+            self.exchange.exchange_info.ensure_fresh()
+            click.echo(', '.join(sorted(self.exchange.exchange_info.symbols['base'])))
         if action == 'balances':
-            click.echo('balances executed')
-        if action == 'exit':
-            exit()
-    else:
-        click.echo('unsupported choice, please choose from below:')
-        choices()
-        click.echo()
+            self.balances()
+        if action == 'portfolio':
+            self.portfolio()
+        self.save_fills()
+        if self.profile:
+            print_profile(action)
+        return True
+
+    def market(self):
+        if not self._has_keys():
+            return
+        pairing = click.prompt('pairing (ex: ETHUSDC)').strip().upper()
+        side = click.prompt('side', type=click.Choice(['buy', 'sell'], case_sensitive=False)).lower()
+        qty = parse_qty(click.prompt('quantity of ' + pairing + ' to ' + side))
+        if qty is None:
+            click.echo('invalid quantity')
+            return
+        click.echo(format_order_result(self.execute_order(pairing, side, qty)))
+
+    def balances(self):
+        if not self._has_keys():
+            return
+        symbols = click.prompt("symbols separated by spaces, or 'all'").upper().split()
+        synced = self.exchange.account.ensure_synced()
+        if synced is not True:
+            click.echo('could not get balances: ' + format_error(synced))
+            return
+        if symbols == ['ALL']:
+            balances = self.exchange.get_balances(all_symbols=True)
+        else:
+            balances = self.exchange.get_balances(*symbols)
+        for qty, symbol in balances:
+            click.echo(symbol + ' : ' + str(qty))
+
+    # portfolio() prices the whole account from one ticker request, largest position first
+    def portfolio(self):
+        if not self._has_keys():
+            return
+        valuation = self.exchange.value_portfolio()
+        if isinstance(valuation, int):
+            click.echo('could not value the account: ' + format_error(valuation))
+            return
+        for value in valuation.assets:
+            worth = value.value_usdc.quantize(decimal.Decimal('.01'))
+            click.echo(value.asset + ' : ' + str(value.qty) + ' = ' + str(worth) + ' USDC')
+        for asset, qty, error in valuation.unpriced:
+            click.echo(asset + ' : ' + str(qty) + ' = unknown (' + error + ')')
+        click.echo('total : ' + str(valuation.total_usdc) + ' USDC')
+
+    # run_batch() executes every order in lines, printing one tab separated result line for each:
+    #   line number, pairing, side, quantity, then 'ok', amount acquired, asset acquired, tax paid in USDC, order id
+    #   or 'error' and what went wrong
+    # the orders go through Binance.execute_batch(), so the tax on all of them is paid with one conversion per
+    # asset sold, and each order's tax paid is its share of that. returns how many orders failed
+    def run_batch(self, lines) -> int:
+        if not self._has_keys():
+            return 1
+        failures = 0
+        orders, line_numbers = [], []
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.replace(',', ' ').split()
+            if len(fields) != 3 or fields[1].lower() not in ('buy', 'sell') or parse_qty(fields[2]) is None:
+                click.echo('\t'.join([str(line_number), line, 'error', 'expected: pairing side quantity']))
+                failures += 1
+                continue
+            orders.append((fields[0].upper(), parse_qty(fields[2]), fields[1].lower()))
+            line_numbers.append(line_number)
+        if orders:
+            results = self.exchange.execute_batch(orders, pay_tax=self.pay_tax)
+            for line_number, result in zip(line_numbers, results):
+                pairing, qty, side = result.order
+                trade = result.trade
+                if isinstance(trade, tuple) and isinstance(trade[0], decimal.Decimal):
+                    outcome = trade[0], trade[1], result.tax_paid_usdc, trade[2].get('orderId')
+                else:
+                    outcome = 'error', format_error(trade)
+                    failures += 1
+                click.echo('\t'.join([str(line_number), pairing, side, str(qty), format_order_result(outcome, '\t')]))
+        self.save_fills()
+        if self.profile:
+            print_profile('batch')
+        return failures
+
+    # execute_order() pays the tax due on what the order disposes of (unless pay_tax is off), then places it
+    # returns (acquired qty, acquired asset, tax paid in USDC, order id), or ('error', what went wrong)
+    # a buy disposes of the base asset, estimated at what selling qty would bring back, so it's only quoted
+    # when the base asset isn't dollars
+    def execute_order(self, pairing: str, side: str, qty: decimal.Decimal) -> tuple:
+        exchange = self.exchange
+        tax_paid = decimal.Decimal(0)
+        if self.pay_tax:
+            assets = exchange.split_a_pairing(pairing)
+            if len(assets) != 2:
+                return 'error', format_error(assets)
+            disposed_asset = assets[0] if side == 'sell' else assets[1]
+            if disposed_asset not in exchange.tax_engine.usd_assets:  # spending dollars isn't a taxable sale
+                disposed_qty = qty
+                if side == 'buy':
+                    converted = exchange.get_pairing_converted_value(pairing, qty, 'sell')
+                    if not isinstance(converted, tuple) or not isinstance(converted[0], decimal.Decimal):
+                        return 'error', format_error(converted)
+                    disposed_qty = converted[0]
+                tax_result = exchange.execute_tax_trade(disposed_asset, qty_being_sold=disposed_qty)
+                if not isinstance(tax_result, tuple) or not isinstance(tax_result[0], decimal.Decimal):
+                    return 'error', 'tax trade failed: ' + format_error(tax_result)
+                tax_paid = tax_result[0]
+        result = exchange.execute_trade(pairing, qty, side)
+        if not isinstance(result, tuple) or not isinstance(result[0], decimal.Decimal):
+            return 'error', format_error(result)
+        return result[0], result[1], tax_paid, result[2].get('orderId')
+
+    # orders only queue their fills, so they're turned into tax lots (and the lots saved) once the action's done,
+    # instead of in between placing them
+    def save_fills(self):
+        if self._exchange is not None:
+            self._exchange.ingest_fills()
+
+    def _has_keys(self) -> bool:
+        if self.api_key and self.api_secret:
+            return True
+        click.echo('this needs your API key: pass --api-key and --api-secret, '
+                   'or set BINANCE_API_KEY and BINANCE_API_SECRET')
+        return False
+
+
+def get_gainstaker():
+    import GainsTaker
+    return GainsTaker
+
+
+# returns the quantity as a Decimal, or None if it isn't a positive number
+def parse_qty(qty: str) -> decimal.Decimal or None:
+    try:
+        qty = decimal.Decimal(qty)
+    except decimal.InvalidOperation:
+        return None
+    if not qty.is_finite() or qty <= 0:
+        return None
+    return qty
+
+
+# GainsTaker returns the status code when a request fails, and a tuple of error names when the input's wrong
+def format_error(error) -> str:
+    if isinstance(error, int):
+        return 'request failed with status ' + str(error)
+    if isinstance(error, tuple):
+        return ', '.join(str(part) for part in error)
+    return str(error)
+
+
+def format_order_result(result: tuple, separator: str = ' ') -> str:
+    if isinstance(result[0], str):
+        return separator.join(result)
+    acquired, asset, tax_paid, order_id = result
+    if separator != ' ':
+        return separator.join(['ok', str(acquired), asset, str(tax_paid), str(order_id)])
+    return 'acquired ' + str(acquired) + ' ' + asset + ', paid ' + str(tax_paid) + ' USDC in tax (order ' + \
+        str(order_id) + ')'
+
+
+# prints what GainsTaker.METRICS recorded during the action, then clears it for the next one
+def print_profile(action):
+    metrics = get_gainstaker().METRICS
+    click.echo()
+    click.echo('profile for ' + action + ':')
+    click.echo(metrics.report())
+    click.echo()
+    metrics.reset()
 
 
 def choices():
@@ -41,7 +277,6 @@ def choices():
     for choice in supported_choices:
         click.echo(choice + ' : ' + supported_choices[choice])
     click.echo()
-    choose_an_action()
 
 
 if __name__ == '__main__':